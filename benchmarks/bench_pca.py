@@ -0,0 +1,75 @@
+"""
+bench_pca.py
+Compares sklearn's PCA with the chunked CovariancePCA engine (src/utils/pca_utils.py)
+on a large synthetic (Z, T, C, H, W) stack flattened to (N, C) samples.
+sklearn is timed with the full SVD solver and with its default solver
+('auto', which picks covariance_eigh for few features in recent releases),
+on float32 input and on the float64 copy it needs for comparable accuracy.
+
+Usage:
+    python -m benchmarks.bench_pca [--shape Z T C H W] [--components K] [--repeat R]
+"""
+
+import argparse
+import time
+import numpy as np
+from sklearn.decomposition import PCA
+from src.utils.pca_utils import CovariancePCA
+
+
+def _best_time(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--shape', type=int, nargs=5, default=[10, 5, 3, 512, 512],
+                        metavar=('Z', 'T', 'C', 'H', 'W'))
+    parser.add_argument('--components', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    Z, T, C, H, W = args.shape
+    rng = np.random.default_rng(0)
+    mixing = rng.normal(size=(C, C))
+    stack = (rng.normal(size=(Z, T, H, W, C)).astype(np.float32) @ mixing.astype(np.float32))
+    samples = stack.reshape(-1, C)
+    print(f"samples: {samples.shape[0]:,} x {C} channels "
+          f"({samples.nbytes / 1024**2:.0f} MiB float32), k={args.components}")
+
+    svd_time, _ = _best_time(
+        lambda: PCA(n_components=args.components, svd_solver='full').fit(samples),
+        args.repeat)
+    sk_time, sk = _best_time(
+        lambda: PCA(n_components=args.components).fit(samples), args.repeat)
+    # sklearn needs a float64 copy to match the covariance engine's accuracy
+    sk64_time, _ = _best_time(
+        lambda: PCA(n_components=args.components).fit(samples.astype(np.float64)),
+        args.repeat)
+    cov_time, cov = _best_time(
+        lambda: CovariancePCA(n_components=args.components).fit(samples), args.repeat)
+    sk_tr_time, sk_out = _best_time(lambda: sk.transform(samples), args.repeat)
+    cov_tr_time, cov_out = _best_time(lambda: cov.transform(samples), args.repeat)
+
+    print(f"{'':12s}{'fit (s)':>10s}{'transform (s)':>15s}")
+    print(f"{'sklearn svd':12s}{svd_time:10.3f}{'':>15s}")
+    print(f"{'sklearn f32':12s}{sk_time:10.3f}{sk_tr_time:15.3f}")
+    print(f"{'sklearn f64':12s}{sk64_time:10.3f}{'':>15s}")
+    print(f"{'Covariance':12s}{cov_time:10.3f}{cov_tr_time:15.3f}")
+    print(f"fit speedup: {svd_time / cov_time:.1f}x vs full SVD, "
+          f"{sk_time / cov_time:.1f}x vs float32, "
+          f"{sk64_time / cov_time:.1f}x vs float64")
+    print("max |explained_variance_ratio_ diff|:",
+          float(np.abs(sk.explained_variance_ratio_ - cov.explained_variance_ratio_).max()))
+    print("max |component diff|:", float(np.abs(sk.components_ - cov.components_).max()))
+    print("max |projection diff|:", float(np.abs(sk_out - cov_out).max()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+bench_segmentation.py
+Compares the original per-slice segmentation with src/core/segmentation.py
+on a synthetic (D, H, W) stack: skimage's threshold_otsu in a Python loop
+against the vectorized batch_otsu_masks, or sklearn's KMeans over every
+pixel against the histogram-domain, warm-started k-means of segment_3d,
+optionally run on a thread or process pool.
+
+Usage:
+    python -m benchmarks.bench_segmentation [--method otsu|kmeans] [--shape D H W] [--dtype DTYPE]
+        [--workers N] [--executor thread|process] [--repeat R]
+"""
+
+import argparse
+import time
+import numpy as np
+from sklearn.cluster import KMeans
+from src.core.segmentation import otsu_threshold, segment_3d
+
+
+def _best_time(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def per_slice_otsu(volume):
+    output = np.zeros(volume.shape, dtype=np.uint8)
+    for i in range(volume.shape[0]):
+        output[i] = otsu_threshold(volume[i])
+    return output
+
+
+def per_pixel_kmeans(volume, n_clusters):
+    """The original kmeans_segmentation: sklearn KMeans over all pixels of each slice."""
+    output = np.zeros(volume.shape, dtype=np.uint8)
+    inertia = 0.0
+    for i in range(volume.shape[0]):
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+        kmeans.fit(volume[i].reshape(-1, 1).astype(np.float32))
+        output[i] = kmeans.labels_.reshape(volume.shape[1:])
+        inertia += kmeans.inertia_
+    return output, inertia
+
+
+def histogram_inertia(volume, labels):
+    """Sum of squared distances of every pixel to its cluster mean."""
+    inertia = 0.0
+    for image, label in zip(volume, labels):
+        image = image.astype(np.float64).ravel()
+        label = label.ravel()
+        means = np.bincount(label, image) / np.maximum(np.bincount(label), 1)
+        inertia += ((image - means[label]) ** 2).sum()
+    return inertia
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--method', choices=['otsu', 'kmeans'], default='otsu')
+    parser.add_argument('--clusters', type=int, default=3)
+    parser.add_argument('--shape', type=int, nargs=3, default=[200, 256, 256],
+                        metavar=('D', 'H', 'W'))
+    parser.add_argument('--dtype', default='uint16')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Bimodal intensities: dim background with brighter objects
+    volume = rng.normal(300, 40, size=args.shape)
+    volume[:, ::4, ::4] += 1500
+    volume = np.clip(volume, 0, None).astype(args.dtype)
+    print(f"volume: {volume.shape} {volume.dtype} ({volume.nbytes / 1024**2:.0f} MiB)")
+
+    def segment(method, **kwargs):
+        return segment_3d(volume, method=method, workers=args.workers,
+                          executor=args.executor, **kwargs)
+
+    if args.method == 'kmeans':
+        loop_time, (_, loop_inertia) = _best_time(
+            lambda: per_pixel_kmeans(volume, args.clusters), args.repeat)
+        hist_time, labels = _best_time(
+            lambda: segment('kmeans', n_clusters=args.clusters), args.repeat)
+
+        print(f"{'per pixel':12s}{loop_time:10.3f} s")
+        print(f"{'histogram':12s}{hist_time:10.3f} s")
+        print(f"speedup: {loop_time / hist_time:.1f}x")
+        print(f"inertia ratio (histogram / per pixel): "
+              f"{histogram_inertia(volume, labels) / loop_inertia:.4f}")
+        return
+
+    loop_time, loop = _best_time(lambda: per_slice_otsu(volume), args.repeat)
+    batch_time, batch = _best_time(lambda: segment('otsu'), args.repeat)
+
+    print(f"{'per slice':12s}{loop_time:10.3f} s")
+    print(f"{'batched':12s}{batch_time:10.3f} s")
+    print(f"speedup: {loop_time / batch_time:.1f}x")
+    print("identical masks:", bool(np.array_equal(loop, batch)))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,11 +6,25 @@ Defines the create_app() function which initializes Flask and registers blueprin
 
 from flask import Flask
 from .routes import api_bp
+from src.db.database import init_db
+from src.tasks.backends import get_task_backend
 
 def create_app():
     """Create and configure the Flask app."""
     app = Flask(__name__)
 
+    # Create any missing tables (e.g. for the statistics stored at ingest).
+    # The API still starts without its database: the tables are then
+    # created on first use, and requests that need them fail until then.
+    try:
+        init_db()
+    except Exception as e:
+        app.logger.warning("Database unavailable at startup: %s", e)
+
+    # Fails at startup, not on the first job, if TASK_BACKEND is unknown
+    backend = get_task_backend()
+    app.logger.info("Running background jobs on the '%s' task backend", backend.name)
+
     # Register the blueprint for our API
     app.register_blueprint(api_bp, url_prefix='/')
 
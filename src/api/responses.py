@@ -0,0 +1,52 @@
+"""
+responses.py
+Builds HTTP responses for NumPy array results (PCA outputs, masks, projections),
+either fully encoded in memory or streamed plane by plane through a generator.
+"""
+
+from flask import Response, stream_with_context
+from src.utils.array_io import (
+    ARRAY_FORMATS, STREAMABLE_FORMATS, array_headers, encode_array,
+    iter_encoded_planes, npy_header
+)
+
+
+def array_response(array, fmt, name='data', filename=None, stream=False, plane_ndim=2,
+                   headers=None):
+    """
+    Returns a Flask response carrying `array` in a binary format.
+
+    Args:
+        array (numpy.ndarray): Result to send
+        fmt (str): 'raw', 'npy', 'npz' or 'ndjson' (JSON is left to the caller)
+        name (str): Array name inside an .npz archive
+        filename (str): Download filename (without extension), defaults to name
+        stream (bool): Send the body chunk by chunk (one plane per chunk)
+            instead of encoding it fully first. 'ndjson' is always streamed.
+        plane_ndim (int): Trailing dimensions that make up one streamed plane
+        headers (dict): Extra response headers
+    Raises:
+        ValueError: If the format cannot be streamed but stream=True.
+    """
+    headers = dict(headers or {})
+    if fmt in ('npy', 'npz'):
+        headers['Content-Disposition'] = f'attachment; filename={filename or name}.{fmt}'
+
+    if not stream and fmt != 'ndjson':
+        body, mimetype, array_info = encode_array(array, fmt, name=name)
+        headers.update(array_info)
+        return Response(body, mimetype=mimetype, headers=headers)
+
+    if fmt not in STREAMABLE_FORMATS:
+        raise ValueError(f"Format '{fmt}' cannot be streamed; use one of: "
+                         f"{', '.join(STREAMABLE_FORMATS)}")
+    headers.update(array_headers(array))
+    # Sizes of the binary formats are known up front, so clients can show progress
+    if fmt == 'raw':
+        headers['Content-Length'] = str(array.size * array.dtype.itemsize)
+    elif fmt == 'npy':
+        headers['Content-Length'] = str(len(npy_header(array)) + array.size * array.dtype.itemsize)
+
+    generator = iter_encoded_planes(array, fmt, plane_ndim=plane_ndim)
+    return Response(stream_with_context(generator), mimetype=ARRAY_FORMATS[fmt],
+                    headers=headers)
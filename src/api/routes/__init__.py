@@ -3,22 +3,131 @@ __init__.py under routes
 Sets up the Blueprint for all API routes and holds in-memory stores for simplicity.
 """
 
+import os
+import shutil
+import tempfile
 from flask import Blueprint
+from src.core.image_store import SharedImageStore
+from src.core.jobs import JobStore
+from src.core.pca_cache import PCAModelStore
+from src.db.database import session_scope
+from src.db.statistics import delete_image_statistics
+from src.utils.cache import LRUCache
 
 # Create a single Blueprint for all our routes
 api_bp = Blueprint('api', __name__)
 
-# In-memory store for uploaded images (raw bytes). 
-# In production, store images on disk or in an object store (S3, etc.).
-IMAGE_STORE = {}
+# Directory where uploaded TIFFs are spooled to disk.
+# Override with the IMAGE_SPOOL_DIR environment variable in production.
+IMAGE_SPOOL_DIR = os.environ.get(
+    'IMAGE_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'hdimage_spool')
+)
+os.makedirs(IMAGE_SPOOL_DIR, exist_ok=True)
 
-# In-memory store for image processor instances keyed by image_id.
-# Typically, you'd reconstruct an ImageProcessor from disk or DB each time instead.
-IMAGE_PROCESSOR_STORE = {}
+# Shared memory budget (bytes) for decoded images published at upload, 1 GiB by default.
+IMAGE_SHARED_MAX_BYTES = int(os.environ.get('IMAGE_SHARED_MAX_BYTES', 1024**3))
+
+# Store for uploaded images keyed by image_id.
+# Maps each image_id to the path of the spooled TIFF on disk, never the raw bytes.
+# Registrations live in the spool directory, so every process opening it
+# (e.g. Celery workers) sees the same images and their decoded pixels.
+IMAGE_STORE = SharedImageStore(IMAGE_SPOOL_DIR, shared_max_bytes=IMAGE_SHARED_MAX_BYTES)
+
+# Header-only metadata (see GET /metadata) keyed by image_id.
+IMAGE_METADATA_STORE = {}
+
+# Memory budget (bytes) for cached image processors, 2 GiB by default.
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 2 * 1024**3))
+
+# Fixed charge (bytes) per cached image processor, for its open file
+# handle and bookkeeping, 4 MiB by default: it bounds the number of
+# processors cached even when their pixels cost the process nothing.
+IMAGE_CACHE_ENTRY_BYTES = int(os.environ.get('IMAGE_CACHE_ENTRY_BYTES', 4 * 1024**2))
+
+# LRU cache of image processor instances keyed by image_id.
+# Each entry is charged the pixel memory it holds privately (none when the
+# pixels are lazy, memory-mapped or in shared memory, see
+# ImageProcessor.private_nbytes) plus IMAGE_CACHE_ENTRY_BYTES; evicted
+# processors are closed and re-opened from the spooled file on next use.
+IMAGE_PROCESSOR_STORE = LRUCache(
+    IMAGE_CACHE_MAX_BYTES,
+    sizeof=lambda processor: processor.private_nbytes + IMAGE_CACHE_ENTRY_BYTES,
+    on_evict=lambda processor: processor.close(),
+)
+
+# LRU cache of encoded slice images (see GET /slice), 256 MiB by default.
+SLICE_CACHE_MAX_BYTES = int(os.environ.get('SLICE_CACHE_MAX_BYTES', 256 * 1024**2))
+SLICE_CACHE = LRUCache(SLICE_CACHE_MAX_BYTES, sizeof=len)
+
+# LRU cache of per-channel histograms (see GET /histogram), 64 MiB by default.
+HISTOGRAM_CACHE_MAX_BYTES = int(os.environ.get('HISTOGRAM_CACHE_MAX_BYTES', 64 * 1024**2))
+HISTOGRAM_CACHE = LRUCache(HISTOGRAM_CACHE_MAX_BYTES, sizeof=lambda histogram: histogram.nbytes)
+
+# LRU cache of Z/T intensity projections (see GET /projection), 256 MiB by default.
+PROJECTION_CACHE_MAX_BYTES = int(os.environ.get('PROJECTION_CACHE_MAX_BYTES', 256 * 1024**2))
+PROJECTION_CACHE = LRUCache(PROJECTION_CACHE_MAX_BYTES, sizeof=lambda projection: projection.nbytes)
+
+# LRU cache of tile pyramid manifests (see GET /pyramid) keyed by image version,
+# through which on-demand pyramid builds are made once per image.
+PYRAMID_CACHE_ENTRIES = int(os.environ.get('PYRAMID_CACHE_ENTRIES', 1024))
+PYRAMID_CACHE = LRUCache(PYRAMID_CACHE_ENTRIES, sizeof=lambda manifest: 1)
+
+# Fitted PCA models and projections, persisted next to the spooled uploads.
+# Projections on disk are kept within PCA_PROJECTION_MAX_BYTES (4 GiB by
+# default) and fitted models in memory within PCA_MODEL_CACHE_ENTRIES,
+# least recently used first out.
+PCA_PROJECTION_MAX_BYTES = int(os.environ.get('PCA_PROJECTION_MAX_BYTES', 4 * 1024**3))
+PCA_MODEL_CACHE_ENTRIES = int(os.environ.get('PCA_MODEL_CACHE_ENTRIES', 256))
+PCA_MODEL_STORE = PCAModelStore(IMAGE_SPOOL_DIR, max_projection_bytes=PCA_PROJECTION_MAX_BYTES,
+                                max_models=PCA_MODEL_CACHE_ENTRIES)
+
+# Seconds finished jobs and their results are kept, 24 hours by default (0: forever).
+JOB_TTL_SECONDS = float(os.environ.get('JOB_TTL_SECONDS', 24 * 3600))
+
+# Background jobs (see /jobs) and their result arrays, shared with the workers.
+JOB_STORE = JobStore(os.path.join(IMAGE_SPOOL_DIR, 'jobs'), ttl=JOB_TTL_SECONDS or None)
+
+
+def get_pyramid_dir(image_id):
+    """Directory holding the tile pyramid of an uploaded image."""
+    return os.path.join(IMAGE_SPOOL_DIR, f"{image_id}.pyramid")
+
+
+def clear_derived_data(image_id):
+    """
+    Removes everything computed from an image (pyramid, PCA models and
+    projections, cached metadata, stored statistics), e.g. before a new
+    upload reuses its image_id.
+    """
+    IMAGE_METADATA_STORE.pop(image_id, None)
+    shutil.rmtree(get_pyramid_dir(image_id), ignore_errors=True)
+    PCA_MODEL_STORE.clear(image_id)
+    with session_scope() as session:
+        delete_image_statistics(session, image_id)
+
+
+def get_image_processor(image_id):
+    """
+    Returns the cached ImageProcessor for image_id, opening it (and caching
+    it) on a miss: over the decoded pixels published by IMAGE_STORE if there
+    are any, lazily from the spooled upload otherwise.
+    Concurrent requests for an image that is not cached yet wait for a
+    single open and share it (see LRUCache.get_or_load).
+    The caller must have checked that image_id is in IMAGE_STORE.
+    """
+    return IMAGE_PROCESSOR_STORE.get_or_load(image_id,
+                                             lambda: IMAGE_STORE.open_processor(image_id))
 
 # Import the individual route modules to register their endpoints on the blueprint
 from src.api.routes.upload import *
+from src.api.routes.images import *
 from src.api.routes.metadata import *
 from src.api.routes.slice import *
 from src.api.routes.analyze import *
 from src.api.routes.statistics import *
+from src.api.routes.histogram import *
+from src.api.routes.tile import *
+from src.api.routes.objects import *
+from src.api.routes.projection import *
+from src.api.routes.jobs import *
+from src.api.routes.cache_stats import *
@@ -4,8 +4,11 @@ Handles POST /analyze for running PCA or other analyses on the image data.
 """
 
 from flask import request, jsonify
-from . import api_bp, IMAGE_STORE, IMAGE_PROCESSOR_STORE
-from src.core.image_processor import ImageProcessor
+from . import api_bp, IMAGE_STORE, PCA_MODEL_STORE, get_image_processor
+from .jobs import queue_job, run_async
+from src.api.responses import array_response
+from src.core.pca_cache import run_cached_pca
+from src.utils.array_io import negotiate_array_format, STREAMABLE_FORMATS
 
 @api_bp.route('/analyze', methods=['POST'])
 def analyze_image():
@@ -14,10 +17,34 @@ def analyze_image():
     Request JSON body can include:
     {
         "image_id": "image_1",
-        "components": 3
+        "components": 3,
+        "format": "npy",
+        "stream": false,
+        "chunked": false,
+        "async": null
     }
     Runs PCA on the image data with the specified number of components.
-    Returns the PCA-reduced data as JSON (2D or 3D array).
+    With "chunked": true, PCA is fitted and applied one (z, t) block at a time,
+    bounding peak memory by the block size instead of the image size.
+    Fitted models and results are cached per image (see PCA_MODEL_STORE), so
+    repeat requests, or requests for fewer components, skip the fit.
+
+    The result is returned in binary form, chosen by "format" (body or query
+    string) or else by the Accept header:
+      - npy  (application/x-npy, default): a NumPy .npy file
+      - raw  (application/octet-stream): little-endian bytes, C order
+      - npz  (application/x-npz): compressed .npz holding 'pca_result'
+      - json (application/json): the legacy nested-list JSON, opt-in only
+      - ndjson (application/x-ndjson): a shape/dtype line, then one line per (z, t) plane
+    Binary responses describe the array in X-Array-Shape / X-Array-Dtype headers.
+    With "stream": true (or ?stream=1), npy/raw results are sent plane by plane
+    through a generator instead of being encoded in memory first; ndjson always streams.
+
+    With "async": true (or ?async=1), PCA runs as a background job on the task
+    backend instead of in this request: the response is 202 with the job's
+    status and a Location to poll (see /jobs), and the result is fetched from
+    the job as "pca_result". Images larger than JOB_AUTO_ASYNC_BYTES run as
+    jobs unless the request says "async": false (or ?async=0).
     """
     content = request.json or {}
     image_id = content.get('image_id', 'image_1')
@@ -26,17 +53,51 @@ def analyze_image():
     if image_id not in IMAGE_STORE:
         return jsonify({"error": f"Image '{image_id}' not found"}), 404
 
-    if image_id not in IMAGE_PROCESSOR_STORE:
-        image_processor = ImageProcessor(IMAGE_STORE[image_id])
-        IMAGE_PROCESSOR_STORE[image_id] = image_processor
-    else:
-        image_processor = IMAGE_PROCESSOR_STORE[image_id]
+    image_processor = get_image_processor(image_id)
+    requested = content['async'] if 'async' in content else request.args.get('async')
+    pixels = image_processor.image_data
+    try:
+        background = run_async(requested, pixels.size * pixels.dtype.itemsize)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if background:
+        return queue_job('pca', image_id, {"n_components": n_components,
+                                           "chunked": bool(content.get('chunked', False))})
+
+    try:
+        fmt = negotiate_array_format(
+            content.get('format') or request.args.get('format'), request.accept_mimetypes
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Placeholder method in ImageProcessor to run PCA
-    pca_result = image_processor.run_pca(n_components)  # returns a NumPy array
+    stream = bool(content.get('stream') or request.args.get('stream', type=int))
+    if stream and fmt not in STREAMABLE_FORMATS:
+        return jsonify({"error": f"Format '{fmt}' cannot be streamed; use one of: "
+                                 f"{', '.join(STREAMABLE_FORMATS)}"}), 400
 
-    return jsonify({
-        "image_id": image_id,
-        "n_components": n_components,
-        "pca_result": pca_result.tolist()  # Convert NumPy array to list for JSON serialization
-    }), 200
+    chunked = bool(content.get('chunked', False))
+    try:
+        pca_result, model = run_cached_pca(
+            image_processor, image_id, PCA_MODEL_STORE, n_components, chunked=chunked
+        )  # returns a NumPy array (memmap of the cached result) and the fitted model
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    variance_ratio = [float(v) for v in model.explained_variance_ratio_]
+
+    if fmt == 'json':
+        return jsonify({
+            "image_id": image_id,
+            "n_components": n_components,
+            "explained_variance_ratio": variance_ratio,
+            "pca_result": pca_result.tolist()  # Convert NumPy array to list for JSON serialization
+        }), 200
+
+    headers = {
+        'X-Image-Id': image_id,
+        'X-N-Components': str(n_components),
+        'X-Explained-Variance-Ratio': ','.join(f'{v:.6g}' for v in variance_ratio),
+    }
+    # One streamed chunk per (z, t): an (H, W, n_components) block
+    return array_response(pca_result, fmt, name='pca_result', filename=f'{image_id}_pca',
+                          stream=stream, plane_ndim=3, headers=headers)
@@ -0,0 +1,27 @@
+"""
+cache_stats.py
+Handles GET /cache-stats: the counters of the API process's in-memory caches,
+e.g. how many image opens were shared between concurrent requests.
+"""
+
+from flask import jsonify
+from . import (api_bp, IMAGE_PROCESSOR_STORE, SLICE_CACHE, HISTOGRAM_CACHE,
+               PROJECTION_CACHE, PYRAMID_CACHE)
+
+
+@api_bp.route('/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """
+    GET /cache-stats
+    Returns, for each cache, its entries, current_bytes, max_bytes, hits,
+    misses and evictions, plus loads (values loaded on a miss) and
+    coalesced_loads (misses that waited for a concurrent load of the same
+    image instead of loading it again). Counters are per API process.
+    """
+    return jsonify({
+        "image_processors": IMAGE_PROCESSOR_STORE.stats(),
+        "slices": SLICE_CACHE.stats(),
+        "histograms": HISTOGRAM_CACHE.stats(),
+        "projections": PROJECTION_CACHE.stats(),
+        "pyramids": PYRAMID_CACHE.stats(),
+    }), 200
@@ -0,0 +1,96 @@
+"""
+histogram.py
+Handles GET /histogram for per-channel histograms and percentiles
+(e.g. p1/p99 display windows, or medians for QC).
+Histograms are built in one chunked pass and cached per image in
+HISTOGRAM_CACHE, so later percentile queries only scan the bins.
+"""
+
+import numpy as np
+from flask import current_app, request, jsonify
+from . import api_bp, IMAGE_STORE, HISTOGRAM_CACHE, get_image_processor
+from .slice import image_version
+from .statistics import DATABASE_ERRORS, ensure_statistics
+from src.db.database import session_scope
+from src.db.statistics import load_plane_statistics
+from src.utils.stats_utils import merge_plane_records
+
+# Number of bins returned when the request does not ask for a number
+DEFAULT_HISTOGRAM_BINS = 256
+
+
+def get_image_histogram(image_id):
+    """
+    Returns the cached ChannelHistogram of an image, building it on a miss.
+    The value range comes from the statistics stored at ingest, so the
+    build is a single pass over the pixels; while the database is
+    unavailable the processor finds the range itself. Concurrent requests for the
+    same image wait for a single build, without holding up other images
+    (see LRUCache.get_or_load).
+    """
+    def build():
+        try:
+            ensure_statistics(image_id)
+            with session_scope() as session:
+                _, stats = merge_plane_records(load_plane_statistics(session, image_id))
+        except DATABASE_ERRORS as e:
+            current_app.logger.warning("Histogram of %s built without stored statistics: %s",
+                                       image_id, e)
+            return get_image_processor(image_id).get_histogram()
+        value_range = (stats.min.min(), stats.max.max())
+        if not np.all(np.isfinite(value_range)):
+            value_range = None
+        return get_image_processor(image_id).get_histogram(value_range)
+
+    return HISTOGRAM_CACHE.get_or_load((image_id, image_version(image_id)), build)
+
+
+@api_bp.route('/histogram', methods=['GET'])
+def get_histogram():
+    """
+    GET /histogram?image_id=<id>[&channel=<c>][&bins=<n>][&percentiles=1,50,99]
+    Returns, for each channel (or only the given one), the histogram counts
+    with at most `bins` bins and their edges, plus the requested percentiles.
+    Percentiles are exact for integer images (one bin per value internally)
+    and interpolated within 4096 fine bins for float images.
+    """
+    image_id = request.args.get('image_id', 'image_1')
+
+    if image_id not in IMAGE_STORE:
+        return jsonify({"error": f"Image '{image_id}' not found"}), 404
+
+    try:
+        channel = request.args.get('channel', type=int)
+        n_bins = request.args.get('bins', DEFAULT_HISTOGRAM_BINS, type=int)
+        q = [float(v) for v in request.args.get('percentiles', '1,50,99').split(',') if v]
+        if n_bins < 1:
+            raise ValueError("bins must be positive")
+        if any(not 0 <= v <= 100 for v in q):
+            raise ValueError("percentiles must be between 0 and 100")
+
+        histogram = get_image_histogram(image_id)
+        channels = range(histogram.n_channels)
+        if channel is not None:
+            if not 0 <= channel < histogram.n_channels:
+                raise ValueError(f"C index {channel} out of range [0, {histogram.n_channels})")
+            channels = [channel]
+
+        edges, counts = histogram.rebin(n_bins)
+        percentiles = histogram.percentiles(q)
+        return jsonify({
+            "image_id": image_id,
+            "exact": histogram.exact,
+            "edges": edges.tolist(),
+            "channels": [
+                {
+                    "channel": c,
+                    "count": int(counts[c].sum()),
+                    "counts": counts[c].tolist(),
+                    "percentiles": {f"{v:g}": float(p) for v, p in zip(q, percentiles[c])},
+                }
+                for c in channels
+            ],
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
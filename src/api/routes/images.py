@@ -0,0 +1,43 @@
+"""
+images.py
+Handles DELETE /images/<image_id>, which removes an uploaded image and
+everything kept for it: the spooled TIFF, its decoded copy and shared
+memory, its cached processor and metadata, and its derived data.
+"""
+
+import os
+from flask import jsonify, current_app
+from . import api_bp, IMAGE_STORE, IMAGE_PROCESSOR_STORE, clear_derived_data
+
+
+@api_bp.route('/images/<image_id>', methods=['DELETE'])
+def delete_image(image_id):
+    """
+    DELETE /images/<image_id>
+    Unregisters the image (freeing its shared memory segment and decoded
+    copy) and deletes the spooled upload, then its derived data (see
+    clear_derived_data). Removing the derived data is best effort:
+    'derived_cleared' reports whether it all went (e.g. not while the
+    database is unreachable; a later upload under this id clears it again).
+    """
+    path = IMAGE_STORE.pop(image_id, None)
+    if path is None:
+        return jsonify({"error": f"Image '{image_id}' not found"}), 404
+
+    image_processor = IMAGE_PROCESSOR_STORE.pop(image_id)
+    if image_processor is not None:
+        image_processor.close()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+    try:
+        clear_derived_data(image_id)
+        derived_cleared = True
+    except Exception as e:
+        current_app.logger.warning("Clearing derived data of %s failed: %s", image_id, e)
+        derived_cleared = False
+
+    return jsonify({"image_id": image_id, "deleted": True,
+                    "derived_cleared": derived_cleared}), 200
@@ -0,0 +1,210 @@
+"""
+jobs.py
+Handles the /jobs endpoints: submitting PCA, segmentation, object, statistics
+and projection work to run in the background, polling its chunk-level
+progress, cancelling it, fetching its result arrays by name, and deleting it.
+Jobs live in JOB_STORE (see src/core/jobs.py) and run on the configured task
+backend (see src/tasks/backends.py): the Celery workers, or a local pool.
+"""
+
+import os
+from flask import request, jsonify, url_for
+from . import api_bp, IMAGE_STORE, JOB_STORE
+from src.api.responses import array_response
+from src.core.jobs import (JOB_CANCELLED, JOB_FINAL_STATES, JOB_SUCCEEDED, parse_bool,
+                           validate_job_params)
+
+# Formats of GET /jobs/<job_id>/results/<name>
+JOB_RESULT_FORMATS = ('npy', 'raw', 'npz', 'json')
+
+# /analyze and /objects requests that read more than this many bytes of
+# pixels run as background jobs unless they ask for async=false (0: only
+# when they ask for async)
+JOB_AUTO_ASYNC_BYTES = int(os.environ.get('JOB_AUTO_ASYNC_BYTES', 256 * 2**20))
+
+
+def run_async(requested, nbytes):
+    """
+    Whether a request runs as a background job: as it asked with async
+    (requested: a boolean, 1/0 or "true"/"false", None if it did not say),
+    else if it reads more than JOB_AUTO_ASYNC_BYTES (nbytes).
+    Raises:
+        ValueError: If requested is not a boolean (see parse_bool)
+    """
+    if requested is not None:
+        return parse_bool(requested)
+    return 0 < JOB_AUTO_ASYNC_BYTES < nbytes
+
+
+def job_status(job):
+    """The public view of a job: its state, progress and result handles."""
+    progress = dict(job["progress"])
+    total = progress["total"]
+    progress["fraction"] = progress["done"] / total if total else None
+    if job["status"] == JOB_SUCCEEDED:
+        progress["fraction"] = 1.0
+    results = {
+        name: dict(info, url=url_for('api.get_job_result', job_id=job["job_id"], name=name))
+        for name, info in job["results"].items()
+    }
+    return {
+        "job_id": job["job_id"],
+        "kind": job["kind"],
+        "image_id": job["image_id"],
+        "params": job["params"],
+        "status": job["status"],
+        "progress": progress,
+        "cancel_requested": job["cancel_requested"],
+        "error": job["error"],
+        "results": results,
+        "created": job["created"],
+        "started": job["started"],
+        "finished": job["finished"],
+    }
+
+
+def start_job(kind, image_id, params=None):
+    """
+    Records a job and hands it to the task backend. Returns the job as it
+    is once submitted; if the backend could not take it, the job is deleted
+    and the backend's error raised. The parameters are not checked.
+    """
+    # Imported here: the tasks package imports this package's stores
+    from src.tasks.backends import get_task_backend
+    job = JOB_STORE.create(kind, image_id, params)
+    try:
+        get_task_backend().submit('run_job', job["job_id"], task_id=job["job_id"])
+    except Exception:
+        JOB_STORE.delete(job["job_id"])
+        raise
+    return JOB_STORE.get(job["job_id"])
+
+
+def queue_job(kind, image_id, params):
+    """
+    Records a job and hands it to the task backend, so the request that
+    submits it returns at once. Returns the Flask response: 202 with the
+    job's status and a Location header to poll, 400 for invalid parameters,
+    or 503 if the backend could not take the job.
+    The caller must have checked that image_id is in IMAGE_STORE.
+    """
+    try:
+        params = validate_job_params(kind, params)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        job = start_job(kind, image_id, params)
+    except Exception as e:
+        return jsonify({"error": f"Could not queue the job: {e}"}), 503
+    location = url_for('api.get_job', job_id=job["job_id"])
+    return jsonify(job_status(job)), 202, {'Location': location}
+
+
+@api_bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    POST /jobs
+    Request JSON body:
+    {
+        "kind": "pca" | "segmentation" | "objects" | "statistics" | "projection",
+        "image_id": "image_1",
+        ...parameters of the kind, e.g. "n_components": 3 for pca,
+        "axis", "z", "time", "channel", "method", "n_clusters" for segmentation,
+        "time", "channel", "method", "n_clusters", "across_time", "connectivity" for objects,
+        "projection", "axis", "z", "time", "channel" for projection
+    }
+    Queues the job and returns 202 with its status (see GET /jobs/<job_id>)
+    and a Location header to poll.
+    """
+    content = request.json or {}
+    if not isinstance(content, dict):
+        return jsonify({"error": "The request body must be a JSON object"}), 400
+    content = dict(content)
+    kind = content.pop('kind', None)
+    image_id = content.pop('image_id', 'image_1')
+
+    if image_id not in IMAGE_STORE:
+        return jsonify({"error": f"Image '{image_id}' not found"}), 404
+    return queue_job(kind, image_id, content)
+
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    GET /jobs/<job_id>
+    Returns the job's status (pending, running, succeeded, failed or
+    cancelled), its progress ({"done", "total", "fraction"} in chunks of
+    work, e.g. (z, t) blocks), any error, and once it succeeded, the shape,
+    dtype and URL of each result array.
+    """
+    job = JOB_STORE.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_status(job)), 200
+
+
+@api_bp.route('/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    """
+    DELETE /jobs/<job_id>
+    Deletes a finished (succeeded, failed or cancelled) job and its result
+    arrays; unfinished jobs must be cancelled first (409). Finished jobs are
+    also deleted on their own after JOB_TTL_SECONDS.
+    """
+    job = JOB_STORE.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] not in JOB_FINAL_STATES:
+        return jsonify({"error": f"Job is {job['status']}, cancel it first",
+                        "status": job["status"]}), 409
+    JOB_STORE.delete(job_id)
+    return jsonify({"job_id": job_id, "deleted": True}), 200
+
+
+@api_bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """
+    POST /jobs/<job_id>/cancel
+    Cancels a pending job at once, or a running job after its current
+    chunk of work. Returns the job's status; finished jobs are unchanged.
+    """
+    job = JOB_STORE.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] == JOB_CANCELLED:
+        # Drop it from the backend's queue too, if it has not started there
+        from src.tasks.backends import get_task_backend
+        try:
+            get_task_backend().cancel(job_id)
+        except Exception:
+            pass  # the worker skips a job cancelled before it started anyway
+    return jsonify(job_status(job)), 200
+
+
+@api_bp.route('/jobs/<job_id>/results/<name>', methods=['GET'])
+def get_job_result(job_id, name):
+    """
+    GET /jobs/<job_id>/results/<name>[?format=npy|raw|npz|json]
+    Returns one result array of a succeeded job, read from disk:
+    npy (default), raw or npz with X-Array-Shape / X-Array-Dtype headers,
+    or json ({"name", "shape", "dtype", "data"}) for small results.
+    """
+    fmt = request.args.get('format', 'npy').lower()
+    if fmt not in JOB_RESULT_FORMATS:
+        return jsonify({"error": f"Unsupported format '{fmt}'"}), 400
+
+    job = JOB_STORE.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] != JOB_SUCCEEDED:
+        return jsonify({"error": f"Job is {job['status']}", "status": job["status"]}), 409
+    if name not in job["results"]:
+        return jsonify({"error": f"Job has no result '{name}'"}), 404
+
+    result = JOB_STORE.load_result(job_id, name)
+    if fmt == 'json':
+        return jsonify({"name": name, "shape": list(result.shape), "dtype": result.dtype.str,
+                        "data": result.tolist()}), 200
+    return array_response(result, fmt, name=name, filename=f"{job_id}_{name}",
+                          headers={'X-Job-Id': job_id})
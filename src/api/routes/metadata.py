@@ -4,25 +4,27 @@ Handles GET /metadata for retrieving image metadata such as dimensions, bands, e
 """
 
 from flask import request, jsonify
-from . import api_bp, IMAGE_STORE, IMAGE_PROCESSOR_STORE
-from src.core.image_processor import ImageProcessor
+from . import api_bp, IMAGE_STORE, IMAGE_METADATA_STORE
+from src.core.tiff_reader import read_tiff_metadata
 
 @api_bp.route('/metadata', methods=['GET'])
 def get_metadata():
     """
     GET /metadata?image_id=<id>
     Retrieves metadata (dimensions, number of channels, etc.) for the specified image.
+    Metadata is parsed from the TIFF headers only (no pixel decode)
+    and cached per image, since it never changes after upload.
     """
     image_id = request.args.get('image_id', 'image_1')  # Default to 'image_1' if none provided
     if image_id not in IMAGE_STORE:
         return jsonify({"error": f"Image '{image_id}' not found"}), 404
 
-    # Initialize ImageProcessor if not already created
-    if image_id not in IMAGE_PROCESSOR_STORE:
-        image_processor = ImageProcessor(IMAGE_STORE[image_id])
-        IMAGE_PROCESSOR_STORE[image_id] = image_processor
-    else:
-        image_processor = IMAGE_PROCESSOR_STORE[image_id]
+    metadata = IMAGE_METADATA_STORE.get(image_id)
+    if metadata is None:
+        try:
+            metadata = read_tiff_metadata(IMAGE_STORE[image_id])
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+        IMAGE_METADATA_STORE[image_id] = metadata
 
-    metadata = image_processor.get_metadata()  # Placeholder method in ImageProcessor
     return jsonify(metadata), 200
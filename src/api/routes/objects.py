@@ -0,0 +1,70 @@
+"""
+objects.py
+Handles GET /objects: segments a channel, labels its connected objects in
+3D across Z (optionally across T too) and returns per-object measurements
+as columns (one list per quantity, one entry per object).
+"""
+
+from flask import request, jsonify
+from . import api_bp, IMAGE_STORE, get_image_processor
+from .jobs import queue_job, run_async
+from src.core.objects import format_objects
+
+# Segmentation methods accepted by /objects (see segment_3d)
+OBJECT_METHODS = ('otsu', 'kmeans')
+
+
+@api_bp.route('/objects', methods=['GET'])
+def get_objects():
+    """
+    GET /objects?image_id=<id>[&channel=<c>][&time=<t>][&method=otsu|kmeans]
+                 [&n_clusters=<k>][&across_time=1][&connectivity=<n>][&async=0|1]
+    Returns the number of objects and, for each one, its label, volume
+    (voxel count), centroid and bounding box (start then stop, exclusive)
+    along "axes", and its mean intensity in every channel.
+    With async=1 the objects are measured by a background job instead
+    (see /jobs): the response is 202 with the job's status and a Location to
+    poll, and each measurement, and "axes", is one of the job's results.
+    Volumes larger than JOB_AUTO_ASYNC_BYTES (the channel over Z, and T with
+    across_time) are measured by a job unless the request says async=0.
+    """
+    image_id = request.args.get('image_id', 'image_1')
+
+    if image_id not in IMAGE_STORE:
+        return jsonify({"error": f"Image '{image_id}' not found"}), 404
+
+    try:
+        c = request.args.get('channel', 0, type=int)
+        t = request.args.get('time', 0, type=int)
+        method = request.args.get('method', 'otsu')
+        across_time = bool(request.args.get('across_time', 0, type=int))
+        connectivity = request.args.get('connectivity', 1, type=int)
+        kwargs = {}
+        if method not in OBJECT_METHODS:
+            raise ValueError(f"Unknown segmentation method: {method}")
+        if method == 'kmeans':
+            kwargs['n_clusters'] = request.args.get('n_clusters', 2, type=int)
+
+        image_processor = get_image_processor(image_id)
+        shape = image_processor.image_data.shape  # (Z, T, C, H, W) or (T, C, H, W)
+        if image_processor.dims == 5:
+            planes = shape[0] * (shape[1] if across_time else 1)
+        else:
+            planes = shape[0] if across_time else 1
+        nbytes = planes * shape[-2] * shape[-1] * image_processor.image_data.dtype.itemsize
+        if run_async(request.args.get('async'), nbytes):
+            return queue_job('objects', image_id, dict(
+                kwargs, time=t, channel=c, method=method, across_time=across_time,
+                connectivity=connectivity))
+
+        measurements, axes = image_processor.measure_objects(
+            t=t, c=c, method=method, across_time=across_time, connectivity=connectivity,
+            **kwargs)
+        result = format_objects(measurements, axes)
+        result.update({"image_id": image_id, "channel": c, "method": method})
+        if not across_time:
+            result["time"] = t
+        return jsonify(result), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
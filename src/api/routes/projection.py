@@ -0,0 +1,81 @@
+"""
+projection.py
+Handles GET /projection for maximum-, mean- and sum-intensity projections
+along Z or T. Projections are computed one plane at a time (see
+ImageProcessor.get_projection) and cached per image in PROJECTION_CACHE;
+rendered images also go through SLICE_CACHE with ETags, like /slice.
+"""
+
+from flask import request, jsonify
+from . import api_bp, IMAGE_STORE, PROJECTION_CACHE, get_image_processor
+from .slice import SLICE_FORMATS, cached_image_response, image_version, render_slice
+from src.api.responses import array_response
+from src.core.image_processor import PROJECTIONS
+
+# Formats returning the projection values instead of a rendered image
+PROJECTION_ARRAY_FORMATS = ('npy', 'raw', 'npz')
+
+
+def get_image_projection(image_id, kind, axis, z, t, c):
+    """
+    Returns the cached projection of an image, computing it on a miss.
+    Concurrent requests for the same projection wait for a single
+    computation, without holding up other projections (see LRUCache.get_or_load).
+    """
+    index = (t, c) if axis == 'z' else (z, c)
+    cache_key = (image_id, image_version(image_id), kind, axis) + index
+    return PROJECTION_CACHE.get_or_load(
+        cache_key, lambda: get_image_processor(image_id).get_projection(kind, axis, z, t, c))
+
+
+@api_bp.route('/projection', methods=['GET'])
+def get_projection():
+    """
+    GET /projection?image_id=<id>[&kind=max|mean|sum][&axis=z|t][&z=<z>][&time=<t>]
+                    [&channel=<c>][&format=png|jpeg|npy|raw|npz][&vmin=<v>&vmax=<v>]
+    Returns the projection of the Z stack at `time` (axis=z, default) or of
+    the T stack at `z` (axis=t) of a channel.
+    png/jpeg are windowed to vmin..vmax, by default the projection's own
+    range, and carry a strong ETag like /slice. npy/raw/npz return the
+    projection values (X-Array-Shape / X-Array-Dtype headers).
+    """
+    image_id = request.args.get('image_id', 'image_1')
+    kind = request.args.get('kind', 'max').lower()
+    axis = request.args.get('axis', 'z').lower()
+    fmt = request.args.get('format', 'png').lower()
+
+    if image_id not in IMAGE_STORE:
+        return jsonify({"error": f"Image '{image_id}' not found"}), 404
+    if kind not in PROJECTIONS:
+        return jsonify({"error": f"Unknown projection '{kind}'"}), 400
+    if axis not in ('z', 't'):
+        return jsonify({"error": f"Unknown projection axis '{axis}'"}), 400
+    if fmt not in SLICE_FORMATS and fmt not in PROJECTION_ARRAY_FORMATS:
+        return jsonify({"error": f"Unsupported format '{fmt}'"}), 400
+
+    try:
+        z = request.args.get('z', 0, type=int)
+        t = request.args.get('time', 0, type=int)
+        c = request.args.get('channel', 0, type=int)
+
+        if fmt in PROJECTION_ARRAY_FORMATS:
+            projection = get_image_projection(image_id, kind, axis, z, t, c)
+            return array_response(projection, fmt, name='projection',
+                                  headers={'X-Image-Id': image_id})
+
+        vmin = request.args.get('vmin', type=float)
+        vmax = request.args.get('vmax', type=float)
+        index = (t, c) if axis == 'z' else (z, c)
+        cache_key = (image_id, image_version(image_id), 'projection', kind, axis) + index + \
+            (fmt, vmin, vmax)
+
+        def render():
+            projection = get_image_projection(image_id, kind, axis, z, t, c)
+            lo = float(projection.min()) if vmin is None else vmin
+            hi = float(projection.max()) if vmax is None else vmax
+            return render_slice(projection, fmt, lo, hi)
+
+        return cached_image_response(cache_key, SLICE_FORMATS[fmt][1], render)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
@@ -1,46 +1,114 @@
 """
 slice.py
 Handles GET /slice for extracting a specific Z, Time, and Channel slice from a 5D image.
+Encoded slices are cached in SLICE_CACHE and served with strong ETags,
+so repeat views (e.g. scrubbing back and forth) skip decode and encode entirely.
 """
 
-from flask import request, jsonify, send_file
+import hashlib
+import os
+import numpy as np
+from flask import request, jsonify, Response
 from io import BytesIO
 from PIL import Image
-from . import api_bp, IMAGE_STORE, IMAGE_PROCESSOR_STORE
-from src.core.image_processor import ImageProcessor
+from . import api_bp, IMAGE_STORE, SLICE_CACHE, get_image_processor
+
+# Supported output formats: request value -> (PIL format, mimetype)
+SLICE_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+# Clients must revalidate, which is a cheap 304 when the ETag matches
+SLICE_CACHE_CONTROL = 'private, no-cache'
+
+
+def image_version(image_id):
+    """
+    Identifies the current content of an uploaded image without reading it,
+    from the spooled file's size and modification time.
+    """
+    st = os.stat(IMAGE_STORE[image_id])
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+def render_slice(slice_data, fmt, vmin=None, vmax=None):
+    """
+    Encodes a 2D slice as an image in the given format.
+    If vmin/vmax are given, intensities are linearly windowed to 0..255;
+    otherwise the data is cast to uint8 as-is.
+    """
+    if vmin is None and vmax is None:
+        display = slice_data.astype('uint8')
+    else:
+        lo = float(slice_data.min()) if vmin is None else vmin
+        hi = float(slice_data.max()) if vmax is None else vmax
+        scale = 255.0 / (hi - lo) if hi > lo else 0.0
+        display = np.clip((slice_data - lo) * scale, 0, 255).astype('uint8')
+
+    pil_format, _ = SLICE_FORMATS[fmt]
+    img_io = BytesIO()
+    Image.fromarray(display).save(img_io, pil_format)
+    return img_io.getvalue()
+
+
+def cached_image_response(cache_key, mimetype, render):
+    """
+    Builds a response for an encoded image identified by cache_key.
+    The strong ETag is derived from the key alone, so a matching
+    If-None-Match returns 304 without touching pixel data; otherwise the
+    body comes from SLICE_CACHE, or from render() on a cache miss.
+    """
+    etag = hashlib.sha1(repr(cache_key).encode()).hexdigest()
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = SLICE_CACHE.get(cache_key)
+        if body is None:
+            body = render()
+            SLICE_CACHE.put(cache_key, body)
+        response = Response(body, mimetype=mimetype)
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = SLICE_CACHE_CONTROL
+    return response
+
 
 @api_bp.route('/slice', methods=['GET'])
 def get_slice():
     """
-    GET /slice?image_id=<id>&z=<z>&time=<t>&channel=<c>
+    GET /slice?image_id=<id>&z=<z>&time=<t>&channel=<c>[&format=png|jpeg][&vmin=<v>&vmax=<v>]
     Returns a 2D slice extracted from the 5D image.
     For 4D images, the z parameter is ignored.
+    Responses carry a strong ETag; a matching If-None-Match returns 304.
     """
     image_id = request.args.get('image_id', 'image_1')
     z = int(request.args.get('z', 0))
     t = int(request.args.get('time', 0))
     c = int(request.args.get('channel', 0))
+    fmt = request.args.get('format', 'png').lower()
 
     if image_id not in IMAGE_STORE:
         return jsonify({"error": f"Image '{image_id}' not found"}), 404
+    if fmt not in SLICE_FORMATS:
+        return jsonify({"error": f"Unsupported format '{fmt}'"}), 400
 
     try:
-        if image_id not in IMAGE_PROCESSOR_STORE:
-            image_processor = ImageProcessor(IMAGE_STORE[image_id])
-            IMAGE_PROCESSOR_STORE[image_id] = image_processor
-        else:
-            image_processor = IMAGE_PROCESSOR_STORE[image_id]
-
-        # Get slice data, z parameter will be ignored for 4D images
-        slice_data = image_processor.get_slice(z, t, c)
-
-        # Convert the slice (NumPy array) to a PNG in memory
-        pil_image = Image.fromarray(slice_data.astype('uint8'))
-        img_io = BytesIO()
-        pil_image.save(img_io, 'PNG')
-        img_io.seek(0)
-
-        return send_file(img_io, mimetype='image/png')
+        vmin = request.args.get('vmin', type=float)
+        vmax = request.args.get('vmax', type=float)
+        mimetype = SLICE_FORMATS[fmt][1]
+
+        cache_key = (image_id, image_version(image_id), z, t, c, fmt, vmin, vmax)
+
+        def render():
+            image_processor = get_image_processor(image_id)
+
+            # Get slice data, z parameter will be ignored for 4D images
+            slice_data = image_processor.get_slice(z, t, c)
+            return render_slice(slice_data, fmt, vmin, vmax)
+
+        return cached_image_response(cache_key, mimetype, render)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -1,30 +1,86 @@
 """
 statistics.py
 Handles GET /statistics to retrieve basic image statistics (mean, std, min, max) for each band/channel.
+Statistics are precomputed per (z, t, c) plane at ingest and stored in the
+database, so requests are answered by merging stored rows, without pixel access.
+While the database is down (or none is configured) they are computed from
+the pixels instead.
 """
 
-from flask import request, jsonify
-from . import api_bp, IMAGE_STORE, IMAGE_PROCESSOR_STORE
-from src.core.image_processor import ImageProcessor
+import threading
+from flask import current_app, request, jsonify
+from sqlalchemy.exc import SQLAlchemyError
+from . import api_bp, IMAGE_STORE, get_image_processor
+from src.core.ingest import ingest_statistics
+from src.db.database import DatabaseUnavailable, session_scope
+from src.db.statistics import has_image_statistics, load_plane_statistics
+from src.utils.stats_utils import format_statistics, merge_plane_records
+
+# Serializes on-demand statistics ingest so concurrent requests compute only once
+_STATISTICS_INGEST_LOCK = threading.Lock()
+
+# Failures of the database itself, as opposed to the request or the image
+DATABASE_ERRORS = (SQLAlchemyError, DatabaseUnavailable)
+
+
+def ensure_statistics(image_id):
+    """Makes sure plane statistics are stored for an image, computing them if needed."""
+    with session_scope() as session:
+        if has_image_statistics(session, image_id):
+            return
+    with _STATISTICS_INGEST_LOCK:
+        with session_scope() as session:
+            if has_image_statistics(session, image_id):
+                return
+        ingest_statistics(image_id, get_image_processor(image_id))
+
+
+def plane_statistics(image_id, z=None, t=None, c=None):
+    """
+    Returns the plane statistics records of an image, optionally restricted
+    to one z, t and/or c (see load_plane_statistics): the stored ones,
+    storing them first if needed, or if the database is unavailable, ones
+    computed from the pixels.
+    """
+    try:
+        ensure_statistics(image_id)
+        with session_scope() as session:
+            return load_plane_statistics(session, image_id, z=z, t=t, c=c)
+    except DATABASE_ERRORS as e:
+        current_app.logger.warning("Statistics of %s computed from pixels, database unavailable: %s",
+                                   image_id, e)
+    return [record for record in get_image_processor(image_id).get_plane_statistics()
+            if (z is None or record['z'] in (z, None))
+            and (t is None or record['t'] == t)
+            and (c is None or record['c'] == c)]
+
 
 @api_bp.route('/statistics', methods=['GET'])
 def get_statistics():
     """
-    GET /statistics?image_id=<id>
+    GET /statistics?image_id=<id>[&z=<z>][&time=<t>][&channel=<c>]
     Returns basic image statistics, e.g., mean, std, min, max for each band or channel.
+    Optional z/time/channel filters restrict the statistics to matching planes,
+    e.g. ?time=0 for the first timepoint. The z filter is ignored for 4D images.
     """
     image_id = request.args.get('image_id', 'image_1')
 
     if image_id not in IMAGE_STORE:
         return jsonify({"error": f"Image '{image_id}' not found"}), 404
 
-    if image_id not in IMAGE_PROCESSOR_STORE:
-        image_processor = ImageProcessor(IMAGE_STORE[image_id])
-        IMAGE_PROCESSOR_STORE[image_id] = image_processor
-    else:
-        image_processor = IMAGE_PROCESSOR_STORE[image_id]
+    try:
+        z = request.args.get('z', type=int)
+        t = request.args.get('time', type=int)
+        c = request.args.get('channel', type=int)
+
+        records = plane_statistics(image_id, z=z, t=t, c=c)
+        if not records:
+            return jsonify({"error": "No planes match the given z/time/channel"}), 400
 
-    # Placeholder method for statistics
-    stats = image_processor.get_statistics()
+        channels, stats = merge_plane_records(records)
+        result = format_statistics(stats, channels)
+        result["planes"] = len(records)
+        return jsonify(result), 200
 
-    return jsonify(stats), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
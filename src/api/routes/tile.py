@@ -0,0 +1,88 @@
+"""
+tile.py
+Handles GET /pyramid and GET /tile for pan/zoom viewers.
+Tiles are fixed-size regions of a pyramid level, so their cost does not
+depend on the full plane size. Pyramids are built at upload (ingest) and
+built on demand here for images whose ingest did not produce one.
+"""
+
+from flask import request, jsonify
+from . import api_bp, IMAGE_STORE, PYRAMID_CACHE, get_image_processor, get_pyramid_dir
+from .slice import SLICE_FORMATS, cached_image_response, image_version, render_slice
+from src.core.pyramid import build_pyramid, load_pyramid_manifest, read_tile
+
+
+def ensure_pyramid(image_id):
+    """
+    Returns the pyramid manifest of an image, building the pyramid if needed.
+    Manifests are cached per image version; concurrent requests for an
+    image without a pyramid wait for a single build of it, while other
+    images are served (see LRUCache.get_or_load).
+    """
+    pyramid_dir = get_pyramid_dir(image_id)
+
+    def load():
+        manifest = load_pyramid_manifest(pyramid_dir)
+        if manifest is None:
+            manifest = build_pyramid(get_image_processor(image_id), pyramid_dir)
+        return manifest
+
+    return PYRAMID_CACHE.get_or_load((image_id, image_version(image_id)), load)
+
+
+@api_bp.route('/pyramid', methods=['GET'])
+def get_pyramid():
+    """
+    GET /pyramid?image_id=<id>
+    Returns the tile size and the (height, width) of every pyramid level.
+    """
+    image_id = request.args.get('image_id', 'image_1')
+    if image_id not in IMAGE_STORE:
+        return jsonify({"error": f"Image '{image_id}' not found"}), 404
+
+    try:
+        return jsonify(ensure_pyramid(image_id)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@api_bp.route('/tile', methods=['GET'])
+def get_tile():
+    """
+    GET /tile?image_id=<id>&z=<z>&time=<t>&channel=<c>&level=<l>&x=<x>&y=<y>
+    Returns tile column x, row y of the (z, t, c) plane at pyramid level l
+    (0 = full resolution, each level halves the size).
+    Accepts the same format/vmin/vmax parameters and ETag handling as /slice.
+    """
+    image_id = request.args.get('image_id', 'image_1')
+    z = int(request.args.get('z', 0))
+    t = int(request.args.get('time', 0))
+    c = int(request.args.get('channel', 0))
+    level = int(request.args.get('level', 0))
+    x = int(request.args.get('x', 0))
+    y = int(request.args.get('y', 0))
+    fmt = request.args.get('format', 'png').lower()
+
+    if image_id not in IMAGE_STORE:
+        return jsonify({"error": f"Image '{image_id}' not found"}), 404
+    if fmt not in SLICE_FORMATS:
+        return jsonify({"error": f"Unsupported format '{fmt}'"}), 400
+
+    try:
+        vmin = request.args.get('vmin', type=float)
+        vmax = request.args.get('vmax', type=float)
+        mimetype = SLICE_FORMATS[fmt][1]
+
+        cache_key = ('tile', image_id, image_version(image_id),
+                     z, t, c, level, x, y, fmt, vmin, vmax)
+
+        def render():
+            ensure_pyramid(image_id)
+            tile = read_tile(get_image_processor(image_id), get_pyramid_dir(image_id),
+                             z, t, c, level, x, y)
+            return render_slice(tile, fmt, vmin, vmax)
+
+        return cached_image_response(cache_key, mimetype, render)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
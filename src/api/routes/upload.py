@@ -1,16 +1,68 @@
 """
 upload.py
-Handles file upload (POST /upload) and stores raw image bytes in IMAGE_STORE.
+Handles file upload (POST /upload) and spools the image to disk,
+keeping only its path in IMAGE_STORE. Publishing and ingesting the
+upload run as a job on the task backend (see publish_and_ingest).
 """
 
-from flask import request, jsonify
-from . import api_bp, IMAGE_STORE
+import logging
+import os
+from flask import request, jsonify, current_app, url_for
+from . import (
+    api_bp, IMAGE_STORE, IMAGE_PROCESSOR_STORE, IMAGE_SPOOL_DIR, clear_derived_data,
+    get_image_processor, get_pyramid_dir
+)
+from .jobs import job_status, start_job
+from src.core.image_processor import ImageProcessor
+from src.core.ingest import ingest_image
+from src.utils.chunk_io import stream_to_file
+
+logger = logging.getLogger(__name__)
+
+
+def publish_and_ingest(image_id, progress=None):
+    """
+    Publishes the decoded pixels of an upload to IMAGE_STORE, so other
+    processes map them instead of decoding the TIFF again, then ingests
+    it (its tile pyramid is built and its statistics are stored in the
+    database). Runs as the upload's ingest job (see src.core.jobs.run_job),
+    calling progress(done, 2) after each of the two steps.
+    A failed publish is logged, and the image is read from the upload
+    instead; a failed ingest (e.g. an unreachable database) raises.
+    """
+    # A processor opened before the publish would keep mapping what it replaces
+    IMAGE_PROCESSOR_STORE.pop(image_id)
+    try:
+        image_processor = ImageProcessor(IMAGE_STORE[image_id], lazy=True)
+        try:
+            IMAGE_STORE.publish(image_id, image_processor)
+        finally:
+            image_processor.close()
+    except Exception as e:
+        logger.warning("Publish failed for %s: %s", image_id, e)
+    if progress is not None:
+        progress(1, 2)
+
+    # Drop any derived data left over from an earlier image with the same id
+    clear_derived_data(image_id)
+    ingest_image(image_id, get_image_processor(image_id), get_pyramid_dir(image_id))
+    if progress is not None:
+        progress(2, 2)
+
 
 @api_bp.route('/upload', methods=['POST'])
 def upload_image():
     """
     POST /upload
-    Accepts a multi-dimensional TIFF file and stores it in memory.
+    Accepts a multi-dimensional TIFF file and streams it to the spool directory
+    in bounded chunks, so memory use stays flat regardless of file size.
+    
+    Publishing and ingesting the image read all of its pixels, so they run
+    as an "ingest" job on the task backend (see publish_and_ingest) instead
+    of in this request: the response is 202 with the job's status under
+    'job' and a Location to poll (see /jobs). The image can be used at
+    once; until its job has finished it is read from the upload itself.
+    If the backend cannot take the job, the response is 200 with 'job': null.
     
     Form-Data: file => multi-dimensional TIFF
     Returns a JSON response with an 'image_id'.
@@ -23,12 +75,20 @@ def upload_image():
         return jsonify({"error": "No selected file"}), 400
 
     # Generate a simple ID or use a UUID in practice
-    image_id = f"image_{len(IMAGE_STORE) + 1}"  # Generate unique ID based on store size
+    image_id = IMAGE_STORE.allocate_id()  # Next unused image_<n>, never reused, reserved across processes
 
-    # Read file bytes directly
-    file_bytes = file.read()
-    
-    # Store the raw data in our in-memory store
-    IMAGE_STORE[image_id] = file_bytes
+    # Stream the upload to disk chunk by chunk instead of reading it whole
+    file_path = os.path.join(IMAGE_SPOOL_DIR, f"{image_id}.tif")
+    stream_to_file(file.stream, file_path)
+
+    # Only the path is kept in the store
+    IMAGE_STORE[image_id] = file_path
 
-    return jsonify({"message": "File uploaded successfully", "image_id": image_id}), 200
+    response = {"message": "File uploaded successfully", "image_id": image_id, "job": None}
+    try:
+        job = start_job('ingest', image_id)
+    except Exception as e:
+        current_app.logger.warning("Could not queue the ingest of %s: %s", image_id, e)
+        return jsonify(response), 200
+    response["job"] = job_status(job)
+    return jsonify(response), 202, {'Location': url_for('api.get_job', job_id=job["job_id"])}
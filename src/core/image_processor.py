@@ -5,25 +5,54 @@ Core class for loading, storing, and performing operations on 5D image data.
 
 import numpy as np
 import io
+import os
+import tempfile
 from tifffile import TiffFile
-from sklearn.decomposition import PCA
+from src.utils.pca_utils import CovariancePCA, PCAModel, make_pca
+from src.utils.stats_utils import (
+    HISTOGRAM_FLOAT_BINS, STATS_WORKERS, ChannelHistogram, format_statistics, map_blocks,
+    reduce_blocks
+)
+from src.core.objects import ChunkedVolume, label_volume, measure_objects
+from src.core.segmentation import SEGMENT_WORKERS, segment_3d
+from src.core.tiff_reader import open_tiff_array, shape_metadata, TiffPageArray
+
+# Intensity projections supported by get_projection
+PROJECTIONS = ('max', 'mean', 'sum')
 
 class ImageProcessor:
     """
     ImageProcessor is responsible for:
-    1. Loading a 5D TIFF from bytes or file.
+    1. Loading a 5D TIFF from bytes or file (eagerly, or lazily from disk).
     2. Providing metadata (shape, dtype, etc.).
     3. Extracting slices at (Z, T, Channel).
     4. Running PCA for dimensionality reduction.
     5. Computing basic statistics (mean, std, min, max).
+    6. Segmenting Z or T stacks and measuring the objects in them.
+    7. Projecting Z or T stacks (max, mean, sum).
     """
 
-    def __init__(self, image_bytes):
+    def __init__(self, image_source, lazy=False):
         """
-        Constructor that receives the raw TIFF data (bytes).
+        Constructor that receives either the raw TIFF data (bytes),
+        the path of a TIFF file on disk, or already decoded pixels (a NumPy
+        array, e.g. a memmap or shared memory view, used as-is without copying).
         Internally, loads the image as a 5D NumPy array: (Z, T, C, H, W).
+
+        With lazy=True and a file path, no pixels are decoded up front:
+        image_data is a read-only memmap (uncompressed data) or a
+        TiffPageArray that decodes pages on demand (compressed data).
         """
-        self.image_data = self._load_tiff_from_bytes(image_bytes)  # shape = (Z, T, C, H, W)
+        self._tif = None  # Open TiffFile backing a lazy TiffPageArray
+        if isinstance(image_source, (str, os.PathLike)):
+            if lazy:
+                self.image_data = self._open_tiff_lazy(image_source)
+            else:
+                self.image_data = self._load_tiff_from_file(image_source)
+        elif isinstance(image_source, np.ndarray):
+            self.image_data = image_source
+        else:
+            self.image_data = self._load_tiff_from_bytes(image_source)  # shape = (Z, T, C, H, W)
         self.metadata = self._extract_metadata()
         # Determine if the image is 4D or 5D
         self.dims = len(self.image_data.shape)
@@ -41,48 +70,120 @@ class ImageProcessor:
         """
         with io.BytesIO(image_bytes) as buf:
             with TiffFile(buf) as tif:
-                # Many scientific 5D TIFFs store data in a single "page series"
-                series = tif.series[0]
-                data = series.asarray()  # This might return a multi-dimensional array
-                # The shape might come in various forms, e.g. (T, Z, C, H, W), or (Z, T, C, H, W)
-                # We need to confirm the shape from 'data.shape' and reorder if needed.
-
-                # Example: if the shape is (T, Z, C, H, W), reorder to (Z, T, C, H, W):
-                # This reordering depends on your data specifics. 
-                # We will assume the data is (Z, T, C, H, W) directly for simplicity.
-                
-                if data.ndim < 5:
-                    # If the file is not actually 5D, you may need to expand dims
-                    # e.g. (H, W) => (1,1,1,H,W), (Z, H, W) => (Z,1,1,H,W), etc.
-                    data = np.expand_dims(data, axis=0)  # minimal approach
-                    # Expand more as needed to ensure 5D shape
-
-                # Ensure data is float or uint (depending on your use-case)
-                # data = data.astype(np.float32)  # or keep original dtype
-
-                return data
+                return self._read_series(tif)
+
+    def _load_tiff_from_file(self, file_path):
+        """
+        Loads multi-dimensional TIFF data from a file on disk
+        (e.g. an upload spooled by POST /upload).
+
+        Returns:
+            A NumPy array shaped like (Z, T, C, H, W).
+        """
+        with TiffFile(file_path) as tif:
+            return self._read_series(tif)
+
+    def _open_tiff_lazy(self, file_path):
+        """
+        Opens a TIFF file on disk without decoding its pixel data.
+        Falls back to an eager load if the pages cannot be mapped to planes.
+        """
+        try:
+            data, self._tif = open_tiff_array(file_path)
+        except ValueError:
+            return self._load_tiff_from_file(file_path)
+        return data
+
+    @property
+    def is_lazy(self):
+        """True if image_data is not a fully decoded in-memory array."""
+        return isinstance(self.image_data, np.memmap) or self._tif is not None
+
+    @property
+    def private_nbytes(self):
+        """
+        Bytes of memory held by this processor alone: the size of image_data
+        if it owns its decoded pixels, 0 if they are decoded on demand or
+        mapped from a file or a shared memory segment (that memory is the
+        page cache's or the segment's, shared with every other process).
+        """
+        if self.is_lazy:
+            return 0
+        root = self.image_data
+        while isinstance(root, np.ndarray) and root.base is not None:
+            if isinstance(root, np.memmap):
+                return 0
+            root = root.base
+        if isinstance(root, (np.ndarray, bytes, bytearray)):
+            return int(self.image_data.nbytes)
+        return 0  # e.g. an mmap.mmap or a shared memory segment
+
+    def close(self):
+        """
+        Releases the file handle backing a lazily opened image. Waits for
+        page reads in flight; a later read reopens the file (tifffile warns).
+        """
+        tif = self._tif
+        if tif is not None:
+            with tif.filehandle.lock:
+                tif.close()
+
+    def _read_series(self, tif):
+        """
+        Reads the first page series of an open TiffFile into a NumPy array.
+        """
+        # Many scientific 5D TIFFs store data in a single "page series"
+        series = tif.series[0]
+        data = series.asarray()  # This might return a multi-dimensional array
+        # The shape might come in various forms, e.g. (T, Z, C, H, W), or (Z, T, C, H, W)
+        # We need to confirm the shape from 'data.shape' and reorder if needed.
+
+        # Example: if the shape is (T, Z, C, H, W), reorder to (Z, T, C, H, W):
+        # This reordering depends on your data specifics. 
+        # We will assume the data is (Z, T, C, H, W) directly for simplicity.
+        
+        if data.ndim < 5:
+            # If the file is not actually 5D, you may need to expand dims
+            # e.g. (H, W) => (1,1,1,H,W), (Z, H, W) => (Z,1,1,H,W), etc.
+            data = np.expand_dims(data, axis=0)  # minimal approach
+            # Expand more as needed to ensure 5D shape
+
+        # Ensure data is float or uint (depending on your use-case)
+        # data = data.astype(np.float32)  # or keep original dtype
+
+        return data
 
     def _extract_metadata(self):
         """
         Extracts basic metadata from self.image_data, e.g. shape, dtype.
         Returns a dict.
         """
-        shape = self.image_data.shape  # (Z, T, C, H, W)
-        metadata = {
-            "dtype": str(self.image_data.dtype),
-            "shape": shape,
-            "Z": shape[0],
-            "T": shape[1] if len(shape) > 1 else 1,
-            "Channels": shape[2] if len(shape) > 2 else 1,
-            "Height": shape[3] if len(shape) > 3 else 1,
-            "Width": shape[4] if len(shape) > 4 else 1
-        }
+        # (Z, T, C, H, W)
+        metadata = shape_metadata(self.image_data.shape, self.image_data.dtype)
         return metadata
 
     def get_metadata(self):
         """Returns the metadata dictionary created on init."""
         return self.metadata
 
+    def plane_index(self, z, t, c):
+        """
+        Converts (z, t, c) into the index of a 2D plane in image_data:
+        (z, t, c) for 5D images, (t, c) for 4D images (z is ignored).
+        Raises:
+            ValueError: If any index is out of range.
+        """
+        if self.dims == 5:
+            index = (z, t, c)
+        else:  # 4D image
+            index = (t, c)
+
+        bounds = self.image_data.shape[:len(index)]
+        for name, value, size in zip("ZTC"[-len(index):], index, bounds):
+            if not 0 <= value < size:
+                raise ValueError(f"{name} index {value} out of range [0, {size})")
+        return index
+
     def get_slice(self, z, t, c):
         """
         Extract a 2D slice from the image data.
@@ -92,82 +193,417 @@ class ImageProcessor:
             c (int): Channel index
         Returns:
             2D numpy array (H,W)
+        Raises:
+            ValueError: If any index is out of range.
         """
-        if self.dims == 5:
-            return self.image_data[z, t, c, :, :]
-        else:  # 4D image
-            return self.image_data[t, c, :, :]
+        index = self.plane_index(z, t, c)
+        if isinstance(self.image_data, TiffPageArray):
+            # Decode only the TIFF page that holds this plane
+            return self.image_data.read_plane(index)
+        return self.image_data[index]
+
+    def iter_planes(self):
+        """
+        Yields (index, plane) for every 2D plane of the image, where index is
+        (z, t, c) for 5D images or (t, c) for 4D images.
+        Lazy images are decoded one page at a time.
+        """
+        for index in np.ndindex(*self.image_data.shape[:-2]):
+            if isinstance(self.image_data, TiffPageArray):
+                yield index, self.image_data.read_plane(index)
+            else:
+                yield index, self.image_data[index]
+
+    @property
+    def n_blocks(self):
+        """Number of (C, H, W) blocks, i.e. (z, t) pairs (t for 4D images)."""
+        return int(np.prod(self.image_data.shape[:-3]))
 
-    def run_pca(self, n_components=3):
+    def iter_blocks(self, start=0, stop=None):
+        """
+        Yields (index, block) for every (z, t) of a 5D image, or every t of a
+        4D image, where block is the (C, H, W) stack of channels at that index.
+        start/stop restrict this to the blocks numbered start..stop-1 in that
+        (row-major) order, e.g. one chunk of a fanned-out computation.
+        Lazy images only decode the C pages of the current block.
+        """
+        lead_shape = self.image_data.shape[:-3]
+        for flat in range(start, self.n_blocks if stop is None else stop):
+            index = np.unravel_index(flat, lead_shape)
+            index = tuple(int(i) for i in index)
+            yield index, np.asarray(self.image_data[index])
+
+    @staticmethod
+    def _block_samples(block):
+        """Turns a (C, H, W) block into a float32 (H*W, C) sample matrix."""
+        C = block.shape[0]
+        return np.moveaxis(block, 0, -1).reshape(-1, C).astype(np.float32)
+
+    def fit_pca(self, n_components=3, chunked=False, progress=None):
+        """
+        Fits PCA over the channel dimension (every pixel is one sample and
+        the channels are its features) without projecting the data.
+
+        Args:
+            n_components (int): Number of PCA components to fit
+            chunked (bool): Fit out of core, one (z, t) block at a time, so
+                peak memory is bounded by a block rather than the whole image.
+                Images with up to COVARIANCE_PCA_MAX_FEATURES channels always
+                fit this way, with the exact CovariancePCA; more channels use
+                IncrementalPCA when chunked.
+            progress (callable): Called as progress(done, total) after each
+                (z, t) block is fitted (once at the end for an in-memory fit);
+                whatever it raises aborts the fit
+
+        Returns:
+            PCAModel: the fitted mean, components and explained variance
+        """
+        C = self.image_data.shape[-3]
+        n_blocks = self.n_blocks
+
+        # Few channels: exact covariance engine; otherwise sklearn (Incremental)PCA
+        pca = make_pca(n_components, C, incremental=chunked)
+        if chunked or isinstance(pca, CovariancePCA):
+            # Single pass over one (z, t) block at a time
+            for done, (_, block) in enumerate(self.iter_blocks(), 1):
+                pca.partial_fit(self._block_samples(block))
+                if progress is not None:
+                    progress(done, n_blocks)
+        else:
+            # Lazy page arrays are decoded here; memmaps are used as they are
+            data = np.asarray(self.image_data)
+            # Move channels last and flatten to (Z*T*H*W, C), as float32 for PCA
+            reshaped = np.moveaxis(data, -3, -1).reshape(-1, C).astype(np.float32)
+
+            # Fit PCA on the flattened data
+            pca.fit(reshaped)
+            del reshaped
+            if progress is not None:
+                progress(n_blocks, n_blocks)
+
+        return PCAModel.from_estimator(pca)
+
+    def run_pca(self, n_components=3, chunked=False, out_path=None, model=None, progress=None):
         """
         Runs PCA on the image data to reduce the channel dimension.
         Works with both 4D (T,C,H,W) and 5D (Z,T,C,H,W) images.
         
         Args:
             n_components (int): Number of PCA components to compute
+            chunked (bool): Fit out of core (see fit_pca)
+            out_path (str): Optional .npy path; the result is then written to
+                a memory-mapped file instead of being held in memory
+            model (PCAModel): Previously fitted model to apply instead of
+                fitting a new one; n_components and chunked are then ignored
+            progress (callable): Called as progress(done, total) after each
+                (z, t) block is projected (the fit reports its own blocks first)
         
         Returns:
             numpy.ndarray: PCA result reshaped to original dimensions 
             but with C replaced by n_components
         """
-        if self.dims == 5:
-            Z, T, C, H, W = self.image_data.shape
-            # Reshape to (Z*T*H*W, C)
-            reshaped = self.image_data.reshape(-1, C)
-        else:  # 4D image
-            T, C, H, W = self.image_data.shape
-            # Reshape to (T*H*W, C)
-            reshaped = self.image_data.reshape(-1, C)
+        shape = self.image_data.shape
+        lead_shape, (H, W) = shape[:-3], shape[-2:]
+        n_blocks = self.n_blocks
+        if model is None:
+            model = self.fit_pca(n_components, chunked=chunked, progress=progress and (
+                lambda done, total: progress(done, 2 * total)))
+            offset, total = n_blocks, 2 * n_blocks
+        else:
+            offset, total = 0, n_blocks
+        n_components = model.n_components
 
-        # Convert to float32 for PCA
-        reshaped = reshaped.astype(np.float32)
+        out_shape = tuple(lead_shape) + (H, W, n_components)
 
-        # Fit PCA on the flattened data
-        pca = PCA(n_components=n_components)
-        pca_result = pca.fit_transform(reshaped)
+        # Project block by block into a preallocated (or memory-mapped) output
+        if out_path is not None:
+            pca_result = np.lib.format.open_memmap(
+                out_path, mode='w+', dtype=np.float32, shape=out_shape
+            )
+        else:
+            pca_result = np.empty(out_shape, dtype=np.float32)
+        for done, (index, block) in enumerate(self.iter_blocks(), offset + 1):
+            projected = model.transform(self._block_samples(block))
+            pca_result[index] = projected.reshape(H, W, n_components)
+            if progress is not None:
+                progress(done, total)
 
-        # Reshape back to original dimensions with new n_components
-        if self.dims == 5:
-            return pca_result.reshape(Z, T, H, W, n_components)
-        else:  # 4D image
-            return pca_result.reshape(T, H, W, n_components)
+        return pca_result
 
-    def get_statistics(self):
+    def get_statistics(self, workers=STATS_WORKERS):
         """
         Calculates basic statistics for each channel across all Z and T dimensions.
         Works with both 4D and 5D images.
-        
+
+        The data is read once: every (z, t) block is reduced to mergeable
+        per-channel partials (count, mean, M2, min, max) on a thread pool,
+        and the global statistics are derived from the per-channel ones.
+
+        Args:
+            workers (int): Number of threads reducing blocks in parallel
+
+        Returns:
+            dict: Per-channel mean, std, min and max lists, the same numbers
+            under "per_channel", and the "global" statistics over all channels
+        """
+        C = self.image_data.shape[-3]
+        stats = reduce_blocks((block for _, block in self.iter_blocks()), C, workers=workers)
+        return format_statistics(stats)
+
+    def get_plane_statistics(self, workers=STATS_WORKERS):
+        """
+        Calculates the statistics of every 2D (z, t, c) plane in a single pass,
+        as mergeable records that can be stored and combined later
+        (see merge_plane_records) without touching the pixels again.
+
+        Args:
+            workers (int): Number of threads reducing blocks in parallel
+
+        Returns:
+            list: one dict per plane with z (None for 4D images), t, c,
+            count, mean, m2 (sum of squared deviations), min and max
+        """
+        indices = list(np.ndindex(*self.image_data.shape[:-3]))
+        blocks = (np.asarray(self.image_data[index]) for index in indices)
+        records = []
+        for index, stats in zip(indices, map_blocks(blocks, workers)):
+            z, t = index if self.dims == 5 else (None,) + index
+            for c in range(stats.n_channels):
+                records.append({
+                    "z": z, "t": t, "c": c,
+                    "count": int(stats.count[c]),
+                    "mean": float(stats.mean[c]),
+                    "m2": float(stats.m2[c]),
+                    "min": float(stats.min[c]),
+                    "max": float(stats.max[c]),
+                })
+        return records
+
+    def get_histogram(self, value_range=None, n_bins=HISTOGRAM_FLOAT_BINS, workers=STATS_WORKERS):
+        """
+        Builds per-channel histograms in one chunked pass over the image.
+        Integer images get exact one-bin-per-value histograms (np.bincount;
+        always for uint8/uint16), other images n_bins equal-width bins.
+        Percentiles are then derived from the histogram in O(bins)
+        (see ChannelHistogram.percentiles).
+
+        Args:
+            value_range (tuple): (min, max) of the data, e.g. from stored
+                statistics; computed with an extra pass if not given
+            n_bins (int): Number of bins for non-exact histograms
+            workers (int): Number of threads counting blocks in parallel
+
+        Returns:
+            ChannelHistogram: counts of shape (C, bins)
+        """
+        C = self.image_data.shape[-3]
+        if value_range is None:
+            stats = reduce_blocks((block for _, block in self.iter_blocks()), C, workers=workers)
+            value_range = (np.nanmin(stats.min), np.nanmax(stats.max))
+        histogram = ChannelHistogram.for_range(C, self.image_data.dtype, *value_range,
+                                               n_bins=n_bins)
+
+        def count(block):
+            return histogram.empty_like().add_block(block)
+
+        blocks = (block for _, block in self.iter_blocks())
+        for partial in map_blocks(blocks, workers, reduce=count):
+            histogram.merge(partial)
+        return histogram
+
+    def get_stack(self, axis='z', z=0, t=0, c=0, start=0, stop=None):
+        """
+        Extract a 3D stack of planes along Z (at time t) or T (at depth z).
+        Args:
+            axis (str): 'z' or 't' ('z' is not available for 4D images)
+            z, t (int): Index of the other leading dimension
+            c (int): Channel index
+            start, stop (int): Range of planes along the axis (default: all)
+        Returns:
+            3D numpy array (Z, H, W) or (T, H, W)
+        Raises:
+            ValueError: If the axis is unknown or any index is out of range.
+        """
+        self.plane_index(z, t, c)  # validates the indices
+        planes = slice(start, stop)
+        if axis == 'z' and self.dims == 5:
+            index = (planes, t, c)
+        elif axis == 't':
+            index = (z, planes, c) if self.dims == 5 else (planes, c)
+        else:
+            raise ValueError(f"Unknown stack axis '{axis}' for a {self.dims}D image")
+        # Lazy images decode only the pages of this stack
+        return np.asarray(self.image_data[index])
+
+    def segment_stack(self, axis='z', z=0, t=0, c=0, method='otsu', workers=SEGMENT_WORKERS,
+                      executor='thread', chunk_size=None, **kwargs):
+        """
+        Segments a Z or T stack (see get_stack) slice by slice with segment_3d,
+        running chunks of slices on a thread or process pool.
+        Args:
+            method (str): 'otsu' or 'kmeans' (kwargs, e.g. n_clusters, are passed on)
+            workers (int): Number of threads or processes
+            executor (str): 'thread' or 'process'
+            chunk_size (int): Slices per task (default: a few chunks per worker)
         Returns:
-            dict: Statistics per channel including mean, std, min, max
+            3D uint8 numpy array of labels, shaped like the stack
         """
+        stack = self.get_stack(axis, z, t, c)
+        return segment_3d(stack, method=method, workers=workers, executor=executor,
+                          chunk_size=chunk_size, **kwargs)
+
+    def _object_volume(self, t, across_time, c=None):
+        """
+        The volume label_objects works on, as a ChunkedVolume that decodes
+        only the planes of each chunk: channel c across Z at time t (or
+        across Z and T) for 5D images, at t (or across T) for 4D images.
+        With c=None every channel is read, with the channel axis before
+        the plane axes (the intensity layout of measure_objects).
+        """
+        H, W = self.image_data.shape[-2:]
+        channel = (slice(None),) if c is None else (c,)
+        channel_shape = self.image_data.shape[-3:-2] if c is None else ()
         if self.dims == 5:
-            Z, T, C, H, W = self.image_data.shape
-            # Reshape to combine Z, T, H, W dimensions
-            reshaped = self.image_data.reshape(-1, C).T  # Shape: (C, Z*T*H*W)
-        else:  # 4D image
-            T, C, H, W = self.image_data.shape
-            # Reshape to combine T, H, W dimensions
-            reshaped = self.image_data.reshape(-1, C).T  # Shape: (C, T*H*W)
-
-        stats = {
-            "per_channel": [],
-            "global": {
-                "min": float(self.image_data.min()),
-                "max": float(self.image_data.max()),
-                "mean": float(self.image_data.mean()),
-                "std": float(self.image_data.std())
-            }
-        }
-
-        # Calculate statistics for each channel
-        for i in range(reshaped.shape[0]):
-            channel_data = reshaped[i]
-            stats["per_channel"].append({
-                "channel": i,
-                "min": float(channel_data.min()),
-                "max": float(channel_data.max()),
-                "mean": float(channel_data.mean()),
-                "std": float(channel_data.std())
-            })
-
-        return stats
+            offset, length = 0, self.image_data.shape[0]
+            rest = (slice(None) if across_time else t,) + channel
+            lead_shape = (length,) + (self.image_data.shape[1:2] if across_time else ())
+        else:
+            offset, length = (0, self.image_data.shape[0]) if across_time else (t, 1)
+            rest = channel
+            lead_shape = (length,)
+
+        def read(start, stop):
+            # Lazy images decode only the pages of these planes
+            return np.asarray(self.image_data[(slice(offset + start, offset + stop),) + rest])
+
+        return ChunkedVolume(lead_shape + channel_shape + (H, W), read)
+
+    def label_objects(self, t=0, c=0, method='otsu', across_time=False, connectivity=1,
+                      workers=SEGMENT_WORKERS, executor='thread', progress=None, **kwargs):
+        """
+        Segments channel c slice by slice (see segment_3d) and labels the
+        connected foreground objects in 3D across Z at time t or, with
+        across_time=True, in 4D across Z and T, so an object overlapping
+        itself in consecutive timepoints keeps one label.
+        For 4D images, objects are labelled in the plane at t, or across T.
+        Planes are decoded and segmented a chunk at a time while they are
+        labelled (see label_volume), and the labels are written to a
+        temporary memmap, so memory stays at a chunk of planes.
+        Args:
+            connectivity (int): 1 (face neighbours) up to the label ndim (full)
+            method, workers, executor, kwargs: passed on to segment_3d
+            progress (callable): Called as progress(done, total) planes after
+                each chunk is labelled
+        Returns:
+            (labels, n, axes): int32 label memmap, the number of objects, and
+            the axis names of labels (e.g. 'ZYX' or 'ZTYX')
+        Raises:
+            ValueError: If t or c is out of range.
+        """
+        self.plane_index(0, t, c)  # validates the indices
+        if self.dims == 5:
+            axes = 'ZTYX' if across_time else 'ZYX'
+        else:
+            axes = 'TYX'
+        stack = self._object_volume(t, across_time, c)
+
+        def segment(start, stop):
+            planes = stack[start:stop]
+            masks = segment_3d(planes.reshape((-1,) + planes.shape[-2:]), method=method,
+                               workers=workers, executor=executor, **kwargs)
+            return masks.reshape(planes.shape)
+
+        # The temporary file is deleted once the memmap is released
+        labels = np.memmap(tempfile.TemporaryFile(), dtype=np.int32, mode='w+', shape=stack.shape)
+        labels, n = label_volume(ChunkedVolume(stack.shape, segment),
+                                 connectivity=connectivity, out=labels, progress=progress)
+        return labels, n, axes
+
+    def measure_objects(self, t=0, c=0, method='otsu', across_time=False, connectivity=1,
+                        workers=SEGMENT_WORKERS, executor='thread', progress=None, **kwargs):
+        """
+        Labels the objects of channel c (see label_objects) and measures each
+        one: volume (voxels), centroid, bounding box and mean intensity in
+        every channel, in image coordinates.
+        Args:
+            progress (callable): Called as progress(done, total) after each
+                chunk of planes, labelled and then measured
+        Returns:
+            (measurements, axes): one array per measurement with one row per
+            object (see src.core.objects.measure_objects), and the axis names
+            of the centroid and bbox columns (e.g. 'ZYX')
+        """
+        labels, n, axes = self.label_objects(
+            t, c, method, across_time, connectivity, workers, executor,
+            progress=progress and (lambda done, total: progress(done, 2 * total)), **kwargs)
+        # Intensities laid out like labels, with the channel axis before the plane axes
+        measurements = measure_objects(
+            labels, n, self._object_volume(t, across_time),
+            progress=progress and (lambda done, total: progress(total + done, 2 * total)))
+
+        if self.dims == 4 and not across_time:
+            # The single labelled plane sits at timepoint t
+            measurements["centroid"][:, 0] += t
+            measurements["bbox"][:, [0, labels.ndim]] += t
+        return measurements, axes
+
+    def get_projection(self, kind='max', axis='z', z=0, t=0, c=0, progress=None,
+                       start=0, stop=None):
+        """
+        Computes a maximum-, mean- or sum-intensity projection of a Z stack
+        (at time t) or a T stack (at depth z), streaming over the projected
+        axis one plane at a time into a running accumulator, so memory stays
+        at a single plane (lazy images decode one page at a time).
+        Args:
+            kind (str): 'max', 'mean' or 'sum'
+            axis (str): 'z' or 't' ('z' is not available for 4D images)
+            z, t (int): Index of the other leading dimension
+            c (int): Channel index
+            progress (callable): Called as progress(done, total) after each plane
+            start, stop (int): Range of planes to project (default: all), e.g.
+                one chunk of a fanned-out projection; max and sum partials
+                combine with np.maximum and np.add
+        Returns:
+            2D numpy array (H, W): the image dtype for max, int64 (uint64 for
+            uint64 images) or float64 for sum, float64 for mean
+        Raises:
+            ValueError: If the kind or axis is unknown or any index is out of range.
+        """
+        if kind not in PROJECTIONS:
+            raise ValueError(f"Unknown projection '{kind}', use one of: {', '.join(PROJECTIONS)}")
+        self.plane_index(z, t, c)  # validates the indices
+        if axis == 'z' and self.dims == 5:
+            indices = range(self.image_data.shape[0])[start:stop]
+            planes = (self.get_slice(i, t, c) for i in indices)
+        elif axis == 't':
+            indices = range(self.image_data.shape[-4])[start:stop]
+            planes = (self.get_slice(z, i, c) for i in indices)
+        else:
+            raise ValueError(f"Unknown projection axis '{axis}' for a {self.dims}D image")
+        if not len(indices):
+            raise ValueError(f"No planes in range [{start}, {stop}) to project")
+
+        dtype = self.image_data.dtype
+        if kind == 'max':
+            acc_dtype = dtype
+        elif np.issubdtype(dtype, np.integer):
+            # Exact integer sums
+            acc_dtype = np.uint64 if dtype == np.uint64 else np.int64
+        else:
+            acc_dtype = np.float64
+
+        acc, n_planes = None, 0
+        for plane in planes:
+            if acc is None:
+                acc = np.array(plane, dtype=acc_dtype)
+            elif kind == 'max':
+                np.maximum(acc, plane, out=acc)
+            else:
+                np.add(acc, plane, out=acc)
+            n_planes += 1
+            if progress is not None:
+                progress(n_planes, len(indices))
+
+        if kind == 'mean':
+            return acc / n_planes
+        return acc
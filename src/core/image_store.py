@@ -0,0 +1,352 @@
+"""
+image_store.py
+Uploaded images shared by every process that opens the same spool
+directory (Flask workers, Celery workers), keyed by image_id.
+
+Registrations live on disk next to the spooled uploads, so an image
+uploaded through one process can be opened by image_id in any other.
+Compressed uploads are decoded once, plane by plane, into an uncompressed
+.npy copy that every process memory-maps instead of decoding again, and
+images within the shared-memory budget are also published to a
+multiprocessing.shared_memory segment: other processes then map the same
+decoded pixels, with no copy and no decode. When a new image does not fit
+in the budget, the oldest segments are evicted (their images fall back to
+the files on disk).
+"""
+
+import ctypes
+import glob
+import json
+import os
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from src.core.image_processor import ImageProcessor
+
+_MANIFEST_SUFFIX = '.image.json'
+_ID_SUFFIX = '.id'
+
+_MISSING = object()
+
+
+class _SegmentView:
+    """
+    Exposes a shared memory segment to NumPy through __array_interface__.
+    Arrays built from it keep it (and so the segment's mapping) alive:
+    NumPy does not hold on to a buffer export, so viewing segment.buf
+    directly would leave arrays pointing at unmapped memory once the
+    segment is closed.
+    """
+
+    def __init__(self, segment, shape, dtype):
+        self.segment = segment
+        pointer = ctypes.c_char.from_buffer(segment.buf)
+        self.__array_interface__ = {
+            'shape': tuple(shape),
+            'typestr': np.dtype(dtype).str,
+            'data': (ctypes.addressof(pointer), True),  # read-only
+            'version': 3,
+        }
+        del pointer
+
+
+def _tracker_id():
+    """
+    Identifies this process's resource tracker, which its forked and
+    spawned children share (they inherit its pipe), or None off POSIX.
+    """
+    if os.name != 'posix':
+        return None
+    st = os.fstat(resource_tracker.getfd())
+    return f"{st.st_dev}:{st.st_ino}"
+
+
+def _attach(shared):
+    """
+    Attaches to the shared segment described by a registration, or returns
+    None if it no longer exists.
+    Attaching registers the segment with this process's resource tracker,
+    which would unlink it when the process exits; that registration is
+    dropped again unless the tracker is the publisher's own, whose
+    registration must stay so that the segment is unlinked with it.
+    """
+    try:
+        segment = shared_memory.SharedMemory(name=shared['name'])
+    except FileNotFoundError:
+        return None
+    if os.name == 'posix' and shared.get('tracker') != _tracker_id():
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+def _unlink(shared):
+    """Unlinks the shared segment described by a registration, if it still exists."""
+    try:
+        segment = shared_memory.SharedMemory(name=shared['name'])
+    except FileNotFoundError:
+        return
+    segment.unlink()  # also drops the tracker registration that attaching made
+    segment.close()
+
+
+class SharedImageStore:
+    """
+    Registered images of one spool directory, usable like a dict from
+    image_id to the path of the spooled upload.
+    Files live under <root_dir>/:
+      <image_id>.id           marks image_id as allocated, kept after it is dropped
+      <image_id>.image.json   registration: upload path, decoded copy, shared segment
+      <image_id>.decoded.npy  decoded pixels of an upload that cannot be memory-mapped
+    A shared segment lives until the image is dropped, until it is evicted
+    to make room for a newer one, or until the process that published it
+    exits; readers then fall back to the files on disk.
+    """
+
+    def __init__(self, root_dir, shared_max_bytes=0):
+        self.root_dir = root_dir
+        self.shared_max_bytes = int(shared_max_bytes)
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def manifest_path(self, image_id):
+        return os.path.join(self.root_dir, f"{image_id}{_MANIFEST_SUFFIX}")
+
+    def decoded_path(self, image_id):
+        return os.path.join(self.root_dir, f"{image_id}.decoded.npy")
+
+    def _read_manifest(self, image_id):
+        """The registration of image_id, or None if it is not registered."""
+        try:
+            with open(self.manifest_path(image_id)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return manifest if 'path' in manifest else None
+
+    def _write_manifest(self, image_id, manifest):
+        """Replaces the registration atomically, so readers never see it half-written."""
+        path = self.manifest_path(image_id)
+        part = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(part, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(part, path)
+
+    def __contains__(self, image_id):
+        return self._read_manifest(image_id) is not None
+
+    def __getitem__(self, image_id):
+        manifest = self._read_manifest(image_id)
+        if manifest is None:
+            raise KeyError(image_id)
+        return manifest['path']
+
+    def __setitem__(self, image_id, path):
+        """Registers (or re-registers) the upload at path, dropping any older decoded data."""
+        with self._lock:
+            self._discard(self._read_manifest(image_id))
+            self._write_manifest(image_id, {'path': os.fspath(path)})
+
+    def __len__(self):
+        return len(self._manifest_ids())
+
+    def __iter__(self):
+        return iter(sorted(image_id for image_id in self._manifest_ids() if image_id in self))
+
+    def _manifest_ids(self):
+        pattern = os.path.join(glob.escape(self.root_dir), f"*{_MANIFEST_SUFFIX}")
+        return [os.path.basename(path)[:-len(_MANIFEST_SUFFIX)] for path in glob.glob(pattern)]
+
+    def get(self, image_id, default=None):
+        try:
+            return self[image_id]
+        except KeyError:
+            return default
+
+    def pop(self, image_id, default=_MISSING):
+        """
+        Unregisters image_id and drops its decoded copy and shared segment;
+        the spooled upload itself is left on disk.
+        Returns the upload path (or default if image_id is not registered).
+        """
+        with self._lock:
+            manifest = self._read_manifest(image_id)
+            try:
+                os.remove(self.manifest_path(image_id))
+            except FileNotFoundError:
+                pass
+            self._discard(manifest)
+        if manifest is None:
+            if default is _MISSING:
+                raise KeyError(image_id)
+            return default
+        return manifest['path']
+
+    def allocate_id(self, prefix='image_'):
+        """
+        Reserves and returns a new <prefix><n> id, n >= 1, atomically across
+        processes. The id counts as registered once its upload is stored
+        with store[image_id] = path.
+        Ids are never handed out twice, even after pop(): each one leaves an
+        <image_id>.id marker behind, so a process that still caches a
+        dropped image by its id cannot serve it for a new upload.
+        """
+        pattern = os.path.join(glob.escape(self.root_dir), f"{glob.escape(prefix)}*{_ID_SUFFIX}")
+        numbers = [os.path.basename(path)[len(prefix):-len(_ID_SUFFIX)]
+                   for path in glob.glob(pattern)]
+        n = max((int(number) for number in numbers if number.isdigit()), default=0) + 1
+        flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY
+        while True:
+            image_id = f"{prefix}{n}"
+            n += 1
+            try:
+                os.close(os.open(os.path.join(self.root_dir, f"{image_id}{_ID_SUFFIX}"), flags))
+                os.close(os.open(self.manifest_path(image_id), flags))
+                return image_id
+            except FileExistsError:
+                continue
+
+    def _discard(self, manifest):
+        """Removes the decoded copy and shared segment named by a registration."""
+        if not manifest:
+            return
+        if manifest.get('decoded'):
+            try:
+                os.remove(manifest['decoded'])
+            except FileNotFoundError:
+                pass
+        if manifest.get('shared'):
+            _unlink(manifest['shared'])
+
+    def _drop_shared(self, image_id, name):
+        """Removes a shared segment that no longer exists from a registration."""
+        manifest = self._read_manifest(image_id)
+        if manifest and (manifest.get('shared') or {}).get('name') == name:
+            del manifest['shared']
+            self._write_manifest(image_id, manifest)
+
+    def _live_segments(self):
+        """
+        (created, image_id, shared) for every shared segment still published
+        by the store, oldest first. Registrations of segments that are gone
+        (e.g. their publisher exited) are cleared on the way.
+        """
+        live = []
+        for image_id in self._manifest_ids():
+            shared = (self._read_manifest(image_id) or {}).get('shared')
+            if not shared:
+                continue
+            segment = _attach(shared)
+            if segment is None:
+                self._drop_shared(image_id, shared['name'])
+                continue
+            segment.close()
+            live.append((shared.get('created', 0), image_id, shared))
+        return sorted(live, key=lambda entry: entry[:2])
+
+    def _shared_bytes(self):
+        """Bytes of shared memory currently published by the store (live segments only)."""
+        return sum(shared['nbytes'] for _, _, shared in self._live_segments())
+
+    def _make_room(self, nbytes):
+        """
+        Evicts the oldest shared segments until nbytes more fit within
+        shared_max_bytes. Returns False (evicting nothing) if they never can.
+        """
+        if not 0 < nbytes <= self.shared_max_bytes:
+            return False
+        live = self._live_segments()
+        total = sum(shared['nbytes'] for _, _, shared in live)
+        for _, image_id, shared in live:
+            if total + nbytes <= self.shared_max_bytes:
+                break
+            _unlink(shared)  # views already mapped by other processes stay valid
+            self._drop_shared(image_id, shared['name'])
+            total -= shared['nbytes']
+        return True
+
+    def publish(self, image_id, image_processor):
+        """
+        Makes the decoded pixels of a registered image available to every
+        process: writes an uncompressed .npy copy (one plane at a time) if
+        image_processor cannot memory-map the upload, and copies the pixels
+        into a shared memory segment if they fit within shared_max_bytes,
+        evicting the oldest segments of other images to make room.
+
+        Returns:
+            dict: {"decoded": bool, "shared": bool}, what was published
+        """
+        data = image_processor.image_data
+        with self._lock:
+            manifest = self._read_manifest(image_id)
+            if manifest is None:
+                raise KeyError(image_id)
+            self._discard(manifest)
+            manifest = {'path': manifest['path']}
+
+            source = image_processor
+            if not isinstance(data, np.memmap):
+                path = self.decoded_path(image_id)
+                part = f"{path}.{os.getpid()}.part.npy"
+                decoded = np.lib.format.open_memmap(part, mode='w+', dtype=data.dtype,
+                                                    shape=data.shape)
+                for index, plane in image_processor.iter_planes():
+                    decoded[index] = plane
+                decoded.flush()
+                del decoded
+                os.replace(part, path)
+                manifest['decoded'] = path
+                source = ImageProcessor(np.load(path, mmap_mode='r'))
+
+            nbytes = int(data.nbytes)
+            if self._make_room(nbytes):
+                segment = shared_memory.SharedMemory(create=True, size=nbytes)
+                shared = np.ndarray(data.shape, dtype=data.dtype, buffer=segment.buf)
+                for index, plane in source.iter_planes():
+                    shared[index] = plane
+                del shared
+                manifest['shared'] = {'name': segment.name, 'shape': list(data.shape),
+                                      'dtype': data.dtype.str, 'nbytes': nbytes,
+                                      'created': time.time(), 'tracker': _tracker_id()}
+                # The segment outlives this handle; it is unlinked by pop()
+                # or, failing that, when this process exits
+                segment.close()
+
+            self._write_manifest(image_id, manifest)
+        return {"decoded": 'decoded' in manifest, "shared": 'shared' in manifest}
+
+    def open_array(self, image_id):
+        """
+        Maps the decoded pixels of a published image without copying them:
+        a read-only view of its shared segment if that still exists, else a
+        read-only memmap of its decoded copy.
+
+        Returns:
+            numpy.ndarray or None: None if nothing was published
+        """
+        manifest = self._read_manifest(image_id)
+        if manifest is None:
+            raise KeyError(image_id)
+        shared = manifest.get('shared')
+        if shared:
+            segment = _attach(shared)
+            if segment is not None:
+                return np.asarray(_SegmentView(segment, shared['shape'], shared['dtype']))
+            with self._lock:
+                self._drop_shared(image_id, shared['name'])
+        if manifest.get('decoded'):
+            try:
+                return np.load(manifest['decoded'], mmap_mode='r')
+            except FileNotFoundError:
+                pass
+        return None
+
+    def open_processor(self, image_id):
+        """
+        Opens an ImageProcessor on a registered image, over its published
+        pixels if there are any (see open_array), otherwise lazily from the upload.
+        """
+        data = self.open_array(image_id)
+        if data is not None:
+            return ImageProcessor(data)
+        return ImageProcessor(self[image_id], lazy=True)
@@ -0,0 +1,37 @@
+"""
+ingest.py
+One-off work done for each image right after upload, so that later
+requests can be answered from precomputed data (e.g. the tile pyramid
+and the statistics stored in the database).
+"""
+
+from src.core.pyramid import build_pyramid
+from src.db.database import session_scope
+from src.db.statistics import save_image_statistics
+
+
+def ingest_statistics(image_id, image_processor):
+    """
+    Computes the statistics of every (z, t, c) plane in one pass and
+    stores them, with the image's dtype and shape, in the database.
+
+    Returns:
+        int: number of planes stored
+    """
+    records = image_processor.get_plane_statistics()
+    with session_scope() as session:
+        save_image_statistics(session, image_id, image_processor.get_metadata(), records)
+    return len(records)
+
+
+def ingest_image(image_id, image_processor, pyramid_dir):
+    """
+    Runs every ingest step for an uploaded image: builds the
+    multi-resolution tile pyramid and precomputes the plane statistics.
+
+    Returns:
+        dict: summary of what was produced, e.g. {"pyramid_levels": 4, "statistics_planes": 150}.
+    """
+    manifest = build_pyramid(image_processor, pyramid_dir)
+    n_planes = ingest_statistics(image_id, image_processor)
+    return {"pyramid_levels": len(manifest["levels"]), "statistics_planes": n_planes}
@@ -0,0 +1,412 @@
+"""
+jobs.py
+Background jobs (PCA, segmentation, objects, statistics, projections, and
+the ingest of each upload) on uploaded images, tracked on disk so the API process that submits a job and the
+worker process that runs it share its state.
+
+A job reports its progress after every chunk of work (a (z, t) block, a
+plane or a chunk of slices) and checks for cancellation at the same time,
+so a cancelled job stops within one chunk. Results are written as .npy
+arrays in the job's directory and fetched by name, instead of travelling
+through the task result backend.
+"""
+
+import fcntl
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import numpy as np
+from src.core.image_processor import PROJECTIONS
+from src.core.pca_cache import run_cached_pca
+from src.core.segmentation import SEGMENT_METHODS, segment_3d
+from src.utils.stats_utils import ChannelStats, map_blocks
+
+# Work that can be submitted as a job
+JOB_KINDS = ('pca', 'segmentation', 'objects', 'statistics', 'projection')
+
+# Jobs the API starts by itself: publishing and ingesting an upload (see POST /upload)
+INTERNAL_JOB_KINDS = ('ingest',)
+
+# Job states; the last three are final
+JOB_PENDING, JOB_RUNNING = 'pending', 'running'
+JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED = 'succeeded', 'failed', 'cancelled'
+JOB_FINAL_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+# Strings accepted as booleans by parse_bool
+_BOOLEANS = {'true': True, 'false': False, '1': True, '0': False}
+
+
+def parse_bool(value):
+    """
+    Converts a boolean request parameter strictly: true/false, 1/0, or
+    the strings "true"/"false"/"1"/"0" (in any case).
+    Raises:
+        ValueError: For anything else, e.g. "no" or 2
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in _BOOLEANS:
+        return _BOOLEANS[value.strip().lower()]
+    raise ValueError(f"Expected a boolean (true, false, 1 or 0), got {value!r}")
+
+
+# Parameters accepted by each kind of job, with the function converting each
+JOB_PARAMS = {
+    'pca': {"n_components": int, "chunked": parse_bool},
+    'segmentation': {"axis": str, "z": int, "time": int, "channel": int, "method": str,
+                     "n_clusters": int},
+    'objects': {"time": int, "channel": int, "method": str, "n_clusters": int,
+                "across_time": parse_bool, "connectivity": int},
+    'statistics': {},
+    'projection': {"projection": str, "axis": str, "z": int, "time": int, "channel": int},
+}
+
+# Slices segmented (and reported) at a time by segmentation jobs
+JOB_SEGMENT_CHUNK = 16
+
+# Minimum seconds between two sweeps for expired jobs made by create()
+JOB_PURGE_INTERVAL = 60
+
+_JOB_ID = re.compile(r'[0-9a-f]{32}$')
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once its cancellation was requested."""
+
+
+class JobStore:
+    """
+    Jobs and their results, one directory per job under root_dir:
+      <job_id>/job.json       kind, image_id, params, status, progress, error, results
+      <job_id>/cancel         present once cancellation was requested
+      <job_id>/lock           locked (flock) while job.json is read and rewritten
+      <job_id>/<name>.npy     result arrays
+    job.json is only replaced atomically, and changes to it hold the job's
+    lock, so updates from several processes never overwrite each other
+    (e.g. a worker starting a job that was just cancelled).
+    With a ttl (seconds), finished jobs and their results are deleted once
+    they are older than that, swept at most every JOB_PURGE_INTERVAL
+    seconds when jobs are created (see purge_expired).
+    """
+
+    def __init__(self, root_dir, ttl=None):
+        self.root_dir = root_dir
+        self.ttl = ttl
+        self._last_purge = 0.0
+        os.makedirs(root_dir, exist_ok=True)
+
+    def job_dir(self, job_id):
+        return os.path.join(self.root_dir, job_id)
+
+    def result_path(self, job_id, name):
+        return os.path.join(self.job_dir(job_id), f"{name}.npy")
+
+    def _write(self, job_id, job):
+        path = os.path.join(self.job_dir(job_id), 'job.json')
+        part = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(part, 'w') as f:
+            json.dump(job, f)
+        os.replace(part, path)
+
+    def create(self, kind, image_id, params=None):
+        """Records a new pending job and returns it."""
+        if kind not in JOB_KINDS + INTERNAL_JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}', use one of: {', '.join(JOB_KINDS)}")
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_dir(job_id))
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "image_id": image_id,
+            "params": dict(params or {}),
+            "status": JOB_PENDING,
+            "progress": {"done": 0, "total": None},
+            "error": None,
+            "results": {},
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+        }
+        self._write(job_id, job)
+        if self.ttl and job["created"] - self._last_purge >= JOB_PURGE_INTERVAL:
+            self._last_purge = job["created"]
+            self.purge_expired()
+        return job
+
+    def get(self, job_id):
+        """Returns the job, or None if there is no such job."""
+        if not _JOB_ID.match(job_id):
+            return None
+        try:
+            with open(os.path.join(self.job_dir(job_id), 'job.json')) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        job["cancel_requested"] = self.cancel_requested(job_id)
+        return job
+
+    @contextmanager
+    def _locked(self, job_id):
+        """Holds the job's lock (across processes and threads) and yields the job, or None."""
+        if self.get(job_id) is None:
+            yield None
+            return
+        try:
+            lock = open(os.path.join(self.job_dir(job_id), 'lock'), 'a')
+        except FileNotFoundError:  # deleted meanwhile
+            yield None
+            return
+        with lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield self.get(job_id)
+
+    def _update(self, job, fields):
+        """Merges fields into a job read under its lock, and writes it."""
+        cancel_requested = job.pop("cancel_requested")
+        job.update(fields)
+        self._write(job["job_id"], job)
+        job["cancel_requested"] = cancel_requested
+        return job
+
+    def update(self, job_id, **fields):
+        """Merges fields into the job and returns it."""
+        with self._locked(job_id) as job:
+            if job is None:
+                raise KeyError(job_id)
+            return self._update(job, fields)
+
+    def start(self, job_id):
+        """
+        Marks a pending job running, unless its cancellation was requested,
+        in which case it is marked cancelled. Jobs in any other state are
+        left as they are.
+        Returns:
+            (job, started): the job, and whether this call started it
+        """
+        with self._locked(job_id) as job:
+            if job is None:
+                raise KeyError(job_id)
+            if job["status"] != JOB_PENDING:
+                return job, False
+            if job["cancel_requested"]:
+                return self._update(job, {"status": JOB_CANCELLED, "finished": time.time()}), False
+            return self._update(job, {"status": JOB_RUNNING, "started": time.time()}), True
+
+    def advance(self, job_id, done):
+        """Adds done chunks to the job's progress (e.g. from parallel subtasks); returns the job."""
+        with self._locked(job_id) as job:
+            if job is None:
+                raise KeyError(job_id)
+            progress = dict(job["progress"], done=job["progress"]["done"] + int(done))
+            return self._update(job, {"progress": progress})
+
+    def cancel_requested(self, job_id):
+        return os.path.exists(os.path.join(self.job_dir(job_id), 'cancel'))
+
+    def cancel(self, job_id):
+        """
+        Requests cancellation: a pending job is cancelled at once, a running
+        one stops after its current chunk. Final jobs are left as they are.
+        Returns the job (None if there is no such job).
+        """
+        with self._locked(job_id) as job:
+            if job is None or job["status"] in JOB_FINAL_STATES:
+                return job
+            open(os.path.join(self.job_dir(job_id), 'cancel'), 'w').close()
+            job["cancel_requested"] = True
+            if job["status"] == JOB_PENDING:
+                return self._update(job, {"status": JOB_CANCELLED, "finished": time.time()})
+            return job
+
+    def save_result(self, job_id, name, array):
+        """Writes a result array and returns its description (shape, dtype)."""
+        path = self.result_path(job_id, name)
+        part = f"{path}.{os.getpid()}.part.npy"
+        np.save(part, array)
+        os.replace(part, path)
+        return {"shape": list(np.shape(array)), "dtype": np.asarray(array).dtype.str}
+
+    def link_result(self, job_id, name, source_path):
+        """
+        Publishes an existing .npy file as a result without copying it
+        (a hard link, or a copy across file systems). Returns its description.
+        """
+        path = self.result_path(job_id, name)
+        part = f"{path}.{os.getpid()}.part.npy"
+        try:
+            os.link(source_path, part)
+        except OSError:
+            shutil.copyfile(source_path, part)
+        os.replace(part, path)
+        array = np.load(path, mmap_mode='r')
+        return {"shape": list(array.shape), "dtype": array.dtype.str}
+
+    def load_result(self, job_id, name):
+        """Memory-maps a result array (read-only)."""
+        return np.load(self.result_path(job_id, name), mmap_mode='r')
+
+    def delete(self, job_id):
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def purge_expired(self, max_age=None):
+        """
+        Deletes the jobs that reached a final state more than max_age
+        seconds ago (by default the store's ttl), with their results.
+        Jobs still pending or running are kept however old they are.
+        Returns the ids of the deleted jobs.
+        """
+        max_age = self.ttl if max_age is None else max_age
+        if max_age is None:
+            return []
+        cutoff = time.time() - max_age
+        deleted = []
+        for job_id in os.listdir(self.root_dir):
+            job = self.get(job_id)
+            if (job is not None and job["status"] in JOB_FINAL_STATES
+                    and (job["finished"] or job["created"]) < cutoff):
+                self.delete(job_id)
+                deleted.append(job_id)
+        return deleted
+
+
+def _statistics(image_processor, params, progress):
+    """Per-channel count, mean, std, min and max, one (z, t) block at a time."""
+    C = image_processor.image_data.shape[-3]
+    n_blocks = image_processor.n_blocks
+    total = ChannelStats(C)
+    blocks = (block for _, block in image_processor.iter_blocks())
+    for done, stats in enumerate(map_blocks(blocks), 1):
+        total.merge(stats)
+        progress(done, n_blocks)
+    return statistics_results(total)
+
+
+def statistics_results(stats):
+    """The result arrays of a statistics job from its merged ChannelStats."""
+    return {"count": stats.count, "mean": stats.mean, "std": stats.std,
+            "min": stats.min, "max": stats.max}
+
+
+def _projection(image_processor, params, progress):
+    projection = image_processor.get_projection(
+        params.get("projection", "max"), params.get("axis", "z"), params.get("z", 0),
+        params.get("time", 0), params.get("channel", 0), progress=progress)
+    return {"projection": projection}
+
+
+def _segmentation(image_processor, params, progress):
+    """Labels of a Z or T stack (see ImageProcessor.segment_stack), a chunk of slices at a time."""
+    stack = image_processor.get_stack(params.get("axis", "z"), params.get("z", 0),
+                                      params.get("time", 0), params.get("channel", 0))
+    kwargs = {key: params[key] for key in ("n_clusters",) if key in params}
+    labels = np.empty(stack.shape, dtype=np.uint8)
+    for start in range(0, len(stack), JOB_SEGMENT_CHUNK):
+        stop = min(start + JOB_SEGMENT_CHUNK, len(stack))
+        labels[start:stop] = segment_3d(stack[start:stop], method=params.get("method", "otsu"),
+                                        **kwargs)
+        progress(stop, len(stack))
+    return {"labels": labels}
+
+
+def _objects(image_processor, params, progress):
+    """
+    Labels and measures the 3D objects of a channel (see
+    ImageProcessor.measure_objects): one result per measurement column,
+    plus the axis names of the centroid and bbox columns as "axes".
+    """
+    kwargs = {key: params[key] for key in ("n_clusters",) if key in params}
+    measurements, axes = image_processor.measure_objects(
+        t=params.get("time", 0), c=params.get("channel", 0), method=params.get("method", "otsu"),
+        across_time=params.get("across_time", False), connectivity=params.get("connectivity", 1),
+        progress=progress, **kwargs)
+    return dict(measurements, axes=np.array(list(axes)))
+
+
+def validate_job_params(kind, params):
+    """
+    Checks and converts the parameters of a job before it is submitted.
+    Returns:
+        dict: the parameters, converted to their types (see JOB_PARAMS)
+    Raises:
+        ValueError: If the kind or a parameter is invalid.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind '{kind}', use one of: {', '.join(JOB_KINDS)}")
+    unknown = set(params) - set(JOB_PARAMS[kind])
+    if unknown:
+        raise ValueError(f"Unknown parameters for a {kind} job: {', '.join(sorted(unknown))}")
+    params = {key: JOB_PARAMS[kind][key](value) for key, value in params.items()}
+
+    if params.get("n_components", 1) < 1 or params.get("n_clusters", 2) < 2:
+        raise ValueError("n_components must be at least 1 and n_clusters at least 2")
+    if params.get("projection", "max") not in PROJECTIONS:
+        raise ValueError(f"Unknown projection '{params['projection']}'")
+    if params.get("axis", "z") not in ('z', 't'):
+        raise ValueError(f"Unknown axis '{params['axis']}'")
+    if params.get("method", "otsu") not in SEGMENT_METHODS:
+        raise ValueError(f"Unknown segmentation method '{params['method']}'")
+    return params
+
+
+def run_job(store, job_id, open_processor, pca_store=None, ingest=None):
+    """
+    Runs a pending job to completion, recording its progress, results and
+    final state in the store.
+
+    Args:
+        store (JobStore): Where the job lives
+        job_id (str): Job to run
+        open_processor (callable): Returns the ImageProcessor of an image_id
+        pca_store (PCAModelStore): Model cache used by PCA jobs
+        ingest (callable): Runs ingest jobs: ingest(image_id, progress)
+            publishes and ingests an upload, and they have no results
+
+    Returns:
+        dict: the job in its final state
+    """
+    # Under the job's lock, so a concurrent cancel is never overwritten
+    job, started = store.start(job_id)
+    if not started:
+        return job
+    params = job["params"]
+
+    def progress(done, total):
+        if store.cancel_requested(job_id):
+            raise JobCancelled(job_id)
+        store.update(job_id, progress={"done": int(done), "total": int(total)})
+
+    try:
+        if job["kind"] == 'ingest':
+            # Before the image is opened: its publish changes what it opens
+            ingest(job["image_id"], progress)
+            results = {}
+        elif job["kind"] == 'pca':
+            image_processor = open_processor(job["image_id"])
+            result, _ = run_cached_pca(image_processor, job["image_id"], pca_store,
+                                       int(params.get("n_components", 3)),
+                                       chunked=bool(params.get("chunked", True)),
+                                       progress=progress)
+            try:
+                results = {"pca_result": store.link_result(job_id, "pca_result",
+                                                           result.filename)}
+            except FileNotFoundError:
+                # Evicted from the PCA cache meanwhile; the memmap still reads it
+                results = {"pca_result": store.save_result(job_id, "pca_result", result)}
+        else:
+            image_processor = open_processor(job["image_id"])
+            run = {'statistics': _statistics, 'projection': _projection,
+                   'segmentation': _segmentation, 'objects': _objects}[job["kind"]]
+            results = {name: store.save_result(job_id, name, array)
+                       for name, array in run(image_processor, params, progress).items()}
+    except JobCancelled:
+        return store.update(job_id, status=JOB_CANCELLED, finished=time.time())
+    except Exception as e:
+        return store.update(job_id, status=JOB_FAILED, error=str(e), finished=time.time())
+    return store.update(job_id, status=JOB_SUCCEEDED, results=results, finished=time.time())
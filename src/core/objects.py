@@ -0,0 +1,196 @@
+"""
+objects.py
+Connected-component labeling of segmented volumes and per-object measurements.
+
+Volumes are labelled a chunk of planes (along the first axis) at a time;
+objects that touch across a chunk boundary are merged afterwards with a
+connected-components pass over the (label, label) pairs found on the
+boundary, so the result matches labeling the whole volume at once.
+Masks and intensities can be ChunkedVolumes, read (or segmented) one chunk
+at a time, and labels can be written to a memmap, so a whole volume is
+never held in memory.
+Measurements are accumulated chunk by chunk with np.bincount, one array
+per quantity, so no Python loop runs over objects.
+"""
+
+import numpy as np
+from scipy import ndimage
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# Planes (along the first axis) labelled or measured at a time
+OBJECTS_CHUNK_PLANES = 16
+
+
+class ChunkedVolume:
+    """
+    Array-like volume produced a chunk of planes at a time: read(start, stop)
+    returns planes start..stop-1 along the first axis (e.g. decoding and
+    segmenting just those planes). Only contiguous slices of the first axis
+    are supported, which is all label_volume and measure_objects take.
+    """
+
+    def __init__(self, shape, read):
+        self.shape = tuple(shape)
+        self.ndim = len(self.shape)
+        self._read = read
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise IndexError("ChunkedVolume only supports contiguous slices of its first axis")
+        start, stop, _ = key.indices(self.shape[0])
+        return self._read(start, max(start, stop))
+
+
+def _boundary_pairs(upper, lower, structure):
+    """
+    (label, label) pairs of foreground voxels that are connected across the
+    boundary between the last plane of one chunk (upper) and the first plane
+    of the next (lower), for the given connectivity structure.
+    """
+    pairs = []
+    # Neighbours in the next plane are the structure's "+1" slab
+    for offset in np.argwhere(structure[2]) - 1:
+        src = tuple(slice(max(0, -o), upper.shape[i] - max(0, o)) for i, o in enumerate(offset))
+        dst = tuple(slice(max(0, o), upper.shape[i] - max(0, -o)) for i, o in enumerate(offset))
+        a, b = upper[src].ravel(), lower[dst].ravel()
+        touching = (a > 0) & (b > 0)
+        pairs.append(np.stack([a[touching], b[touching]]))
+    return np.concatenate(pairs, axis=1)
+
+
+def label_volume(mask, connectivity=1, chunk_size=OBJECTS_CHUNK_PLANES, out=None, progress=None):
+    """
+    Labels the connected foreground (nonzero) objects of an N-D mask, e.g.
+    (Z, H, W), or (Z, T, H, W) to connect objects across time as well.
+
+    Each chunk of chunk_size planes along the first axis is labelled with
+    scipy.ndimage.label; objects touching across chunk boundaries are then
+    merged, and labels are renumbered 1..n in order of first appearance
+    of their chunk label.
+
+    Args:
+        mask (array-like): N-D mask; chunks are read one at a time, so a
+            lazily decoded or memory-mapped mask (or a ChunkedVolume) is
+            never fully converted
+        connectivity (int): 1 for face neighbours up to mask.ndim for full
+            (e.g. 26-) connectivity, as in scipy.ndimage.generate_binary_structure
+        chunk_size (int): Planes labelled at a time
+        out (numpy.ndarray): int32 array shaped like mask to write the
+            labels to, e.g. a memmap; only a chunk and the plane carried
+            across its boundary are in memory at a time
+        progress (callable): Called as progress(done, total) planes after each chunk
+
+    Returns:
+        (labels, n): int32 label volume shaped like mask, and the object count
+    """
+    structure = ndimage.generate_binary_structure(len(mask.shape), connectivity)
+    labels = np.empty(mask.shape, dtype=np.int32) if out is None else out
+    pairs, n, previous = [], 0, None
+    for start in range(0, mask.shape[0], chunk_size):
+        stop = min(start + chunk_size, mask.shape[0])
+        chunk = np.empty((stop - start,) + tuple(mask.shape[1:]), dtype=np.int32)
+        found = ndimage.label(np.asarray(mask[start:stop]), structure=structure, output=chunk)
+        chunk[chunk > 0] += n
+        n += found
+        if previous is not None:
+            pairs.append(_boundary_pairs(previous, chunk[0], structure))
+        labels[start:stop] = chunk
+        previous = chunk[-1].copy()
+        if progress is not None:
+            progress(stop, mask.shape[0])
+
+    if not pairs or not n:
+        return labels, n
+
+    # Chunk labels connected across boundaries form one object
+    pairs = np.concatenate(pairs, axis=1)
+    graph = coo_matrix((np.ones(pairs.shape[1], dtype=np.int8), (pairs[0], pairs[1])),
+                       shape=(n + 1, n + 1))
+    _, component = connected_components(graph, directed=False)
+    # Number components 1..n_objects by their smallest chunk label; 0 stays background
+    _, first, lut = np.unique(component[1:], return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first))
+    lut = np.concatenate([[0], order[lut] + 1]).astype(np.int32)
+    for start in range(0, mask.shape[0], chunk_size):
+        chunk = labels[start:start + chunk_size]
+        chunk[...] = lut[chunk]
+    return labels, len(first)
+
+
+def measure_objects(labels, n_labels, intensity=None, chunk_size=OBJECTS_CHUNK_PLANES,
+                    progress=None):
+    """
+    Measures every labelled object of an N-D label volume.
+
+    Args:
+        labels (numpy.ndarray): Label volume, e.g. from label_volume; read
+            one chunk at a time, so it can be a memmap
+        n_labels (int): Number of objects (labels 1..n_labels)
+        intensity (array-like): Optional image shaped like labels with a
+            channel axis inserted before the last two (plane) axes, e.g.
+            (Z, C, H, W) for (Z, H, W) labels; read one chunk at a time
+        chunk_size (int): Planes measured at a time
+        progress (callable): Called as progress(done, total) planes after each chunk
+
+    Returns:
+        dict of arrays, one row per object: label (n,), volume (n,) voxel
+        counts, centroid (n, ndim), bbox (n, 2 * ndim) as per-axis start
+        then stop (exclusive) and, with intensity, mean_intensity (n, C)
+    """
+    ndim = labels.ndim
+    size = n_labels + 1
+    volume = np.zeros(size, dtype=np.int64)
+    coordinate_sums = np.zeros((ndim, size))
+    lower = np.full((ndim, size), np.iinfo(np.int64).max, dtype=np.int64)
+    upper = np.full((ndim, size), -1, dtype=np.int64)
+    intensity_sums = None
+
+    for start in range(0, labels.shape[0], chunk_size):
+        chunk = np.asarray(labels[start:start + chunk_size])
+        flat = chunk.ravel()
+        volume += np.bincount(flat, minlength=size)
+        for axis in range(ndim):
+            shape = [1] * ndim
+            shape[axis] = chunk.shape[axis]
+            coordinate = np.arange(chunk.shape[axis]).reshape(shape) + (start if axis == 0 else 0)
+            coordinate = np.broadcast_to(coordinate, chunk.shape).ravel()
+            coordinate_sums[axis] += np.bincount(flat, weights=coordinate, minlength=size)
+            np.minimum.at(lower[axis], flat, coordinate)
+            np.maximum.at(upper[axis], flat, coordinate)
+        if intensity is not None:
+            block = np.asarray(intensity[start:start + chunk_size])
+            channels = np.moveaxis(block, -3, 0).reshape(block.shape[-3], -1)
+            sums = np.stack([np.bincount(flat, weights=channel, minlength=size)
+                             for channel in channels], axis=1)
+            intensity_sums = sums if intensity_sums is None else intensity_sums + sums
+        if progress is not None:
+            progress(min(start + chunk_size, labels.shape[0]), labels.shape[0])
+
+    counts = np.maximum(volume[1:], 1)
+    bbox = np.concatenate([lower[:, 1:], upper[:, 1:] + 1]).T
+    bbox[volume[1:] == 0] = 0
+
+    result = {
+        "label": np.arange(1, size),
+        "volume": volume[1:],
+        "centroid": (coordinate_sums[:, 1:] / counts).T,
+        "bbox": bbox,
+    }
+    if intensity_sums is not None:
+        result["mean_intensity"] = intensity_sums[1:] / counts[:, None]
+    return result
+
+
+def format_objects(measurements, axes):
+    """
+    Turns measure_objects output into JSON-ready columns (one list per
+    quantity) with the axis names of the centroid and bbox columns.
+    """
+    result = {"axes": list(axes), "n_objects": int(len(measurements["label"]))}
+    for key, values in measurements.items():
+        result[key] = values.tolist()
+    return result
@@ -0,0 +1,203 @@
+"""
+pca_cache.py
+Caches fitted PCA models and projection results per image, in memory and
+on disk, so repeat analyses skip the fit (and the projection) entirely.
+
+Models are keyed by (image_id, engine, n_components), where the engine
+('covariance', 'incremental' or 'full') captures the fit options. A request
+for k components is served by truncating any cached model with >= k
+components. With the covariance engine every fit keeps all C components,
+so a single fit serves every k.
+
+Both caches are bounded: at most max_models models are kept in memory
+(least recently used first out, they reload from disk), and projections
+on disk are evicted least recently used first beyond max_projection_bytes.
+"""
+
+import glob
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+from src.utils.pca_utils import PCAModel, pca_engine_name
+
+_MODEL_FILE = re.compile(r'model_(?P<engine>\w+)_k(?P<k>\d+)\.npz$')
+
+
+class PCAModelStore:
+    """
+    Fitted PCA models and projected results for many images.
+    Files live under <root_dir>/<image_id>.pca/:
+      model_<engine>_k<k>.npz       fitted PCAModel
+      projection_<engine>_k<k>.npy  projected (..., H, W, k) float32 result
+    A projection's modification time records its last use, so every
+    process sharing root_dir evicts the same least recently used files.
+    """
+
+    def __init__(self, root_dir, max_projection_bytes=4 * 1024**3, max_models=256):
+        self.root_dir = root_dir
+        self.max_projection_bytes = int(max_projection_bytes)
+        self.max_models = int(max_models)
+        self._models = OrderedDict()  # (image_id, engine, k) -> PCAModel, least recently used first
+        self._lock = threading.Lock()
+
+    def image_dir(self, image_id):
+        return os.path.join(self.root_dir, f"{image_id}.pca")
+
+    def model_path(self, image_id, engine, n_components):
+        return os.path.join(self.image_dir(image_id), f"model_{engine}_k{n_components}.npz")
+
+    def projection_path(self, image_id, engine, n_components):
+        return os.path.join(self.image_dir(image_id),
+                            f"projection_{engine}_k{n_components}.npy")
+
+    def get_model(self, image_id, engine, n_components):
+        """
+        Returns a cached model with exactly n_components components,
+        truncated from the smallest cached model that has at least that many,
+        or None if there is none (in memory or on disk).
+        """
+        with self._lock:
+            candidates = {k: model for (i, e, k), model in self._models.items()
+                          if i == image_id and e == engine and k >= n_components}
+        if not candidates:
+            for path in glob.glob(os.path.join(self.image_dir(image_id), 'model_*.npz')):
+                match = _MODEL_FILE.search(path)
+                if match and match['engine'] == engine and int(match['k']) >= n_components:
+                    model = PCAModel.load(path)
+                    self._remember(image_id, engine, model)
+                    candidates[model.n_components] = model
+        if not candidates:
+            return None
+        k = min(candidates)
+        with self._lock:
+            if (image_id, engine, k) in self._models:
+                self._models.move_to_end((image_id, engine, k))
+        return candidates[k].truncate(n_components)
+
+    def _remember(self, image_id, engine, model):
+        """Caches a model in memory, dropping the least recently used beyond max_models."""
+        with self._lock:
+            self._models[(image_id, engine, model.n_components)] = model
+            self._models.move_to_end((image_id, engine, model.n_components))
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+
+    def put_model(self, image_id, engine, model):
+        """Caches a fitted model in memory and persists it to disk."""
+        os.makedirs(self.image_dir(image_id), exist_ok=True)
+        path = self.model_path(image_id, engine, model.n_components)
+        model.save(path + '.part.npz')
+        os.replace(path + '.part.npz', path)
+        self._remember(image_id, engine, model)
+
+    def load_projection(self, image_id, engine, n_components):
+        """
+        Returns a stored projection as a read-only memmap, marking it
+        recently used, or None if there is none (or it was evicted).
+        """
+        path = self.projection_path(image_id, engine, n_components)
+        try:
+            result = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return result
+
+    def put_projection(self, image_id, engine, n_components, partial):
+        """
+        Publishes a projection written to the file partial, then evicts the
+        least recently used projections of every image (never this one)
+        until they fit in max_projection_bytes.
+        Returns the projection as a read-only memmap, which stays readable
+        even if the file is evicted later on.
+        """
+        path = self.projection_path(image_id, engine, n_components)
+        os.replace(partial, path)
+        result = np.load(path, mmap_mode='r')
+        self._evict_projections(keep=path)
+        return result
+
+    def _evict_projections(self, keep):
+        pattern = os.path.join(glob.escape(self.root_dir), '*.pca', 'projection_*.npy')
+        files = []
+        for path in glob.glob(pattern):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime_ns, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_projection_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self, image_id):
+        """Drops every cached model and projection of an image."""
+        with self._lock:
+            for key in [key for key in self._models if key[0] == image_id]:
+                del self._models[key]
+        shutil.rmtree(self.image_dir(image_id), ignore_errors=True)
+
+
+def run_cached_pca(image_processor, image_id, store, n_components=3, chunked=False,
+                   progress=None):
+    """
+    Runs PCA on an image through the PCAModelStore.
+
+    The fit is skipped if a model with >= n_components components is cached
+    for the same engine; the projection is skipped if the same result was
+    computed before (and not evicted since). Either way the result is
+    returned as a read-only memmap.
+    progress(done, total) is called after each (z, t) block fitted or
+    projected, over the blocks of the steps that are not cached.
+
+    Returns:
+        (numpy.ndarray, PCAModel): the projected result and the model used
+    """
+    C = image_processor.image_data.shape[-3]
+    engine = pca_engine_name(C, incremental=chunked)
+    n_blocks = image_processor.n_blocks
+
+    model = store.get_model(image_id, engine, n_components)
+    result = store.load_projection(image_id, engine, n_components)
+    project = result is None
+    total = n_blocks * ((model is None) + project)
+
+    def report(offset):
+        if progress is None:
+            return None
+        return lambda done, _: progress(offset + done, total)
+
+    if model is None:
+        # The covariance engine costs the same for any k, so keep all components
+        n_fit = C if engine == 'covariance' else n_components
+        model = image_processor.fit_pca(n_fit, chunked=chunked, progress=report(0))
+        store.put_model(image_id, engine, model)
+        model = model.truncate(n_components)
+
+    if project:
+        path = store.projection_path(image_id, engine, n_components)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write under a unique temporary name, then publish atomically
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            result = image_processor.run_pca(model=model, out_path=partial,
+                                             progress=report(total - n_blocks))
+            result.flush()
+            del result
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        result = store.put_projection(image_id, engine, n_components, partial)
+    return result, model
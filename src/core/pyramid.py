@@ -0,0 +1,144 @@
+"""
+pyramid.py
+Builds and reads multi-resolution pyramids for every 2D plane of an image.
+Level 0 is the full-resolution data; level n is downsampled by 2**n using
+a vectorized block mean. Levels >= 1 are stored as .npy files on disk
+(shaped like the image, e.g. (Z, T, C, h, w)) and read through memmaps,
+so serving a tile only touches that tile's bytes. Level 0 is read from the
+image itself when its pixels are an array (in memory or memory-mapped);
+for images decoded page by page it is stored too, so a full-resolution
+tile does not decode its whole plane.
+"""
+
+import json
+import os
+import numpy as np
+
+# Edge length (pixels) of the square tiles served by GET /tile
+TILE_SIZE = 256
+
+MANIFEST_NAME = 'pyramid.json'
+
+
+def downsample_block_mean(plane, factor=2):
+    """
+    Reduces a 2D plane by `factor` in each dimension by averaging
+    factor x factor blocks in a single vectorized operation.
+    Edges that do not divide evenly are padded by replicating the last
+    row/column. The result keeps the input dtype (rounded for integers).
+    """
+    H, W = plane.shape
+    h, w = -(-H // factor), -(-W // factor)  # ceil division
+    pad_h, pad_w = h * factor - H, w * factor - W
+    if pad_h or pad_w:
+        plane = np.pad(plane, ((0, pad_h), (0, pad_w)), mode='edge')
+
+    blocks = plane.reshape(h, factor, w, factor)
+    reduced = blocks.mean(axis=(1, 3), dtype=np.float64)
+    if np.issubdtype(plane.dtype, np.integer):
+        reduced = np.rint(reduced)
+    return reduced.astype(plane.dtype, copy=False)
+
+
+def pyramid_level_shapes(height, width, tile_size=TILE_SIZE):
+    """
+    Returns the (h, w) of every pyramid level, starting with the full
+    resolution and halving until the plane fits in a single tile.
+    """
+    shapes = [(height, width)]
+    while shapes[-1][0] > tile_size or shapes[-1][1] > tile_size:
+        h, w = shapes[-1]
+        shapes.append((-(-h // 2), -(-w // 2)))
+    return shapes
+
+
+def build_pyramid(image_processor, pyramid_dir, tile_size=TILE_SIZE):
+    """
+    Builds the downsampled levels for every plane of an ImageProcessor and
+    writes them under pyramid_dir, with a copy of level 0 if the image is
+    not an array that tiles can be cut from directly (e.g. a TiffPageArray).
+    Planes are processed one at a time, so memory use is bounded by a
+    single full-resolution plane.
+
+    Returns:
+        dict: the pyramid manifest (also written to pyramid_dir/pyramid.json).
+    """
+    shape = image_processor.image_data.shape
+    lead_shape, (H, W) = shape[:-2], shape[-2:]
+    dtype = image_processor.image_data.dtype
+    level_shapes = pyramid_level_shapes(H, W, tile_size)
+
+    os.makedirs(pyramid_dir, exist_ok=True)
+    levels = [
+        np.lib.format.open_memmap(
+            os.path.join(pyramid_dir, f'level_{n}.npy'), mode='w+',
+            dtype=dtype, shape=tuple(lead_shape) + level_shape
+        )
+        for n, level_shape in enumerate(level_shapes) if n > 0
+    ]
+    level_0 = None
+    if not isinstance(image_processor.image_data, np.ndarray):
+        level_0 = np.lib.format.open_memmap(
+            os.path.join(pyramid_dir, 'level_0.npy'), mode='w+', dtype=dtype, shape=shape
+        )
+
+    for index, plane in image_processor.iter_planes():
+        if level_0 is not None:
+            level_0[index] = plane
+        for level in levels:
+            plane = downsample_block_mean(plane)
+            level[index] = plane
+    for level in levels + ([level_0] if level_0 is not None else []):
+        level.flush()
+
+    manifest = {
+        "tile_size": tile_size,
+        "dtype": str(dtype),
+        "levels": [list(level_shape) for level_shape in level_shapes],
+        "level0_stored": level_0 is not None,
+    }
+    # The manifest is written last and atomically, so it marks a complete pyramid
+    manifest_path = os.path.join(pyramid_dir, MANIFEST_NAME)
+    with open(manifest_path + '.part', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + '.part', manifest_path)
+    return manifest
+
+
+def load_pyramid_manifest(pyramid_dir):
+    """Returns the manifest of a complete pyramid, or None if none was built."""
+    try:
+        with open(os.path.join(pyramid_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def read_tile(image_processor, pyramid_dir, z, t, c, level, x, y):
+    """
+    Reads tile (x, y) of the (z, t, c) plane from the given pyramid level.
+    Tiles on the right/bottom edges may be smaller than the tile size.
+    Raises:
+        ValueError: If an index, the level or the tile coordinates are out of range.
+    """
+    index = image_processor.plane_index(z, t, c)
+    manifest = load_pyramid_manifest(pyramid_dir)
+    if manifest is None:
+        raise ValueError("No pyramid has been built for this image")
+    tile_size = manifest["tile_size"]
+    n_levels = len(manifest["levels"])
+    if not 0 <= level < n_levels:
+        raise ValueError(f"level {level} out of range [0, {n_levels})")
+
+    h, w = manifest["levels"][level]
+    n_x, n_y = -(-w // tile_size), -(-h // tile_size)
+    if not (0 <= x < n_x and 0 <= y < n_y):
+        raise ValueError(f"tile ({x}, {y}) out of range for level {level} ({n_x}x{n_y} tiles)")
+    rows = slice(y * tile_size, min((y + 1) * tile_size, h))
+    cols = slice(x * tile_size, min((x + 1) * tile_size, w))
+
+    if level == 0 and not manifest.get("level0_stored"):
+        # A view of arrays and memmaps; a TiffPageArray decodes just this plane
+        return np.array(image_processor.image_data[index + (rows, cols)])
+    data = np.load(os.path.join(pyramid_dir, f'level_{level}.npy'), mmap_mode='r')
+    return np.array(data[index][rows, cols])
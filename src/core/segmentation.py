@@ -4,10 +4,34 @@ Implements segmentation algorithms like Otsu thresholding or k-means.
 We can apply them to a specific slice or across entire channels.
 """
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+import os
 import numpy as np
 from skimage.filters import threshold_otsu
 from sklearn.cluster import KMeans
 
+# Pixels per vectorized batch of slices in batch_otsu_threshold; small
+# enough for the bin indices and histograms of a batch to stay in cache
+OTSU_BATCH_PIXELS = 1 << 17
+
+# Integer images whose value range fits in this many bins are clustered from
+# a bincount histogram and labelled through a lookup table
+KMEANS_LUT_MAX_BINS = 1 << 20
+
+# Intensities are grouped into at most this many bins for the exact
+# dynamic-programming k-means that seeds histogram_kmeans
+KMEANS_DP_BINS = 512
+
+# Default worker count for parallel segment_3d callers (e.g. ImageProcessor)
+SEGMENT_WORKERS = os.cpu_count() or 1
+
+# Default number of chunks per worker, so uneven slices still balance
+SEGMENT_CHUNKS_PER_WORKER = 4
+
+# Methods supported by segment_3d
+SEGMENT_METHODS = ('otsu', 'kmeans')
+
 def otsu_threshold(image_2d):
     """
     Applies Otsu's thresholding to a 2D image (NumPy array).
@@ -17,42 +41,434 @@ def otsu_threshold(image_2d):
     binary_mask = (image_2d >= thresh_val).astype(np.uint8)
     return binary_mask
 
-def kmeans_segmentation(image_2d, n_clusters=2):
+def _batch_histograms(slices, lo, hi, nbins):
+    """
+    Builds the histogram skimage's threshold_otsu uses for every row of a
+    (D, N) array of slices with a single bincount over row-offset bin indices:
+    one bin per value between the slice's min and max for integer data,
+    nbins equal-width bins (numpy.histogram's binning) for float data.
+    Shorter integer histograms are padded with empty bins.
+
+    Returns:
+        (counts, centers): (D, L) float32 counts and (D, L) bin centers
+    """
+    D = slices.shape[0]
+
+    if np.issubdtype(slices.dtype, np.integer):
+        start = lo.astype(np.intp)
+        L = int((hi.astype(np.intp) - start).max()) + 1
+        centers = start[:, None] + np.arange(L)
+        # Bin index plus row offset in one pass over the pixels
+        index = np.add(slices, (np.arange(D) * L - start)[:, None], dtype=np.intp,
+                       casting='unsafe')
+    else:
+        # Same edges and index arithmetic as numpy.histogram, one row per slice
+        uniform = lo == hi
+        start = np.where(uniform, lo - 0.5, lo)
+        stop = np.where(uniform, hi + 0.5, hi)
+        edges = np.linspace(start, stop, nbins + 1, endpoint=True, dtype=slices.dtype, axis=1)
+        centers = (edges[:, :-1] + edges[:, 1:]) / 2.0
+
+        # Bin estimate, then row offsets into (D, nbins + 1) edge tables
+        index = slices - start[:, None]
+        index /= (stop - start)[:, None]
+        index *= nbins
+        index = index.astype(np.intp)
+        np.minimum(index, nbins - 1, out=index)
+        index += (np.arange(D) * (nbins + 1))[:, None]
+
+        # Correct values within ~1 ULP of a bin edge against the edges
+        # themselves; the last bin's upper edge is inclusive
+        lower = edges.ravel()
+        upper = np.empty((D, nbins + 1), dtype=edges.dtype)
+        upper[:, :-1] = edges[:, 1:]
+        upper[:, -2:] = np.inf
+        index -= slices < np.take(lower, index)
+        index += slices >= np.take(upper.ravel(), index)
+        L = nbins + 1
+
+    counts = np.bincount(index.ravel(), minlength=D * L).reshape(D, L)
+    return counts[:, :centers.shape[1]].astype('float32'), centers
+
+
+def _otsu_dense(counts, centers):
+    """
+    Otsu thresholds from (D, L) histograms, with threshold_otsu's arithmetic
+    applied along the histogram axis of every row at once.
+    """
+    D = counts.shape[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # class probabilities and means for all possible thresholds
+        weight1 = np.cumsum(counts, axis=1)
+        weight2 = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1]
+        weighted = counts * centers
+        mean1 = np.cumsum(weighted, axis=1) / weight1
+        mean2 = (np.cumsum(weighted[:, ::-1], axis=1) / weight2[:, ::-1])[:, ::-1]
+        variance12 = weight1[:, :-1] * weight2[:, 1:] * (mean1[:, :-1] - mean2[:, 1:]) ** 2
+
+    # Padding bins past a slice's max (no pixels above them) are not candidates
+    variance12[weight2[:, 1:] == 0] = -np.inf
+    if not variance12.shape[1]:
+        return centers[:, 0]
+    return centers[np.arange(D), np.argmax(variance12, axis=1)]
+
+
+def _otsu_sparse(counts, centers):
+    """
+    Otsu thresholds from (D, L) integer-valued histograms, evaluated only at
+    the occupied bins of every row (all rows concatenated).
+
+    Across a run of empty bins the class weights and means do not change, so
+    the between-class variance repeats the value of the occupied bin that
+    starts the run, and argmax (first maximum) picks that bin. Cumulative sums
+    are taken as exact integers, which equal threshold_otsu's float sums as
+    long as those are exact too (checked by the caller), so the thresholds
+    are identical while the cost depends on the number of distinct values.
     """
-    Applies k-means to a 2D image by flattening it into a (H*W, 1) array,
-    clustering into n_clusters, and returning a label image reshaped to (H, W).
+    D = counts.shape[0]
+    rows, cols = np.nonzero(counts)
+    n = counts[rows, cols].astype(np.int64)
+    values = centers[rows, cols].astype(np.int64)
+
+    # Start of every row's run of occupied bins, and each entry's row offset
+    first = np.searchsorted(rows, np.arange(D))
+    last = np.append(first[1:], len(rows)) - 1
+
+    cum_n, cum_s = np.cumsum(n), np.cumsum(n * values)
+    before_n = np.append(0, cum_n)[first][rows]
+    before_s = np.append(0, cum_s)[first][rows]
+    below_n, below_s = cum_n - before_n, cum_s - before_s
+    total_n, total_s = cum_n[last][rows] - before_n, cum_s[last][rows] - before_s
+
+    # weight1/mean1 up to each occupied bin, weight2/mean2 from that bin up
+    weight1, sum1 = below_n.astype('float32'), below_s.astype(np.float64)
+    weight2 = (total_n - below_n + n).astype('float32')
+    sum2 = (total_s - below_s + n * values).astype(np.float64)
+    mean1, mean2 = sum1 / weight1, sum2 / weight2
+
+    variance12 = np.full(len(rows), -np.inf)
+    variance12[:-1] = weight1[:-1] * weight2[1:] * (mean1[:-1] - mean2[1:]) ** 2
+    # A row's last occupied bin is not a candidate (nothing above it)
+    variance12[last] = -np.inf
+
+    best = np.maximum.reduceat(variance12, first)
+    position = np.where(variance12 == best[rows], np.arange(len(rows)), len(rows))
+    return values[np.minimum.reduceat(position, first)]
+
+
+def _otsu_rows(slices, lo, hi, nbins):
+    """Otsu thresholds of every row of a (D, N) array (see batch_otsu_threshold)."""
+    counts, centers = _batch_histograms(slices, lo, hi, nbins)
+
+    # The sparse form needs threshold_otsu's float32 pixel counts and float64
+    # weighted sums to be exact integers
+    exact = (np.issubdtype(slices.dtype, np.integer) and slices.shape[1] < 1 << 24
+             and slices.shape[1] * max(abs(int(lo.min())), abs(int(hi.max()))) < 1 << 53)
+    thresholds = _otsu_sparse(counts, centers) if exact else _otsu_dense(counts, centers)
+
+    # Like threshold_otsu, a single-valued slice is thresholded at that value
+    return np.where(lo == hi, lo, thresholds)
+
+
+def batch_otsu_threshold(volume, nbins=256, batch_pixels=OTSU_BATCH_PIXELS):
+    """
+    Computes Otsu's threshold for every 2D slice of a (D, H, W) volume.
+    Slices are processed in batches of about batch_pixels pixels: each
+    batch's histograms are built in one vectorized bincount and its
+    thresholds are found with array math along the histogram axis.
+    The thresholds are identical to skimage's threshold_otsu on each slice.
+
+    Returns:
+        numpy.ndarray: (D,) thresholds
+    """
+    D = volume.shape[0]
+    slices = np.asarray(volume).reshape(D, -1)
+    lo, hi = slices.min(axis=1), slices.max(axis=1)
+
+    # A batch holds about batch_pixels pixels, or histogram bins for integer
+    # slices whose value range is wider than their pixel count
+    width = max(slices.shape[1], 1)
+    if np.issubdtype(slices.dtype, np.integer):
+        width = max(width, int((hi.astype(np.intp) - lo.astype(np.intp)).max()) + 1)
+    elif nbins > width:
+        width = nbins
+    step = max(1, batch_pixels // width)
+    return np.concatenate([_otsu_rows(slices[first:first + step], lo[first:first + step],
+                                      hi[first:first + step], nbins)
+                           for first in range(0, D, step)])
+
+
+def batch_otsu_masks(volume, nbins=256, out=None):
+    """
+    Applies Otsu's thresholding to every 2D slice of a (D, H, W) volume,
+    with all thresholds computed together (see batch_otsu_threshold) and
+    the masks produced by a single broadcast comparison.
+    Returns a (D, H, W) uint8 mask volume, identical to otsu_threshold per slice,
+    written into out if given.
+    """
+    volume = np.asarray(volume)
+    # Thresholds are values within each slice's range, so exact in the image dtype,
+    # which keeps the comparison from upcasting the whole volume
+    thresholds = batch_otsu_threshold(volume, nbins).astype(volume.dtype)
+    if out is None:
+        out = np.empty(volume.shape, dtype=np.uint8)
+    np.greater_equal(volume, thresholds[:, None, None], out=out.view(np.bool_))
+    return out
+
+def _intensity_histogram(image_2d):
+    """
+    Distinct intensities of an integer image with their pixel counts, and
+    the image offset by its minimum for a lookup table (None if not built).
+
+    Value ranges up to KMEANS_LUT_MAX_BINS wide are counted with a bincount;
+    wider ranges fall back to np.unique.
+    """
+    lo, hi = int(image_2d.min()), int(image_2d.max())
+    if hi - lo < KMEANS_LUT_MAX_BINS:
+        offset = image_2d.astype(np.int64) - lo
+        counts = np.bincount(offset.ravel())
+        values = np.flatnonzero(counts)
+        return values + lo, counts[values], offset
+    values, counts = np.unique(image_2d, return_counts=True)
+    return values.astype(np.int64), counts, None
+
+
+def _optimal_centers(values, counts, n_clusters):
+    """
+    Globally optimal 1D k-means centroids for weighted points, by dynamic
+    programming over contiguous runs of the sorted points. Runs with more
+    than KMEANS_DP_BINS points are first grouped into that many equal-width
+    bins, so the result is then the optimum at bin resolution.
+    """
+    values = values.astype(np.float64)
+    weights = counts.astype(np.float64)
+    if len(values) > KMEANS_DP_BINS:
+        span = values[-1] - values[0]
+        group = np.minimum(((values - values[0]) / span * KMEANS_DP_BINS).astype(np.intp),
+                           KMEANS_DP_BINS - 1)
+        sums = np.bincount(group, weights * values, minlength=KMEANS_DP_BINS)
+        grouped = np.bincount(group, weights, minlength=KMEANS_DP_BINS)
+        occupied = grouped > 0
+        if occupied.sum() < n_clusters:
+            # Too few occupied bins: spread the centroids over the distinct values
+            return values[np.linspace(0, len(values) - 1, n_clusters).round().astype(int)]
+        weights, values = grouped[occupied], sums[occupied] / grouped[occupied]
+    n = len(values)
+
+    # Within-cluster sum of squares of every run [j, i] from prefix sums
+    # (centered to limit cancellation); inf for j > i
+    centered = values - np.average(values, weights=weights)
+    W = np.concatenate([[0], np.cumsum(weights)])
+    S = np.concatenate([[0], np.cumsum(weights * centered)])
+    Q = np.concatenate([[0], np.cumsum(weights * centered ** 2)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        size = W[1:][None, :] - W[:-1][:, None]
+        total = S[1:][None, :] - S[:-1][:, None]
+        cost = Q[1:][None, :] - Q[:-1][:, None] - total ** 2 / size
+    cost[np.tril_indices(n, -1)] = np.inf
+
+    # best[i]: lowest cost of points 0..i in m clusters; split[m][i]: start of the last one
+    best, splits = cost[0], []
+    for _ in range(n_clusters - 1):
+        candidates = best[:-1, None] + cost[1:, :]
+        split = np.argmin(candidates, axis=0)
+        best = candidates[split, np.arange(n)]
+        splits.append(split + 1)
+
+    centers, end = [], n - 1
+    for split in reversed(splits):
+        start = split[end]
+        centers.append(np.average(values[start:end + 1], weights=weights[start:end + 1]))
+        end = start - 1
+    centers.append(np.average(values[:end + 1], weights=weights[:end + 1]))
+    return np.array(centers[::-1])
+
+
+def histogram_kmeans(values, counts, n_clusters, init=None, max_iter=300):
+    """
+    Lloyd's k-means on 1D intensities weighted by their pixel counts.
+
+    values must be sorted and distinct. With sorted centroids every cluster
+    is a contiguous run of values split at the midpoints between centroids,
+    so an iteration is a searchsorted plus differences of prefix sums, and
+    the cost depends on the number of distinct values, not pixels.
+    Iterates until the assignment no longer changes (or max_iter); if a
+    warm start (init) leaves a cluster empty, restarts from _optimal_centers.
+
+    Returns:
+        numpy.ndarray: (n_clusters,) centroids in ascending order
+    """
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.concatenate([[0], np.cumsum(counts, dtype=np.float64)])
+    sums = np.concatenate([[0], np.cumsum(counts * values)])
+
+    warm = init is not None and len(init) == n_clusters
+    if warm:
+        centers = np.sort(np.asarray(init, dtype=np.float64).ravel())
+    else:
+        centers = _optimal_centers(values, counts, n_clusters)
+
+    bounds = None
+    for _ in range(max_iter):
+        # Ties at a midpoint go to the lower centroid, like KMeans' argmin
+        new_bounds = np.searchsorted(values, (centers[:-1] + centers[1:]) / 2, side='right')
+        if bounds is not None and np.array_equal(new_bounds, bounds):
+            break
+        bounds = new_bounds
+        edges = np.concatenate([[0], bounds, [len(values)]])
+        size = weights[edges[1:]] - weights[edges[:-1]]
+        total = sums[edges[1:]] - sums[edges[:-1]]
+        centers = np.where(size > 0, total / np.maximum(size, 1), centers)
+
+    if warm and np.any(size == 0):
+        return histogram_kmeans(values, counts, n_clusters, max_iter=max_iter)
+    return centers
+
+
+def kmeans_segmentation(image_2d, n_clusters=2, init=None, return_centers=False):
+    """
+    Applies k-means to the intensities of a 2D image and returns a (H, W)
+    label image, with labels ordered by ascending centroid intensity.
+
+    Integer images are clustered on their intensity histogram
+    (histogram_kmeans) and labelled through a lookup table; float images
+    use sklearn's KMeans on the flattened (H*W, 1) pixels.
+    init optionally warm-starts from n_clusters centroids (e.g. those of the
+    previous slice); return_centers also returns the fitted centroids.
     """
     H, W = image_2d.shape
-    flattened = image_2d.reshape(-1, 1).astype(np.float32)
 
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    kmeans.fit(flattened)
-    labels = kmeans.labels_
+    if np.issubdtype(image_2d.dtype, np.integer):
+        values, counts, offset = _intensity_histogram(image_2d)
+        if len(values) <= n_clusters:
+            centers = values.astype(np.float64)
+        else:
+            centers = histogram_kmeans(values, counts, n_clusters, init=init)
 
-    segmented = labels.reshape(H, W)
+        # Label of a value: number of centroid midpoints below it
+        midpoints = (centers[:-1] + centers[1:]) / 2
+        if offset is not None:
+            lut = np.searchsorted(midpoints, np.arange(values[0], values[-1] + 1), side='left')
+            segmented = lut.astype(np.int32)[offset]
+        else:
+            segmented = np.searchsorted(midpoints, image_2d, side='left').astype(np.int32)
+    else:
+        flattened = image_2d.reshape(-1, 1).astype(np.float32)
+
+        if init is None or len(init) != n_clusters:
+            kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+        else:
+            kmeans = KMeans(n_clusters=n_clusters, init=np.reshape(init, (-1, 1)), n_init=1)
+        kmeans.fit(flattened)
+
+        order = np.argsort(kmeans.cluster_centers_.ravel())
+        rank = np.empty(n_clusters, dtype=np.int32)
+        rank[order] = np.arange(n_clusters)
+        centers = kmeans.cluster_centers_.ravel()[order].astype(np.float64)
+        segmented = rank[kmeans.labels_].reshape(H, W)
+
+    if return_centers:
+        return segmented, centers
     return segmented
 
-def segment_3d(image_3d, method='otsu', **kwargs):
+def _segment_slices(image_3d, output, method, kwargs):
+    """Segments a (D, H, W) stack into the preallocated (D, H, W) uint8 output."""
+    if method == 'otsu':
+        # All slices are thresholded together, see batch_otsu_masks
+        batch_otsu_masks(image_3d, out=output)
+        return
+
+    centers = None
+    n_clusters = kwargs.get('n_clusters', 2)
+    for i in range(image_3d.shape[0]):
+        # Neighbouring slices have similar intensities, so each slice
+        # starts from the previous slice's centroids
+        output[i], centers = kmeans_segmentation(image_3d[i], n_clusters=n_clusters,
+                                                 init=centers, return_centers=True)
+
+
+def _segment_shared(image_name, output_name, shape, dtype, start, stop, method, kwargs):
+    """
+    Process pool task: segments slices start:stop of a volume held in shared
+    memory, writing the masks into the shared output volume.
+    """
+    image_shm = shared_memory.SharedMemory(name=image_name)
+    output_shm = shared_memory.SharedMemory(name=output_name)
+    try:
+        image = np.ndarray(shape, dtype=dtype, buffer=image_shm.buf)
+        output = np.ndarray(shape, dtype=np.uint8, buffer=output_shm.buf)
+        _segment_slices(image[start:stop], output[start:stop], method, kwargs)
+        del image, output
+    finally:
+        image_shm.close()
+        output_shm.close()
+
+
+def _segment_processes(image_3d, output, chunks, workers, method, kwargs):
+    """
+    Runs the chunks on a process pool. The volume is copied once into shared
+    memory and workers write their masks into a shared output volume, so no
+    slices or masks are pickled.
+    """
+    image_shm = shared_memory.SharedMemory(create=True, size=max(image_3d.nbytes, 1))
+    output_shm = shared_memory.SharedMemory(create=True, size=max(output.nbytes, 1))
+    try:
+        shared = np.ndarray(image_3d.shape, dtype=image_3d.dtype, buffer=image_shm.buf)
+        shared[...] = image_3d
+        del shared
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_segment_shared, image_shm.name, output_shm.name,
+                                   image_3d.shape, image_3d.dtype, start, stop, method, kwargs)
+                       for start, stop in chunks]
+            for future in futures:
+                future.result()
+        output[...] = np.ndarray(output.shape, dtype=np.uint8, buffer=output_shm.buf)
+    finally:
+        image_shm.close()
+        image_shm.unlink()
+        output_shm.close()
+        output_shm.unlink()
+
+
+def segment_3d(image_3d, method='otsu', workers=1, executor='thread', chunk_size=None, **kwargs):
     """
     Convenience function to apply segmentation slice-by-slice for a 3D volume 
     (e.g. Z, H, W) or (T, H, W).
 
     'method' can be 'otsu' or 'kmeans'. You can extend for more methods.
 
+    With workers > 1, chunks of chunk_size consecutive slices (by default
+    SEGMENT_CHUNKS_PER_WORKER chunks per worker) are segmented in parallel
+    on a 'thread' pool (numpy releases the GIL) or a 'process' pool (via
+    shared memory). Every chunk writes straight into the output volume.
+    k-means warm starts (see kmeans_segmentation) restart at each chunk.
+
     Returns a segmented 3D array of the same shape.
     """
+    if method not in SEGMENT_METHODS:
+        raise ValueError(f"Unknown segmentation method: {method}")
+    if executor not in ('thread', 'process'):
+        raise ValueError(f"Unknown executor: {executor}")
+
     D, H, W = image_3d.shape
-    output = np.zeros((D, H, W), dtype=np.uint8)
-
-    for i in range(D):
-        slice_2d = image_3d[i, :, :]
-        if method == 'otsu':
-            mask = otsu_threshold(slice_2d)
-        elif method == 'kmeans':
-            n_clusters = kwargs.get('n_clusters', 2)
-            mask = kmeans_segmentation(slice_2d, n_clusters=n_clusters)
-        else:
-            raise ValueError(f"Unknown segmentation method: {method}")
-        output[i] = mask
+    output = np.empty((D, H, W), dtype=np.uint8)
+    if workers <= 1 or D <= 1:
+        _segment_slices(image_3d, output, method, kwargs)
+        return output
+
+    if chunk_size is None:
+        chunk_size = -(-D // (workers * SEGMENT_CHUNKS_PER_WORKER))
+    chunks = [(start, min(start + chunk_size, D)) for start in range(0, D, chunk_size)]
+    workers = min(workers, len(chunks))
+
+    if executor == 'process':
+        _segment_processes(np.asarray(image_3d), output, chunks, workers, method, kwargs)
+        return output
 
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_segment_slices, image_3d[start:stop], output[start:stop],
+                               method, kwargs)
+                   for start, stop in chunks]
+        for future in futures:
+            future.result()
     return output
@@ -0,0 +1,228 @@
+"""
+tiff_reader.py
+Lazy access to multi-dimensional TIFF files on disk.
+Uncompressed, contiguous data is memory-mapped; everything else is exposed
+through an array-like object that decodes individual TIFF pages on demand.
+"""
+
+import os
+import numpy as np
+import tifffile
+from tifffile import TiffFile
+
+
+def normalize_shape(shape):
+    """
+    Applies the same dimension expansion ImageProcessor uses for eagerly
+    loaded data: anything below 5D gets a single leading axis.
+    """
+    shape = tuple(shape)
+    if len(shape) < 5:
+        shape = (1,) + shape
+    return shape
+
+
+def shape_metadata(shape, dtype):
+    """
+    Builds the basic metadata dict for an image of the given (normalized)
+    shape and dtype, e.g. shape (Z, T, C, H, W).
+    """
+    shape = tuple(int(n) for n in shape)
+    return {
+        "dtype": str(np.dtype(dtype)),
+        "shape": shape,
+        "Z": shape[0],
+        "T": shape[1] if len(shape) > 1 else 1,
+        "Channels": shape[2] if len(shape) > 2 else 1,
+        "Height": shape[3] if len(shape) > 3 else 1,
+        "Width": shape[4] if len(shape) > 4 else 1
+    }
+
+
+def _json_safe(value):
+    """
+    Converts TIFF tag values (NumPy scalars/arrays, tuples, nested dicts)
+    into JSON-serializable Python objects. Raw byte blobs are dropped.
+    """
+    if isinstance(value, dict):
+        return {str(k): _json_safe(v) for k, v in value.items()
+                if not isinstance(v, (bytes, bytearray))}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (bytes, bytearray)):
+        return None
+    return value
+
+
+def read_tiff_metadata(file_path):
+    """
+    Reads image metadata from the TIFF headers and series description only,
+    without decoding any pixel data.
+
+    Returns:
+        dict with the same keys as ImageProcessor.get_metadata() plus
+        axes, compression, tiling, byte sizes and ImageJ/OME metadata.
+    """
+    with TiffFile(file_path) as tif:
+        series = tif.series[0]
+        page = series.keyframe
+        shape = normalize_shape(series.shape)
+        metadata = shape_metadata(shape, series.dtype)
+        metadata.update({
+            "axes": 'Q' * (len(shape) - len(series.axes)) + series.axes,
+            "compression": page.compression.name,
+            "tiled": bool(page.is_tiled),
+            "tile_shape": [page.tilelength, page.tilewidth] if page.is_tiled else None,
+            "pages": len(series),
+            "nbytes": int(series.nbytes),
+            "file_size": os.path.getsize(file_path),
+            "imagej": _json_safe(tif.imagej_metadata) if tif.is_imagej else None,
+            "ome_xml": tif.ome_metadata if tif.is_ome else None,
+        })
+        return metadata
+
+
+class TiffPageArray:
+    """
+    Read-only, array-like view over the first page series of an open TiffFile.
+
+    Only the leading (non-plane) dimensions are indexed lazily: indexing maps
+    each requested leading index to its TIFF page and decodes just those pages.
+    Integer lists on leading axes select an outer product of indices.
+    Converting the whole object with np.asarray() decodes every page.
+    """
+
+    def __init__(self, tif, series_index=0):
+        self._tif = tif
+        self._series = tif.series[series_index]
+        self._pages = self._series.pages
+        # Pages may be read from several threads (e.g. concurrent requests)
+        tif.filehandle.set_lock(True)
+
+        self.dtype = np.dtype(self._series.dtype)
+        self.shape = normalize_shape(self._series.shape)
+        self.ndim = len(self.shape)
+        # Series axes, padded with 'Q' (unknown) for any added leading axis
+        self.axes = 'Q' * (self.ndim - len(self._series.axes)) + self._series.axes
+        self.page_shape = tuple(self._series.keyframe.shape)
+        self.page_ndim = len(self.page_shape)
+        self.lead_shape = self.shape[:self.ndim - self.page_ndim]
+
+        if (self.shape[self.ndim - self.page_ndim:] != self.page_shape
+                or len(self._pages) != int(np.prod(self.lead_shape))):
+            raise ValueError("TIFF series pages do not map one-to-one onto planes")
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def page_index(self, lead_index):
+        """
+        Maps a tuple of leading indices (e.g. (z, t, c) for 5D data)
+        to the index of the TIFF page that stores that plane.
+        Pages are stored in C order over the leading series axes
+        (e.g. 'ZTC' of 'ZTCYX'), so this is a ravel over those axes.
+        Raises IndexError if any index is out of range.
+        """
+        return int(np.ravel_multi_index(tuple(lead_index), self.lead_shape))
+
+    def read_page(self, page_index):
+        """Decodes a single TIFF page into a NumPy array."""
+        page = self._pages[page_index]
+        return page.asarray(lock=self._tif.filehandle.lock)
+
+    def read_plane(self, index):
+        """
+        Decodes the single page that holds the plane at `index`
+        (e.g. (z, t, c) for 5D data) and returns that plane.
+        If a page stores more than one plane (e.g. samples interpreted as
+        a trailing axis), the remaining indices are applied to the page.
+        """
+        index = tuple(index)
+        n_lead = len(self.lead_shape)
+        page = self.read_page(self.page_index(index[:n_lead]))
+        return page[index[n_lead:]]
+
+    def _expand_key(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is None for k in key):
+            raise IndexError("np.newaxis is not supported by TiffPageArray")
+        n_ellipsis = sum(1 for k in key if k is Ellipsis)
+        if n_ellipsis > 1:
+            raise IndexError("an index can only have a single ellipsis ('...')")
+        if n_ellipsis:
+            pos = key.index(Ellipsis)
+            fill = (slice(None),) * (self.ndim - len(key) + 1)
+            key = key[:pos] + fill + key[pos + 1:]
+        if len(key) > self.ndim:
+            raise IndexError(
+                f"too many indices for array: array is {self.ndim}-dimensional, "
+                f"but {len(key)} were indexed"
+            )
+        return key + (slice(None),) * (self.ndim - len(key))
+
+    def __getitem__(self, key):
+        key = self._expand_key(key)
+        n_lead = len(self.lead_shape)
+        lead_key, plane_key = key[:n_lead], key[n_lead:]
+
+        # Resolve each leading index into the positions it selects
+        selected = [np.arange(n)[k] for n, k in zip(self.lead_shape, lead_key)]
+        out_lead_shape = tuple(s.shape[0] for s in selected if s.ndim == 1)
+        grids = np.meshgrid(*[np.atleast_1d(s) for s in selected], indexing='ij')
+        page_indices = np.ravel_multi_index(
+            tuple(g.ravel() for g in grids), self.lead_shape
+        )
+
+        planes = [self.read_page(int(i))[plane_key] for i in page_indices]
+        if not planes:
+            plane_shape = np.empty(self.page_shape, dtype=self.dtype)[plane_key].shape
+            return np.empty(out_lead_shape + plane_shape, dtype=self.dtype)
+        plane_shape = planes[0].shape
+        out = np.empty((len(planes),) + plane_shape, dtype=self.dtype)
+        for i, plane in enumerate(planes):
+            out[i] = plane
+        out = out.reshape(out_lead_shape + plane_shape)
+        return out[()] if out.ndim == 0 else out
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
+
+
+def open_tiff_array(file_path):
+    """
+    Opens the first series of a TIFF file without decoding its pixels.
+
+    Returns:
+        (array, tif): a NumPy memmap when the data is uncompressed and
+        contiguous, otherwise a TiffPageArray; plus the TiffFile that backs
+        it (None for memmaps), which the caller is responsible for closing.
+        Both array types are shaped like ImageProcessor data, e.g. (Z, T, C, H, W).
+    """
+    try:
+        data = tifffile.memmap(file_path, series=0, mode='r')
+        return data.reshape(normalize_shape(data.shape)), None
+    except ValueError:
+        pass  # Compressed, tiled or non-native data: fall back to page access
+
+    tif = TiffFile(file_path)
+    try:
+        return TiffPageArray(tif), tif
+    except Exception:
+        tif.close()
+        raise
@@ -3,20 +3,31 @@ database.py
 Sets up the SQLAlchemy engine, SessionLocal, and Base for the Vercel Postgres DB.
 """
 
+import logging
 import os
+import threading
+from contextlib import contextmanager
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 # Read the database URL from environment variable (replace as needed)
 DATABASE_URL = os.environ.get("VERCEL_POSTGRES_URL")
 
+logger = logging.getLogger(__name__)
+
 if not DATABASE_URL:
-    # Handle the case where the env variable is not set
-    # Provide a fallback or raise an error
-    raise ValueError("No VERCEL_POSTGRES_URL found in environment variables.")
+    # Handle the case where the env variable is not set: fall back to
+    # DATABASE_URL (e.g. sqlite:///hdimage.db for development)
+    DATABASE_URL = os.environ.get("DATABASE_URL")
 
-# Create the SQLAlchemy engine
-engine = create_engine(DATABASE_URL, echo=False)
+if DATABASE_URL:
+    # Create the SQLAlchemy engine
+    engine = create_engine(DATABASE_URL, echo=False)
+else:
+    # No implicit local database: the API runs without one (sessions fail,
+    # see init_db) rather than writing to a file nobody configured
+    engine = None
+    logger.warning("Neither VERCEL_POSTGRES_URL nor DATABASE_URL is set: running without a database")
 
 # Create a configured 'Session' class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -24,6 +35,14 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Base class for declarative models
 Base = declarative_base()
 
+class DatabaseUnavailable(RuntimeError):
+    """Raised by init_db (and so session_scope) when no database is configured."""
+
+
+# Whether init_db() has created the tables in this process
+_schema_ready = False
+_schema_lock = threading.Lock()
+
 def get_db_session():
     """
     Dependency or helper function to provide a database session.
@@ -34,3 +53,40 @@ def get_db_session():
         yield db
     finally:
         db.close()
+
+
+@contextmanager
+def session_scope():
+    """
+    Provides a session for a unit of work: committed on success,
+    rolled back on error, and closed either way.
+    Creates the tables first if that has not succeeded yet (see init_db).
+    """
+    init_db()
+    db = SessionLocal()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def init_db():
+    """
+    Creates any missing tables for the models in src.db.models, once per
+    process: after a failure (e.g. the database is unreachable) the next
+    call, or the next session_scope(), tries again.
+    Raises DatabaseUnavailable if no database is configured.
+    """
+    global _schema_ready
+    if engine is None:
+        raise DatabaseUnavailable("No database configured: set VERCEL_POSTGRES_URL or DATABASE_URL")
+    with _schema_lock:
+        if _schema_ready:
+            return
+        from . import models  # noqa: F401 (registers the models on Base)
+        Base.metadata.create_all(bind=engine)
+        _schema_ready = True
@@ -4,7 +4,9 @@ Defines SQLAlchemy models (tables) for storing image metadata, analysis results,
 """
 
 import datetime
-from sqlalchemy import Column, String, DateTime, JSON
+from sqlalchemy import (
+    BigInteger, Column, DateTime, Float, ForeignKey, Integer, JSON, String, UniqueConstraint
+)
 from .database import Base
 
 class ImageMetadata(Base):
@@ -22,3 +24,31 @@ class ImageMetadata(Base):
 
     def __repr__(self):
         return f"<ImageMetadata(image_id={self.image_id}, dtype={self.dtype}, shape={self.shape})>"
+
+
+class PlaneStatistics(Base):
+    """
+    Stores the statistics of one 2D (z, t, c) plane of an image, computed at ingest.
+    'z' is NULL for 4D images. Besides min and max, each row keeps the pixel
+    count, mean and 'm2' (sum of squared deviations from the mean), so any
+    selection of planes (e.g. one timepoint) can be merged into exact
+    per-channel mean and std without reading pixels.
+    """
+    __tablename__ = 'plane_statistics'
+    __table_args__ = (UniqueConstraint('image_id', 'z', 't', 'c'),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    image_id = Column(String, ForeignKey('image_metadata.image_id', ondelete='CASCADE'),
+                      nullable=False, index=True)
+    z = Column(Integer, nullable=True)
+    t = Column(Integer, nullable=False)
+    c = Column(Integer, nullable=False)
+    count = Column(BigInteger, nullable=False)
+    mean = Column(Float, nullable=False)
+    m2 = Column(Float, nullable=False)
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+
+    def __repr__(self):
+        return (f"<PlaneStatistics(image_id={self.image_id}, z={self.z}, t={self.t}, "
+                f"c={self.c}, mean={self.mean})>")
@@ -0,0 +1,60 @@
+"""
+statistics.py
+Stores and queries the per-plane image statistics computed at ingest
+(see PlaneStatistics in models.py).
+"""
+
+from sqlalchemy import delete, or_, select
+from .models import ImageMetadata, PlaneStatistics
+
+# Columns of a plane statistics record, as produced by ImageProcessor.get_plane_statistics
+RECORD_COLUMNS = ('z', 't', 'c', 'count', 'mean', 'm2', 'min', 'max')
+
+
+def save_image_statistics(session, image_id, metadata, records):
+    """
+    Replaces the stored metadata (dtype, shape) and plane statistics of an image.
+
+    Args:
+        session: SQLAlchemy session (the caller commits)
+        image_id (str): ID of the image
+        metadata (dict): ImageProcessor metadata, with 'dtype' and 'shape'
+        records (list): per-plane statistics records
+    """
+    delete_image_statistics(session, image_id)
+    session.merge(ImageMetadata(
+        image_id=image_id, dtype=metadata["dtype"], shape=list(metadata["shape"])
+    ))
+    session.flush()
+    session.bulk_insert_mappings(
+        PlaneStatistics, [dict(record, image_id=image_id) for record in records]
+    )
+
+
+def delete_image_statistics(session, image_id):
+    """Removes the stored plane statistics of an image."""
+    session.execute(delete(PlaneStatistics).where(PlaneStatistics.image_id == image_id))
+
+
+def has_image_statistics(session, image_id):
+    """Returns True if plane statistics are stored for an image."""
+    query = select(PlaneStatistics.id).where(PlaneStatistics.image_id == image_id).limit(1)
+    return session.execute(query).first() is not None
+
+
+def load_plane_statistics(session, image_id, z=None, t=None, c=None):
+    """
+    Returns the stored plane statistics records of an image, optionally
+    restricted to one z, t and/or c. The z filter matches every plane of a
+    4D image, whose planes have no z.
+    """
+    query = select(*[getattr(PlaneStatistics, name) for name in RECORD_COLUMNS]).where(
+        PlaneStatistics.image_id == image_id
+    )
+    if z is not None:
+        query = query.where(or_(PlaneStatistics.z == z, PlaneStatistics.z.is_(None)))
+    if t is not None:
+        query = query.where(PlaneStatistics.t == t)
+    if c is not None:
+        query = query.where(PlaneStatistics.c == c)
+    return [dict(row._mapping) for row in session.execute(query)]
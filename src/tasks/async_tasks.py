@@ -5,34 +5,45 @@ Defines Celery tasks for long-running or large image operations (e.g., PCA, segm
 
 import os
 import numpy as np
+from . import backends, pipelines
 from .celery_app import celery
-from src.core.image_processor import ImageProcessor
-from src.api.routes import IMAGE_STORE, IMAGE_PROCESSOR_STORE  # If you want to re-use in-memory data
+from src.api.routes import IMAGE_STORE, JOB_STORE, PCA_MODEL_STORE, get_image_processor  # Shared with the API through the spool directory
+from src.api.routes.upload import publish_and_ingest
+from src.core import jobs
+from src.core.objects import format_objects
+from src.core.pca_cache import run_cached_pca
+from src.utils.pca_utils import COVARIANCE_PCA_MAX_FEATURES
 # Or import a DB function if you store images in a database
 # from src.db.database import SessionLocal
 # from src.db.models import ImageMetadata
 
-@celery.task(name='heavy_pca')
-def heavy_pca(image_id, n_components=3):
+@celery.task(name='heavy_pca', bind=True)
+def heavy_pca(self, image_id, n_components=3):
     """
     A Celery task that runs PCA on an image in the background.
     :param image_id: The identifier of the image to process
     :param n_components: Number of PCA components
     :return: The shape of the PCA result or partial data
     """
-    # In a real-world scenario, you'd load the image from DB or storage.
-    # For demonstration, we'll pull from the in-memory store.
+    # IMAGE_STORE lives in the spool directory, so uploads made through
+    # the API are visible here, in the worker process.
     if image_id not in IMAGE_STORE:
         return {"error": f"Image '{image_id}' not found"}
 
-    # Use or recreate the ImageProcessor
-    if image_id not in IMAGE_PROCESSOR_STORE:
-        ip = ImageProcessor(IMAGE_STORE[image_id])
-        IMAGE_PROCESSOR_STORE[image_id] = ip
-    else:
-        ip = IMAGE_PROCESSOR_STORE[image_id]
+    # Maps the pixels published at upload (no copy, no decode) if there are any
+    ip = get_image_processor(image_id)
 
-    pca_result = ip.run_pca(n_components)
+    # With Celery workers, fit the covariance across all of them first
+    # (see pipelines.pca_pipeline), then come back here for the projection
+    if (backends.TASK_BACKEND == 'celery'
+            and ip.image_data.shape[-3] <= COVARIANCE_PCA_MAX_FEATURES
+            and PCA_MODEL_STORE.get_model(image_id, 'covariance', n_components) is None):
+        signature, _ = pipelines.pca_chord(image_id, n_components)
+        return pipelines.replace_task(self, signature | heavy_pca.si(image_id, n_components))
+
+    # Background jobs handle the largest stacks, so always fit out of core.
+    # Cached models/results are reused, so repeat jobs skip the fit.
+    pca_result, _ = run_cached_pca(ip, image_id, PCA_MODEL_STORE, n_components, chunked=True)
     result_shape = pca_result.shape
 
     # Optionally, store or log the result somewhere persistent
@@ -60,11 +71,7 @@ def heavy_segmentation(image_id, z=0, t=0, c=0, method='otsu', **kwargs):
         return {"error": f"Image '{image_id}' not found"}
 
     # Use or recreate the ImageProcessor
-    if image_id not in IMAGE_PROCESSOR_STORE:
-        ip = ImageProcessor(IMAGE_STORE[image_id])
-        IMAGE_PROCESSOR_STORE[image_id] = ip
-    else:
-        ip = IMAGE_PROCESSOR_STORE[image_id]
+    ip = get_image_processor(image_id)
 
     slice_2d = ip.get_slice(z, t, c)
 
@@ -91,3 +98,52 @@ def heavy_segmentation(image_id, z=0, t=0, c=0, method='otsu', **kwargs):
         }
     else:
         return {"error": f"Unknown segmentation method '{method}'"}
+
+@celery.task(name='measure_objects')
+def measure_objects(image_id, t=0, c=0, method='otsu', across_time=False, connectivity=1,
+                    **kwargs):
+    """
+    Labels the connected objects of a channel in 3D (across Z, optionally T)
+    and measures them.
+    :param image_id: The identifier of the image to process
+    :param t, c: Time and channel to segment (t is ignored with across_time)
+    :param method: 'otsu' or 'kmeans'
+    :param kwargs: Additional parameters for the method (e.g. n_clusters)
+    :return: Per-object label, volume, centroid, bbox and mean_intensity columns
+    """
+    if image_id not in IMAGE_STORE:
+        return {"error": f"Image '{image_id}' not found"}
+
+    ip = get_image_processor(image_id)
+    measurements, axes = ip.measure_objects(t=t, c=c, method=method, across_time=across_time,
+                                            connectivity=connectivity, **kwargs)
+    result = format_objects(measurements, axes)
+    result.update({"image_id": image_id, "channel": c, "method": method})
+    return result
+
+@celery.task(name='run_job', bind=True)
+def run_job(self, job_id):
+    """
+    Runs a job submitted through POST /jobs, or the ingest job of an
+    upload (see src.core.jobs).
+    Progress, cancellation and the result arrays go through JOB_STORE,
+    so only the job's final status travels through the result backend.
+    With the Celery task backend, the jobs that have a pipeline are
+    replaced by it, so their chunks run on every worker (see
+    src.tasks.pipelines.job_pipeline).
+    :param job_id: The identifier of a pending job in JOB_STORE
+    :return: The job's final status
+    """
+    job = JOB_STORE.get(job_id)
+    if job is None:
+        raise KeyError(job_id)
+    if backends.TASK_BACKEND == 'celery':
+        try:
+            pipeline = pipelines.job_pipeline(job)
+        except Exception:
+            pipeline = None  # jobs.run_job records why the image cannot be opened
+        if pipeline is not None:
+            return pipelines.run_pipeline_job(self, job_id, pipeline)
+    job = jobs.run_job(JOB_STORE, job_id, get_image_processor, PCA_MODEL_STORE,
+                       ingest=publish_and_ingest)
+    return {"job_id": job_id, "status": job["status"], "error": job["error"]}
@@ -0,0 +1,182 @@
+"""
+backends.py
+Where the API runs its background tasks: on Celery workers through the
+broker, or in a local thread or process pool when there is no broker.
+
+Every backend runs the same registered Celery tasks (by name) and exposes
+the same submit / status / result / cancel interface, so routes can hand
+work off without holding a request thread, whichever backend is configured.
+"""
+
+import importlib
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from .celery_app import celery
+from src.core.jobs import JOB_CANCELLED, JOB_FAILED, JOB_PENDING, JOB_RUNNING, JOB_SUCCEEDED
+
+# 'celery' sends tasks to the broker, 'thread' or 'process' runs them in a
+# local pool of the API process. Always this setting, never guessed from
+# CELERY_BROKER_URL: deployments with workers set TASK_BACKEND=celery.
+TASK_BACKEND = os.environ.get('TASK_BACKEND', 'thread')
+TASK_BACKENDS = ('celery', 'thread', 'process')
+
+# Workers of the local pool (default: the executor's own default)
+LOCAL_TASK_WORKERS = int(os.environ.get('LOCAL_TASK_WORKERS', 0)) or None
+
+# Finished local tasks whose status and result are kept for lookups
+LOCAL_TASK_HISTORY = int(os.environ.get('LOCAL_TASK_HISTORY', 1000))
+
+# Celery task states, in the backends' common status words (those of jobs)
+_CELERY_STATES = {
+    'PENDING': JOB_PENDING,
+    'RECEIVED': JOB_PENDING,
+    'STARTED': JOB_RUNNING,
+    'RETRY': JOB_RUNNING,
+    'SUCCESS': JOB_SUCCEEDED,
+    'FAILURE': JOB_FAILED,
+    'REVOKED': JOB_CANCELLED,
+}
+
+
+def _task(name):
+    """The registered Celery task called name, importing the task modules first."""
+    for module in celery.conf.include:
+        importlib.import_module(module)
+    try:
+        return celery.tasks[name]
+    except KeyError:
+        raise ValueError(f"Unknown task '{name}'") from None
+
+
+def _run_task(name, args, kwargs):
+    """Runs a task in the current thread (in a pool worker, possibly another process)."""
+    return _task(name)(*args, **kwargs)
+
+
+class CeleryBackend:
+    """Sends tasks to the Celery broker; results come from its result backend."""
+
+    name = 'celery'
+
+    def submit(self, name, *args, task_id=None, **kwargs):
+        """Queues the task called name and returns its task_id."""
+        return _task(name).apply_async(args=args, kwargs=kwargs, task_id=task_id).id
+
+    def status(self, task_id):
+        """pending, running, succeeded, failed or cancelled (pending if unknown)."""
+        return _CELERY_STATES.get(celery.AsyncResult(task_id).state, JOB_PENDING)
+
+    def result(self, task_id, timeout=None):
+        """Waits for the task's return value, re-raising its exception if it failed."""
+        return celery.AsyncResult(task_id).get(timeout=timeout)
+
+    def cancel(self, task_id):
+        """Revokes the task, so a worker that has not started it skips it."""
+        celery.control.revoke(task_id)
+        return True
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class LocalBackend:
+    """
+    Runs tasks in a concurrent.futures pool of the current process:
+    'thread' shares the API's caches, 'process' (spawned workers) keeps
+    CPU-bound work off the API's interpreter lock. The pool starts on the
+    first submission. Up to `history` finished tasks are remembered.
+    """
+
+    def __init__(self, kind='thread', max_workers=LOCAL_TASK_WORKERS,
+                 history=LOCAL_TASK_HISTORY):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unknown local executor '{kind}', use 'thread' or 'process'")
+        self.name = kind
+        self.max_workers = max_workers
+        self.history = history
+        self._executor = None
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            if self.name == 'process':
+                # Spawned, not forked: the API process runs threads
+                self._executor = ProcessPoolExecutor(
+                    self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+            else:
+                self._executor = ThreadPoolExecutor(self.max_workers,
+                                                    thread_name_prefix='task')
+        return self._executor
+
+    def submit(self, name, *args, task_id=None, **kwargs):
+        """Starts the task called name in the pool and returns its task_id."""
+        _task(name)  # fails now, not in the pool, if there is no such task
+        task_id = task_id or uuid.uuid4().hex
+        with self._lock:
+            self._futures[task_id] = self._pool().submit(_run_task, name, args, kwargs)
+            finished = [key for key, future in self._futures.items() if future.done()]
+            for key in finished[:max(0, len(finished) - self.history)]:
+                del self._futures[key]
+        return task_id
+
+    def _future(self, task_id):
+        with self._lock:
+            return self._futures.get(task_id)
+
+    def status(self, task_id):
+        """pending, running, succeeded, failed or cancelled (pending if unknown)."""
+        future = self._future(task_id)
+        if future is None:
+            return JOB_PENDING
+        if future.cancelled():
+            return JOB_CANCELLED
+        if future.done():
+            return JOB_FAILED if future.exception() is not None else JOB_SUCCEEDED
+        return JOB_RUNNING if future.running() else JOB_PENDING
+
+    def result(self, task_id, timeout=None):
+        """
+        Waits for the task's return value, re-raising its exception if it failed.
+        Raises:
+            KeyError: If the task is unknown (or was forgotten)
+            concurrent.futures.TimeoutError: If it is not done within timeout seconds
+        """
+        future = self._future(task_id)
+        if future is None:
+            raise KeyError(task_id)
+        return future.result(timeout=timeout)
+
+    def cancel(self, task_id):
+        """Cancels the task if it has not started yet; returns whether it was."""
+        future = self._future(task_id)
+        return future is not None and future.cancel()
+
+    def shutdown(self, wait=True):
+        """Stops the pool (after the running tasks if wait); it restarts on the next submission."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_task_backend(name=None):
+    """
+    Returns the (shared) backend called name, by default TASK_BACKEND:
+    'celery', 'thread' or 'process'.
+    """
+    name = name or TASK_BACKEND
+    if name not in TASK_BACKENDS:
+        raise ValueError(f"Unknown task backend '{name}', use one of: {', '.join(TASK_BACKENDS)}")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = CeleryBackend() if name == 'celery' else LocalBackend(name)
+        return _backends[name]
@@ -6,14 +6,17 @@ Configures the Celery application.
 import os
 from celery import Celery
 
-# Example broker and backend (using Redis); adapt to your environment
+# Example broker and backend (using Redis); adapt to your environment.
+# The API sends its tasks here only with TASK_BACKEND=celery, and otherwise
+# runs them in a local pool (see src/tasks/backends.py).
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
 
 celery = Celery(
     'image_processing_tasks',
     broker=CELERY_BROKER_URL,
-    backend=CELERY_RESULT_BACKEND
+    backend=CELERY_RESULT_BACKEND,
+    include=['src.tasks.async_tasks', 'src.tasks.pipelines']
 )
 
 # Optional: Load custom config from a file or environment
@@ -29,3 +32,7 @@ celery.conf.update(
 # Example usage:
 # from src.tasks.async_tasks import heavy_pca
 # heavy_pca.delay(image_id, n_components)
+#
+# Volume operations fanned out over chunks (see src/tasks/pipelines.py):
+# from src.tasks.pipelines import statistics_pipeline
+# statistics_pipeline(image_id).get()
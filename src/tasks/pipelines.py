@@ -0,0 +1,523 @@
+"""
+pipelines.py
+Fan-out/fan-in Celery pipelines for volume operations: statistics, PCA
+covariance accumulation, projections and batch segmentation.
+
+Each pipeline splits the image into chunks of (z, t) blocks (or of planes
+along the projected/segmented axis), runs one subtask per chunk with a
+Celery chord, and combines the small mergeable partials in a reduce task,
+so one large stack is spread over every worker process and node.
+Array partials and results are written under PIPELINE_DIR (in the spool
+directory, which all workers share) and passed around by path. A run's
+directory is removed if the run fails, and otherwise expires after
+PIPELINE_RUN_TTL seconds.
+
+With the Celery task backend, jobs submitted through /jobs run as these
+pipelines too (see run_pipeline_job): their subtasks report progress and
+check for cancellation once per chunk, and the merge stores the job's
+results in JOB_STORE.
+"""
+
+import functools
+import os
+import shutil
+import time
+import uuid
+import numpy as np
+from celery import chord
+from celery.exceptions import Ignore
+from celery.result import allow_join_result
+from .celery_app import celery
+from src.api.routes import IMAGE_SPOOL_DIR, JOB_STORE, PCA_MODEL_STORE, get_image_processor
+from src.core.image_processor import PROJECTIONS
+from src.core.jobs import (JOB_CANCELLED, JOB_FAILED, JOB_FINAL_STATES, JOB_SUCCEEDED,
+                           JobCancelled, statistics_results)
+from src.core.pca_cache import run_cached_pca
+from src.core.segmentation import SEGMENT_METHODS, segment_3d
+from src.utils.pca_utils import COVARIANCE_PCA_MAX_FEATURES, CovariancePCA, PCAModel
+from src.utils.stats_utils import ChannelStats, format_statistics, reduce_blocks
+
+# (z, t) blocks, or planes, handled by each subtask
+PIPELINE_CHUNK_BLOCKS = int(os.environ.get('PIPELINE_CHUNK_BLOCKS', 4))
+
+# Array partials and results of pipeline runs, one directory per run
+PIPELINE_DIR = os.path.join(IMAGE_SPOOL_DIR, 'pipelines')
+
+# Seconds the results of a pipeline run are kept, 24 hours by default
+PIPELINE_RUN_TTL = float(os.environ.get('PIPELINE_RUN_TTL', 24 * 3600))
+
+
+def chunk_ranges(n, chunk_size=PIPELINE_CHUNK_BLOCKS):
+    """Splits range(n) into (start, stop) chunks of at most chunk_size items."""
+    return [(start, min(start + chunk_size, n)) for start in range(0, n, max(1, chunk_size))]
+
+
+def _new_run_dir():
+    """Creates the directory of a new run, first removing the expired ones."""
+    expire_pipeline_runs()
+    path = os.path.join(PIPELINE_DIR, uuid.uuid4().hex)
+    os.makedirs(path)
+    return path
+
+
+def expire_pipeline_runs(max_age=None):
+    """
+    Removes the run directories (with their results) last modified more than
+    max_age seconds ago, by default PIPELINE_RUN_TTL. Returns their paths.
+    """
+    max_age = PIPELINE_RUN_TTL if max_age is None else max_age
+    cutoff = time.time() - max_age
+    expired = []
+    try:
+        names = os.listdir(PIPELINE_DIR)
+    except FileNotFoundError:
+        return expired
+    for name in names:
+        path = os.path.join(PIPELINE_DIR, name)
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        expired.append(path)
+    return expired
+
+
+def _pipeline_chord(header, body, run_dir=None, job_id=None):
+    """
+    The chord of a pipeline run: the header subtasks, then body with their
+    partials. If any of them fails, pipeline_failed removes run_dir and
+    ends the job, if the run is one.
+    """
+    return chord(header, body.on_error(pipeline_failed.s(run_dir, job_id)))
+
+
+def _run_chord(signature, run_dir=None, job_id=None, send=None):
+    """
+    Sends a pipeline's chord with send (by default signature.delay; e.g. a
+    task's replace) and returns what it returns. If the chord cannot be
+    sent, or fails when run eagerly, its run is cleaned up the same way.
+    """
+    try:
+        return send(signature) if send else signature.delay()
+    except Ignore:  # the task was replaced by the chord
+        raise
+    except BaseException as e:
+        fail_pipeline_run(run_dir, job_id, e)
+        raise
+
+
+def replace_task(task, signature):
+    """
+    Replaces a running (bound) task with signature, see Task.replace.
+    Tasks run eagerly (task_always_eager) apply it in place instead and
+    return its result, as freezing it for a replace needs a result backend.
+    """
+    if task.request.is_eager:
+        with allow_join_result():
+            return signature.apply().get()
+    return task.replace(signature)
+
+
+def _check_cancelled(job_id):
+    """Stops a job's subtask, before its chunk, once cancellation was requested."""
+    if job_id is not None and JOB_STORE.cancel_requested(job_id):
+        raise JobCancelled(job_id)
+
+
+def _chunk_done(job_id, count):
+    """Adds a subtask's count of blocks or planes to its job's progress."""
+    if job_id is not None:
+        JOB_STORE.advance(job_id, count)
+
+
+def _finish_job(job_id, arrays=None, files=None):
+    """
+    Stores a job's result arrays, and .npy files (linked, not copied), marks
+    it succeeded and returns its final status, as the run_job task does.
+    """
+    results = {name: JOB_STORE.save_result(job_id, name, array)
+               for name, array in (arrays or {}).items()}
+    results.update({name: JOB_STORE.link_result(job_id, name, path)
+                    for name, path in (files or {}).items()})
+    job = JOB_STORE.update(job_id, status=JOB_SUCCEEDED, results=results, finished=time.time())
+    return {"job_id": job_id, "status": job["status"], "error": job["error"]}
+
+
+def _stack_length(image_processor, axis):
+    """Number of planes along the Z or T axis of an image."""
+    if axis == 'z' and image_processor.dims == 5:
+        return image_processor.image_data.shape[0]
+    if axis == 't':
+        return image_processor.image_data.shape[-4]
+    raise ValueError(f"Unknown axis '{axis}' for a {image_processor.dims}D image")
+
+
+# Statistics
+
+@celery.task(name='statistics_chunk')
+def statistics_chunk(image_id, start, stop, job_id=None):
+    """Per-channel ChannelStats partial (as a dict) of blocks start..stop-1."""
+    _check_cancelled(job_id)
+    ip = get_image_processor(image_id)
+    C = ip.image_data.shape[-3]
+    stats = reduce_blocks((block for _, block in ip.iter_blocks(start, stop)), C, workers=1)
+    _chunk_done(job_id, stop - start)
+    return stats.to_dict()
+
+
+@celery.task(name='merge_statistics')
+def merge_statistics(partials, image_id, job_id=None):
+    """
+    Combines statistics partials into the GET /statistics response, or with
+    a job_id, into the job's result arrays.
+    """
+    total = ChannelStats.from_dict(partials[0])
+    for partial in partials[1:]:
+        total.merge(ChannelStats.from_dict(partial))
+    if job_id is not None:
+        return _finish_job(job_id, arrays=statistics_results(total))
+    return dict(format_statistics(total), image_id=image_id)
+
+
+def statistics_chord(image_id, chunk_blocks=PIPELINE_CHUNK_BLOCKS, job_id=None):
+    """
+    The chord of statistics_pipeline, and its run directory (None: its
+    partials travel through the result backend). With a job_id, it runs
+    that job: its subtasks report to it and the merge stores its results.
+    """
+    n_blocks = get_image_processor(image_id).n_blocks
+    header = [statistics_chunk.s(image_id, start, stop, job_id=job_id)
+              for start, stop in chunk_ranges(n_blocks, chunk_blocks)]
+    body = merge_statistics.s(image_id, job_id=job_id)
+    return _pipeline_chord(header, body, job_id=job_id), None
+
+
+def statistics_pipeline(image_id, chunk_blocks=PIPELINE_CHUNK_BLOCKS):
+    """
+    Computes per-channel statistics with one subtask per chunk of (z, t) blocks.
+    Returns the chord's AsyncResult; .get() gives the statistics dict.
+    """
+    return _run_chord(*statistics_chord(image_id, chunk_blocks))
+
+
+# PCA
+
+@celery.task(name='pca_covariance_chunk')
+def pca_covariance_chunk(image_id, start, stop, job_id=None):
+    """Covariance sums (see CovariancePCA.to_dict) of blocks start..stop-1."""
+    _check_cancelled(job_id)
+    ip = get_image_processor(image_id)
+    C = ip.image_data.shape[-3]
+    pca = CovariancePCA()
+    for _, block in ip.iter_blocks(start, stop):
+        # Every pixel is one sample with the channels as its features
+        pca.partial_fit(np.moveaxis(block, 0, -1).reshape(-1, C))
+    _chunk_done(job_id, stop - start)
+    return pca.to_dict()
+
+
+@celery.task(name='merge_pca_covariance')
+def merge_pca_covariance(partials, image_id, n_components, job_id=None):
+    """
+    Combines covariance partials into a model with every component, caches
+    it in PCA_MODEL_STORE (so /analyze and heavy_pca skip the fit) and
+    returns its explained variance for the first n_components.
+    With a job_id, also projects the image with it (on this worker) into
+    the job's "pca_result".
+    """
+    pca = CovariancePCA.from_dict(partials[0])
+    for partial in partials[1:]:
+        pca.merge(CovariancePCA.from_dict(partial))
+    model = PCAModel.from_estimator(pca)
+    PCA_MODEL_STORE.put_model(image_id, 'covariance', model)
+    if job_id is not None:
+        _check_cancelled(job_id)
+        ip = get_image_processor(image_id)
+        n_blocks = ip.n_blocks
+
+        def progress(done, total):
+            _check_cancelled(job_id)
+            JOB_STORE.update(job_id, progress={"done": n_blocks + done, "total": n_blocks + total})
+
+        result, _ = run_cached_pca(ip, image_id, PCA_MODEL_STORE, n_components, chunked=True,
+                                   progress=progress)
+        try:
+            return _finish_job(job_id, files={"pca_result": result.filename})
+        except FileNotFoundError:
+            # Evicted from the PCA cache meanwhile; the memmap still reads it
+            return _finish_job(job_id, arrays={"pca_result": result})
+    model = model.truncate(n_components)
+    return {
+        "image_id": image_id,
+        "n_components": n_components,
+        "explained_variance_ratio": model.explained_variance_ratio_.tolist(),
+    }
+
+
+def pca_chord(image_id, n_components=3, chunk_blocks=PIPELINE_CHUNK_BLOCKS, job_id=None):
+    """The chord of pca_pipeline and its run directory (None), see statistics_chord."""
+    ip = get_image_processor(image_id)
+    C = ip.image_data.shape[-3]
+    if C > COVARIANCE_PCA_MAX_FEATURES:
+        raise ValueError(f"Fanned-out PCA supports up to {COVARIANCE_PCA_MAX_FEATURES} "
+                         f"channels, the image has {C}")
+    if not 1 <= n_components <= C:
+        raise ValueError(f"n_components must be between 1 and {C}")
+    header = [pca_covariance_chunk.s(image_id, start, stop, job_id=job_id)
+              for start, stop in chunk_ranges(ip.n_blocks, chunk_blocks)]
+    body = merge_pca_covariance.s(image_id, n_components, job_id=job_id)
+    return _pipeline_chord(header, body, job_id=job_id), None
+
+
+def pca_pipeline(image_id, n_components=3, chunk_blocks=PIPELINE_CHUNK_BLOCKS):
+    """
+    Fits PCA over the channels by accumulating the covariance with one
+    subtask per chunk of (z, t) blocks. The exact covariance engine is
+    required, i.e. at most COVARIANCE_PCA_MAX_FEATURES channels.
+    Returns the chord's AsyncResult.
+    """
+    return _run_chord(*pca_chord(image_id, n_components, chunk_blocks))
+
+
+# Projections
+
+@celery.task(name='projection_chunk')
+def projection_chunk(image_id, run_dir, kind, axis, z, t, c, start, stop, job_id=None):
+    """
+    Max or sum projection of planes start..stop-1 (mean projections are
+    summed here and divided when merged), saved under run_dir.
+    Returns the partial's path and plane count.
+    """
+    _check_cancelled(job_id)
+    partial_kind = 'max' if kind == 'max' else 'sum'
+    partial = get_image_processor(image_id).get_projection(partial_kind, axis, z, t, c,
+                                                           start=start, stop=stop)
+    path = os.path.join(run_dir, f"part_{start}.npy")
+    np.save(path, partial)
+    _chunk_done(job_id, stop - start)
+    return {"path": path, "count": stop - start}
+
+
+@celery.task(name='merge_projection')
+def merge_projection(partials, run_dir, kind, job_id=None):
+    """
+    Combines projection partials and saves the result as run_dir/projection.npy,
+    or with a job_id, as the job's "projection" (removing run_dir).
+    """
+    result = None
+    for partial in partials:
+        part = np.load(partial["path"])
+        if result is None:
+            result = part
+        elif kind == 'max':
+            np.maximum(result, part, out=result)
+        else:
+            np.add(result, part, out=result)
+        os.remove(partial["path"])
+    if kind == 'mean':
+        result = result / sum(partial["count"] for partial in partials)
+    if job_id is not None:
+        status = _finish_job(job_id, arrays={"projection": result})
+        clear_pipeline_run(run_dir)
+        return status
+    path = os.path.join(run_dir, 'projection.npy')
+    np.save(path, result)
+    return {"path": path, "shape": list(result.shape), "dtype": result.dtype.str}
+
+
+def projection_chord(image_id, kind='max', axis='z', z=0, t=0, c=0,
+                      chunk_planes=PIPELINE_CHUNK_BLOCKS, job_id=None):
+    """The chord of projection_pipeline and its run directory, see statistics_chord."""
+    if kind not in PROJECTIONS:
+        raise ValueError(f"Unknown projection '{kind}'")
+    ip = get_image_processor(image_id)
+    ip.plane_index(z, t, c)  # validates the indices
+    n_planes = _stack_length(ip, axis)
+    run_dir = _new_run_dir()
+    header = [projection_chunk.s(image_id, run_dir, kind, axis, z, t, c, start, stop,
+                                 job_id=job_id)
+              for start, stop in chunk_ranges(n_planes, chunk_planes)]
+    body = merge_projection.s(run_dir, kind, job_id=job_id)
+    return _pipeline_chord(header, body, run_dir, job_id), run_dir
+
+
+def projection_pipeline(image_id, kind='max', axis='z', z=0, t=0, c=0,
+                        chunk_planes=PIPELINE_CHUNK_BLOCKS):
+    """
+    Projects a Z or T stack (see ImageProcessor.get_projection) with one
+    subtask per chunk of planes. Returns the chord's AsyncResult; .get()
+    gives the path, shape and dtype of the saved projection.
+    """
+    return _run_chord(*projection_chord(image_id, kind, axis, z, t, c, chunk_planes))
+
+
+# Segmentation
+
+@celery.task(name='segmentation_chunk')
+def segmentation_chunk(image_id, labels_path, axis, z, t, c, method, start, stop, job_id=None,
+                       **kwargs):
+    """
+    Segments planes start..stop-1 of a stack straight into the shared
+    labels file and returns the count of each label among them.
+    """
+    _check_cancelled(job_id)
+    stack = get_image_processor(image_id).get_stack(axis, z, t, c, start=start, stop=stop)
+    labels = np.load(labels_path, mmap_mode='r+')
+    labels[start:stop] = segment_3d(stack, method=method, **kwargs)
+    counts = np.bincount(labels[start:stop].ravel())
+    labels.flush()
+    _chunk_done(job_id, stop - start)
+    return counts.tolist()
+
+
+@celery.task(name='merge_segmentation')
+def merge_segmentation(partials, labels_path, job_id=None):
+    """
+    Sums the per-chunk label counts of a segmentation: the result's
+    label_counts lists the count of each label, by label. With a job_id,
+    the labels become the job's "labels" instead (and the run is removed).
+    """
+    counts = np.zeros(max(len(partial) for partial in partials), dtype=np.int64)
+    for partial in partials:
+        counts[:len(partial)] += partial
+    if job_id is not None:
+        status = _finish_job(job_id, files={"labels": labels_path})
+        clear_pipeline_run(labels_path)
+        return status
+    return {"path": labels_path, "label_counts": counts.tolist()}
+
+
+def segmentation_chord(image_id, axis='z', z=0, t=0, c=0, method='otsu',
+                        chunk_planes=PIPELINE_CHUNK_BLOCKS, job_id=None, **kwargs):
+    """The chord of segmentation_pipeline and its run directory, see statistics_chord."""
+    if method not in SEGMENT_METHODS:
+        raise ValueError(f"Unknown segmentation method '{method}'")
+    ip = get_image_processor(image_id)
+    ip.plane_index(z, t, c)  # validates the indices
+    n_planes = _stack_length(ip, axis)
+    run_dir = _new_run_dir()
+    labels_path = os.path.join(run_dir, 'labels.npy')
+    shape = (n_planes,) + ip.image_data.shape[-2:]
+    try:
+        np.lib.format.open_memmap(labels_path, mode='w+', dtype=np.uint8, shape=shape).flush()
+    except BaseException:
+        clear_pipeline_run(run_dir)
+        raise
+    header = [segmentation_chunk.s(image_id, labels_path, axis, z, t, c, method, start, stop,
+                                   job_id=job_id, **kwargs)
+              for start, stop in chunk_ranges(n_planes, chunk_planes)]
+    body = merge_segmentation.s(labels_path, job_id=job_id)
+    return _pipeline_chord(header, body, run_dir, job_id), run_dir
+
+
+def segmentation_pipeline(image_id, axis='z', z=0, t=0, c=0, method='otsu',
+                          chunk_planes=PIPELINE_CHUNK_BLOCKS, **kwargs):
+    """
+    Segments a Z or T stack slice by slice (see segment_3d) with one
+    subtask per chunk of planes, all writing into one uint8 labels .npy.
+    Returns the chord's AsyncResult; .get() gives its path and the count
+    of each label (a list indexed by label).
+    """
+    return _run_chord(*segmentation_chord(image_id, axis, z, t, c, method, chunk_planes,
+                                           **kwargs))
+
+
+# Jobs
+
+def job_pipeline(job):
+    """
+    The pipeline a job submitted through /jobs runs as with the Celery task
+    backend, as (build, total): build(job_id=...) returns the chord and its
+    run directory, and total is the job's progress total. None for the jobs
+    that run on a single worker (see src.core.jobs.run_job): objects and
+    ingest jobs, and PCA jobs whose image has more than COVARIANCE_PCA_MAX_FEATURES
+    channels or whose model is cached already (only the projection is left).
+    Raises the image's error if it cannot be opened.
+    """
+    image_id, params, kind = job["image_id"], job["params"], job["kind"]
+    if kind not in ('statistics', 'pca', 'projection', 'segmentation'):
+        return None
+    ip = get_image_processor(image_id)
+    if kind == 'statistics':
+        return functools.partial(statistics_chord, image_id), ip.n_blocks
+    if kind == 'pca':
+        n_components = int(params.get("n_components", 3))
+        if (ip.image_data.shape[-3] > COVARIANCE_PCA_MAX_FEATURES
+                or PCA_MODEL_STORE.get_model(image_id, 'covariance', n_components) is not None):
+            return None
+        # The covariance of every block, then its projection
+        return functools.partial(pca_chord, image_id, n_components), 2 * ip.n_blocks
+    axis = params.get("axis", "z")
+    indices = (axis, params.get("z", 0), params.get("time", 0), params.get("channel", 0))
+    if kind == 'projection':
+        build = functools.partial(projection_chord, image_id, params.get("projection", "max"),
+                                  *indices)
+    else:
+        kwargs = {key: params[key] for key in ("n_clusters",) if key in params}
+        build = functools.partial(segmentation_chord, image_id, *indices,
+                                  params.get("method", "otsu"), **kwargs)
+    return build, _stack_length(ip, axis)
+
+
+def run_pipeline_job(task, job_id, pipeline):
+    """
+    Starts a pending job (see JobStore.start) and replaces the Celery task
+    running it with the job's pipeline chord (see job_pipeline), so the
+    task's result is the job's final status once the merge has stored
+    the results. A job whose chord cannot be built or sent is failed.
+    Returns the job's final status when the chord runs eagerly, or if the
+    job was not started (e.g. it was cancelled).
+    """
+    job, started = JOB_STORE.start(job_id)
+    if not started:
+        return {"job_id": job_id, "status": job["status"], "error": job["error"]}
+    build, total = pipeline
+    JOB_STORE.update(job_id, progress={"done": 0, "total": total})
+    try:
+        signature, run_dir = build(job_id=job_id)
+    except Exception as e:
+        fail_pipeline_run(None, job_id, e)
+    else:
+        try:
+            return _run_chord(signature, run_dir, job_id, send=functools.partial(replace_task, task))
+        except Ignore:
+            raise
+        except Exception:
+            pass  # the job records the error
+    job = JOB_STORE.get(job_id)
+    return {"job_id": job_id, "status": job["status"], "error": job["error"]}
+
+
+def fail_pipeline_run(run_dir=None, job_id=None, error=None):
+    """
+    Cleans up after a failed pipeline run: removes run_dir and, for a job
+    that has not ended yet, marks it cancelled if that was requested, or
+    else failed with error.
+    """
+    if run_dir is not None:
+        clear_pipeline_run(run_dir)
+    if job_id is None:
+        return
+    job = JOB_STORE.get(job_id)
+    if job is None or job["status"] in JOB_FINAL_STATES:
+        return
+    if job["cancel_requested"]:
+        JOB_STORE.update(job_id, status=JOB_CANCELLED, finished=time.time())
+    else:
+        JOB_STORE.update(job_id, status=JOB_FAILED, error=str(error), finished=time.time())
+
+
+@celery.task(name='pipeline_failed')
+def pipeline_failed(request, exc, traceback, run_dir=None, job_id=None):
+    """Error callback of every pipeline chord (see fail_pipeline_run)."""
+    fail_pipeline_run(run_dir, job_id, exc)
+
+
+@celery.task(name='clear_pipeline_run')
+def clear_pipeline_run(path):
+    """Removes the directory of a pipeline run, given any path returned by it."""
+    run_dir = os.path.dirname(path) if os.path.isfile(path) else path
+    if os.path.dirname(os.path.abspath(run_dir)) == os.path.abspath(PIPELINE_DIR):
+        shutil.rmtree(run_dir, ignore_errors=True)
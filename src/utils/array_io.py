@@ -0,0 +1,140 @@
+"""
+array_io.py
+Helpers for sending NumPy arrays over HTTP in binary form instead of
+nested JSON lists: raw little-endian bytes (shape/dtype in headers),
+.npy, or compressed .npz. Raw, .npy and NDJSON can also be produced
+plane by plane, for streaming large results.
+"""
+
+import io
+import json
+import numpy as np
+
+# Response formats -> mimetypes, in order of preference for content negotiation
+ARRAY_FORMATS = {
+    'npy': 'application/x-npy',
+    'raw': 'application/octet-stream',
+    'npz': 'application/x-npz',
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Formats that can be produced incrementally, one plane at a time
+STREAMABLE_FORMATS = ('npy', 'raw', 'ndjson')
+
+
+def negotiate_array_format(requested, accept_mimetypes, default='npy'):
+    """
+    Picks the response format for an array.
+    An explicit `requested` format (e.g. a 'format' parameter) wins;
+    otherwise the best match for the request's Accept header is used,
+    falling back to `default` when nothing specific is asked for.
+    Raises:
+        ValueError: If the requested format is not supported.
+    """
+    if requested:
+        requested = requested.lower()
+        if requested not in ARRAY_FORMATS:
+            raise ValueError(
+                f"Unsupported format '{requested}'. Use one of: {', '.join(ARRAY_FORMATS)}"
+            )
+        return requested
+
+    best = accept_mimetypes.best_match(list(ARRAY_FORMATS.values()))
+    for fmt, mimetype in ARRAY_FORMATS.items():
+        if mimetype == best:
+            return fmt
+    return default
+
+
+def to_little_endian(array):
+    """Returns a C-contiguous, little-endian version of array (no copy if already so)."""
+    return np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+
+
+def array_headers(array):
+    """HTTP headers describing an array's shape and (little-endian) dtype."""
+    return {
+        'X-Array-Shape': ','.join(str(n) for n in array.shape),
+        'X-Array-Dtype': array.dtype.newbyteorder('<').str,
+    }
+
+
+def encode_array(array, fmt, name='data'):
+    """
+    Serializes an array in one of the binary formats.
+
+    Args:
+        array (numpy.ndarray): Array to encode
+        fmt (str): 'raw', 'npy' or 'npz'
+        name (str): Array name inside an .npz archive
+
+    Returns:
+        (bytes, mimetype, headers): the encoded body, its mimetype and
+        headers describing the array.
+    """
+    headers = array_headers(array)
+    if fmt == 'raw':
+        body = to_little_endian(array).tobytes()
+    elif fmt == 'npy':
+        buf = io.BytesIO()
+        np.save(buf, array, allow_pickle=False)
+        body = buf.getvalue()
+    elif fmt == 'npz':
+        buf = io.BytesIO()
+        np.savez_compressed(buf, **{name: array})
+        body = buf.getvalue()
+    else:
+        raise ValueError(f"Unsupported binary format '{fmt}'")
+    return body, ARRAY_FORMATS[fmt], headers
+
+
+def npy_header(array):
+    """
+    Returns the .npy header bytes for a C-order, little-endian copy of array,
+    so the data can follow plane by plane.
+    """
+    header = {
+        'descr': np.lib.format.dtype_to_descr(array.dtype.newbyteorder('<')),
+        'fortran_order': False,
+        'shape': array.shape,
+    }
+    buf = io.BytesIO()
+    np.lib.format.write_array_header_1_0(buf, header)
+    return buf.getvalue()
+
+
+def iter_encoded_planes(array, fmt, plane_ndim=2):
+    """
+    Generator that encodes an array one plane at a time, so no second
+    full-size copy of the array is ever built.
+
+    Args:
+        array (numpy.ndarray): Array to encode (may be a memmap)
+        fmt (str): 'raw', 'npy' or 'ndjson'
+        plane_ndim (int): Number of trailing dimensions forming one plane,
+            e.g. 3 for a (Z, T, H, W, k) PCA result streamed per (z, t)
+
+    Yields:
+        bytes: for 'npy', the header and then each plane's data;
+        for 'raw', each plane's little-endian data; for 'ndjson', a first
+        line with shape/dtype, then one {"index": [...], "data": [...]}
+        line per plane.
+    """
+    if fmt not in STREAMABLE_FORMATS:
+        raise ValueError(f"Format '{fmt}' cannot be streamed")
+
+    lead_shape = array.shape[:max(array.ndim - plane_ndim, 0)]
+    if fmt == 'npy':
+        yield npy_header(array)
+    elif fmt == 'ndjson':
+        header = {"shape": list(array.shape), "dtype": array.dtype.newbyteorder('<').str}
+        yield (json.dumps(header) + '\n').encode()
+
+    for index in np.ndindex(*lead_shape):
+        plane = array[index]
+        if fmt == 'ndjson':
+            line = {"index": list(index), "data": np.asarray(plane).tolist()}
+            yield (json.dumps(line) + '\n').encode()
+        else:
+            yield to_little_endian(plane).tobytes()
@@ -0,0 +1,204 @@
+"""
+cache.py
+A thread-safe LRU cache bounded by a memory budget (in bytes)
+rather than an entry count. Used for decoded image processors and
+other per-image results that can be large, with single-flight loading
+so that concurrent misses on one key share a single load.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+def _default_sizeof(value):
+    """Uses a value's .nbytes if it has one (NumPy arrays), else len()."""
+    nbytes = getattr(value, 'nbytes', None)
+    if nbytes is not None:
+        return int(nbytes)
+    return len(value)
+
+
+class _Load:
+    """A load in flight: callers waiting on it share its value or exception."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.discarded = False  # the key was popped meanwhile: do not cache the value
+
+
+class LRUCache:
+    """
+    Least-recently-used cache with a byte budget.
+
+    Each entry's size is computed once on insert with `sizeof(value)`.
+    When the total exceeds `max_bytes`, the least recently used entries
+    are evicted. A single value larger than the whole budget is not cached.
+    get_or_load() loads missing values, once per key however many callers
+    miss on it at the same time.
+    Hit, miss, eviction, load and coalesced-load counters are available
+    through stats().
+    `on_evict(value)`, if given, is called (outside the cache's lock) for
+    every value the cache drops on its own: evicted, replaced or cleared,
+    or loaded by get_or_load() after its key was popped or cleared, e.g.
+    to release a file handle. Values removed with pop() are the caller's
+    to release.
+    """
+
+    def __init__(self, max_bytes, sizeof=None, on_evict=None):
+        self.max_bytes = int(max_bytes)
+        self._sizeof = sizeof or _default_sizeof
+        self._on_evict = on_evict
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._loading = {}  # key -> _Load in flight
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+        self.coalesced = 0  # misses that waited on another caller's load instead of loading
+
+    def get(self, key, default=None):
+        """Returns the cached value for key (marking it recently used) or default."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_or_load(self, key, load):
+        """
+        Returns the cached value for key, or on a miss the value of load(),
+        which is then cached. Concurrent misses on the same key are
+        coalesced: the first caller runs load() while the others wait for it
+        and share its value (or its exception), so one value is never
+        loaded several times at once.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            flight = self._loading.get(key)
+            if flight is None:
+                flight = self._loading[key] = _Load()
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        dropped = []
+        try:
+            flight.value = load()
+            nbytes = self._sizeof(flight.value)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None and not flight.discarded:
+                    dropped = self._insert(key, flight.value, nbytes)
+                elif flight.error is None:
+                    # Invalidated meanwhile: never cached, so released like an eviction
+                    dropped = [flight.value]
+                if self._loading.get(key) is flight:
+                    del self._loading[key]
+                self.loads += 1
+            flight.done.set()
+            self._evicted(dropped)
+        return flight.value
+
+    def put(self, key, value):
+        """Inserts or replaces key, evicting least recently used entries as needed."""
+        nbytes = self._sizeof(value)
+        with self._lock:
+            dropped = self._insert(key, value, nbytes)
+        self._evicted(dropped)
+
+    def _insert(self, key, value, nbytes):
+        # Caller holds the lock; returns the values dropped to make room
+        dropped = []
+        if key in self._entries:
+            old_value, old_bytes = self._entries.pop(key)
+            self.current_bytes -= old_bytes
+            if old_value is not value:
+                dropped.append(old_value)
+        if nbytes > self.max_bytes:
+            return dropped
+        self._entries[key] = (value, nbytes)
+        self.current_bytes += nbytes
+        while self.current_bytes > self.max_bytes:
+            _, (evicted, evicted_bytes) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_bytes
+            self.evictions += 1
+            dropped.append(evicted)
+        return dropped
+
+    def _evicted(self, values):
+        # Called without the lock, so on_evict may take its time (or use the cache)
+        if self._on_evict is not None:
+            for value in values:
+                self._on_evict(value)
+
+    def pop(self, key, default=None):
+        """
+        Removes key from the cache and returns its value (or default).
+        A load of key in flight is still returned to its callers, but not
+        cached: its value is passed to on_evict once loaded.
+        """
+        with self._lock:
+            flight = self._loading.pop(key, None)
+            if flight is not None:
+                flight.discarded = True
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self.current_bytes -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        """Drops every entry, and the values of loads in flight (counters are kept)."""
+        with self._lock:
+            for flight in self._loading.values():
+                flight.discarded = True
+            self._loading.clear()
+            dropped = [value for value, _ in self._entries.values()]
+            self._entries.clear()
+            self.current_bytes = 0
+        self._evicted(dropped)
+
+    def __contains__(self, key):
+        # Membership checks do not count as hits/misses or refresh recency
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """Returns the cache counters and current memory use as a dict."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "loads": self.loads,
+                "coalesced_loads": self.coalesced,
+            }
@@ -29,3 +29,18 @@ def write_in_chunks(filename, file_bytes, chunk_size=1024*1024):
             f.write(file_bytes[offset:end])
             offset += chunk_size
     return os.path.getsize(filename)
+
+def stream_to_file(file_obj, filename, chunk_size=1024*1024):
+    """
+    Streams a file-like object to disk in chunks of specified size,
+    so only one chunk is held in memory at a time.
+    The data is written to a temporary '.part' file first and renamed
+    on completion, so readers never see a partially written file.
+    Returns the number of bytes written.
+    """
+    partial = filename + '.part'
+    with open(partial, 'wb') as f:
+        for chunk in read_in_chunks(file_obj, chunk_size):
+            f.write(chunk)
+    os.replace(partial, filename)
+    return os.path.getsize(filename)
@@ -5,14 +5,250 @@ outside of the main ImageProcessor class.
 """
 
 import numpy as np
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
+
+# Up to this many features (channels), PCA uses the exact covariance engine
+COVARIANCE_PCA_MAX_FEATURES = 8
+
+# Rows converted to float64 at a time while accumulating the covariance
+# (small enough to stay cache-friendly, large enough to amortize the matmul)
+COVARIANCE_CHUNK_ROWS = 1 << 16
+
+
+def project(X, mean, components):
+    """
+    Projects samples X (n, C) onto PCA components (k, C) as X @ W - mean @ W,
+    i.e. a single matmul with the centering folded into a constant offset.
+    float32 input gives float32 output.
+    """
+    X = np.asarray(X)
+    dtype = X.dtype if X.dtype in (np.float32, np.float64) else np.float64
+    weights = components.T.astype(dtype)
+    offset = (mean @ components.T).astype(dtype)
+    return X.astype(dtype, copy=False) @ weights - offset
+
+
+class CovariancePCA:
+    """
+    Exact PCA for data with few features (e.g. 2-8 image channels).
+
+    Instead of an SVD of the full N x C matrix, the mean and C x C covariance
+    are accumulated in float64 over row chunks (partial_fit can be fed one
+    block at a time), then eigendecomposed. Projection is a single matmul.
+    Components, their signs and explained_variance_ratio_ match sklearn's PCA.
+    The fitted attributes are computed from the sums when first read after
+    a partial_fit or merge, so chunks may have fewer rows than n_components.
+    """
+
+    # Computed by _finalize from the accumulated sums, on first access
+    _FITTED = ('mean_', 'n_components_', 'n_features_in_', 'components_',
+               'explained_variance_', 'explained_variance_ratio_', 'singular_values_')
+
+    def __init__(self, n_components=None):
+        self.n_components = n_components
+        self.n_samples_seen_ = 0
+        self._shift = None  # Subtracted before accumulating, for numerical stability
+        self._gram = None   # [[sum x x^T, sum x], [sum x^T, n]] of shifted samples
+
+    def partial_fit(self, X):
+        """Accumulates the sums of a chunk of samples X with shape (n, C)."""
+        X = np.asarray(X)
+        n_features = X.shape[1]
+        if self._shift is None:
+            self._shift = X[:1024].mean(axis=0, dtype=np.float64)
+            self._gram = np.zeros((n_features + 1, n_features + 1), dtype=np.float64)
+
+        # Each chunk is shifted into a float64 buffer with an extra column of
+        # ones, so one matmul yields the cross products, the column sums
+        # (last column) and the sample count (corner) together
+        buf = np.empty((min(COVARIANCE_CHUNK_ROWS, X.shape[0]), n_features + 1))
+        buf[:, -1] = 1.0
+        for start in range(0, X.shape[0], COVARIANCE_CHUNK_ROWS):
+            chunk = X[start:start + COVARIANCE_CHUNK_ROWS]
+            augmented = buf[:chunk.shape[0]]
+            np.subtract(chunk, self._shift, out=augmented[:, :-1])
+            self._gram += augmented.T @ augmented
+            self.n_samples_seen_ += chunk.shape[0]
+
+        self._invalidate()
+        return self
+
+    def fit(self, X):
+        """Fits the model on all samples of X with shape (n, C)."""
+        self.__init__(self.n_components)
+        self.partial_fit(X)._finalize()
+        return self
+
+    def merge(self, other):
+        """
+        Merges the sums accumulated by another CovariancePCA (e.g. over a
+        different chunk of the image, on another worker) into this one.
+        Its sums are re-centred from its shift onto this one's first.
+        """
+        if other._gram is None:
+            return self
+        if self._gram is None:
+            self._shift, self._gram = other._shift.copy(), other._gram.copy()
+        else:
+            # Augmented samples [x - s_other, 1] @ A == [x - s_self, 1]
+            change = np.eye(len(self._gram))
+            change[-1, :-1] = other._shift - self._shift
+            self._gram += change.T @ other._gram @ change
+        self.n_samples_seen_ += other.n_samples_seen_
+        self._invalidate()
+        return self
+
+    def to_dict(self):
+        """Plain-Python copy of the accumulated sums, e.g. to send between workers."""
+        return {"n_samples": int(self.n_samples_seen_), "shift": self._shift.tolist(),
+                "gram": self._gram.tolist()}
+
+    @classmethod
+    def from_dict(cls, data, n_components=None):
+        pca = cls(n_components)
+        pca.n_samples_seen_ = int(data["n_samples"])
+        pca._shift = np.asarray(data["shift"], dtype=np.float64)
+        pca._gram = np.asarray(data["gram"], dtype=np.float64)
+        return pca
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set, e.g. the fitted ones
+        # after the sums changed
+        if name in CovariancePCA._FITTED and self.__dict__.get('_gram') is not None:
+            self._finalize()
+            return self.__dict__[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def _invalidate(self):
+        for name in self._FITTED:
+            self.__dict__.pop(name, None)
+
+    def _finalize(self):
+        n = self.n_samples_seen_
+        n_features = self._gram.shape[0] - 1
+        k = n_features if self.n_components is None else self.n_components
+        if not 0 < k <= min(n, n_features):
+            raise ValueError(
+                f"n_components={k} must be between 1 and min(n_samples, n_features)="
+                f"{min(n, n_features)}"
+            )
+
+        shifted_mean = self._gram[:-1, -1] / n
+        cross = self._gram[:-1, :-1]
+        cov = (cross - n * np.outer(shifted_mean, shifted_mean)) / max(n - 1, 1)
+        eigenvalues, eigenvectors = np.linalg.eigh(cov)
+        # eigh returns ascending eigenvalues; PCA wants them descending
+        eigenvalues = np.clip(eigenvalues[::-1], 0.0, None)
+        components = eigenvectors[:, ::-1].T
+
+        # Same sign convention as sklearn (svd_flip with u_based_decision=False):
+        # the largest-magnitude entry of each component is positive
+        max_abs = np.argmax(np.abs(components), axis=1)
+        signs = np.sign(components[np.arange(n_features), max_abs])
+        components *= signs[:, np.newaxis]
+
+        self.mean_ = self._shift + shifted_mean
+        self.n_components_ = k
+        self.n_features_in_ = n_features
+        self.components_ = components[:k]
+        self.explained_variance_ = eigenvalues[:k]
+        total_var = eigenvalues.sum()
+        self.explained_variance_ratio_ = (
+            eigenvalues[:k] / total_var if total_var > 0 else np.zeros(k)
+        )
+        self.singular_values_ = np.sqrt(eigenvalues[:k] * max(n - 1, 1))
+
+    def transform(self, X):
+        """Projects samples X (n, C) onto the components with one matmul."""
+        return project(X, self.mean_, self.components_)
+
+    def fit_transform(self, X):
+        """Fits the model on X and returns X projected onto the components."""
+        return self.fit(X).transform(X)
+
+
+class PCAModel:
+    """
+    Fitted PCA parameters (mean, components, explained variance), independent
+    of the engine that produced them, so they can be cached, saved to disk
+    and truncated to fewer components.
+    Attribute names follow sklearn, so a PCAModel can stand in for a fitted PCA.
+    """
+
+    def __init__(self, mean, components, explained_variance, explained_variance_ratio):
+        self.mean_ = np.asarray(mean, dtype=np.float64)
+        self.components_ = np.asarray(components, dtype=np.float64)
+        self.explained_variance_ = np.asarray(explained_variance, dtype=np.float64)
+        self.explained_variance_ratio_ = np.asarray(explained_variance_ratio, dtype=np.float64)
+
+    @classmethod
+    def from_estimator(cls, estimator):
+        """Copies the fitted parameters of a PCA/IncrementalPCA/CovariancePCA."""
+        return cls(estimator.mean_, estimator.components_,
+                   estimator.explained_variance_, estimator.explained_variance_ratio_)
+
+    @property
+    def n_components(self):
+        return self.components_.shape[0]
+
+    def truncate(self, n_components):
+        """Returns the model restricted to its first n_components components."""
+        if not 0 < n_components <= self.n_components:
+            raise ValueError(
+                f"Cannot take {n_components} components from a {self.n_components}-component model"
+            )
+        return PCAModel(self.mean_, self.components_[:n_components],
+                        self.explained_variance_[:n_components],
+                        self.explained_variance_ratio_[:n_components])
+
+    def transform(self, X):
+        """Projects samples X (n, C) onto the components with one matmul."""
+        return project(X, self.mean_, self.components_)
+
+    def save(self, path):
+        """Writes the model to an .npz file."""
+        np.savez(path, mean=self.mean_, components=self.components_,
+                 explained_variance=self.explained_variance_,
+                 explained_variance_ratio=self.explained_variance_ratio_)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a model written by save()."""
+        with np.load(path) as f:
+            return cls(f['mean'], f['components'],
+                       f['explained_variance'], f['explained_variance_ratio'])
+
+
+def pca_engine_name(n_features, incremental=False):
+    """
+    Names the PCA engine used for data with n_features columns:
+    'covariance' for few features (exact, and always works in chunks),
+    otherwise 'incremental' (sklearn IncrementalPCA) or 'full' (sklearn PCA).
+    """
+    if n_features <= COVARIANCE_PCA_MAX_FEATURES:
+        return 'covariance'
+    return 'incremental' if incremental else 'full'
+
+
+def make_pca(n_components, n_features, incremental=False):
+    """
+    Returns the PCA engine to use for data with n_features columns
+    (see pca_engine_name).
+    """
+    engine = pca_engine_name(n_features, incremental)
+    if engine == 'covariance':
+        return CovariancePCA(n_components=n_components)
+    if engine == 'incremental':
+        return IncrementalPCA(n_components=n_components)
+    return PCA(n_components=n_components)
+
 
 def run_pca_on_array(array, n_components=3):
     """
     A generic utility to run PCA on a 2D array [samples, features].
     Returns the transformed array (samples, n_components).
     """
-    pca = PCA(n_components=n_components)
+    pca = make_pca(n_components, array.shape[1])
     transformed = pca.fit_transform(array)
     return transformed, pca.explained_variance_ratio_
 
@@ -0,0 +1,316 @@
+"""
+stats_utils.py
+Mergeable per-channel statistics (count, mean, M2, min, max) and
+histograms (with percentiles derived from them) for image data.
+
+Each chunk of data is reduced to a small ChannelStats partial; partials are
+combined with the parallel variance formula of Chan et al., so chunks can be
+reduced in any order, on any thread or worker, and merged afterwards without
+ever holding more than one chunk in memory.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import numpy as np
+
+# Pixels per channel reduced at a time, bounding float64 temporaries to a few MiB
+STATS_CHUNK_PIXELS = 1 << 18
+
+# Default number of threads reducing blocks in parallel
+STATS_WORKERS = min(8, os.cpu_count() or 1)
+
+# Integer data whose value range fits in this many bins gets an exact,
+# one-bin-per-value histogram (always the case for uint8/uint16)
+HISTOGRAM_EXACT_MAX_BINS = 1 << 16
+
+# Number of fixed-width bins for float data (and wider integer ranges)
+HISTOGRAM_FLOAT_BINS = 4096
+
+
+class ChannelStats:
+    """
+    Running statistics of C channels: count, mean, M2 (sum of squared
+    deviations from the mean), min and max, each an array of length C.
+    """
+
+    def __init__(self, n_channels):
+        self.count = np.zeros(n_channels, dtype=np.int64)
+        self.mean = np.zeros(n_channels, dtype=np.float64)
+        self.m2 = np.zeros(n_channels, dtype=np.float64)
+        self.min = np.full(n_channels, np.inf)
+        self.max = np.full(n_channels, -np.inf)
+
+    @property
+    def n_channels(self):
+        return len(self.count)
+
+    @classmethod
+    def from_block(cls, block, chunk_pixels=STATS_CHUNK_PIXELS):
+        """
+        Reduces a (C, ...) block, where the first axis is the channel,
+        in chunks of chunk_pixels pixels per channel.
+        """
+        block = np.asarray(block)
+        C = block.shape[0]
+        flat = block.reshape(C, -1)
+        stats = cls(C)
+        for start in range(0, flat.shape[1], chunk_pixels):
+            chunk = flat[:, start:start + chunk_pixels]
+            part = cls(C)
+            part.count[:] = chunk.shape[1]
+            part.min[:] = chunk.min(axis=1)
+            part.max[:] = chunk.max(axis=1)
+            centered = chunk.astype(np.float64)
+            part.mean[:] = centered.mean(axis=1)
+            centered -= part.mean[:, None]
+            part.m2[:] = np.einsum('ij,ij->i', centered, centered)
+            stats.merge(part)
+        return stats
+
+    def merge(self, other):
+        """Merges another partial over the same channels into this one (in place)."""
+        count = self.count + other.count
+        safe = np.maximum(count, 1)
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / safe)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (self.count * other.count / safe)
+        self.count = count
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        return self
+
+    def combined(self):
+        """Merges all channels into a single-channel ChannelStats."""
+        total = ChannelStats(1)
+        for c in range(self.n_channels):
+            part = ChannelStats(1)
+            part.count[:] = self.count[c]
+            part.mean[:] = self.mean[c]
+            part.m2[:] = self.m2[c]
+            part.min[:] = self.min[c]
+            part.max[:] = self.max[c]
+            total.merge(part)
+        return total
+
+    @property
+    def std(self):
+        """Population standard deviation (ddof=0, like numpy's std)."""
+        return np.sqrt(self.m2 / np.maximum(self.count, 1))
+
+    def to_dict(self):
+        """Plain-Python copy of the partial, e.g. to send between workers."""
+        return {key: getattr(self, key).tolist()
+                for key in ('count', 'mean', 'm2', 'min', 'max')}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(len(data['count']))
+        stats.count = np.asarray(data['count'], dtype=np.int64)
+        for key in ('mean', 'm2', 'min', 'max'):
+            setattr(stats, key, np.asarray(data[key], dtype=np.float64))
+        return stats
+
+
+class ChannelHistogram:
+    """
+    Fixed-bin histograms of C channels sharing the same bins: counts is a
+    (C, n_bins) array and bin i covers [lo + i * width, lo + (i + 1) * width).
+    With exact=True (integer data, width 1) bin i counts the value lo + i.
+    Histograms over the same bins merge by adding their counts.
+    """
+
+    def __init__(self, n_channels, lo, width, n_bins, exact=False):
+        self.lo = lo
+        self.width = width
+        self.exact = exact
+        self.counts = np.zeros((n_channels, n_bins), dtype=np.int64)
+
+    @classmethod
+    def for_range(cls, n_channels, dtype, vmin, vmax, n_bins=HISTOGRAM_FLOAT_BINS):
+        """
+        Chooses the bins for data of the given dtype within [vmin, vmax]:
+        one bin per value for integer data with a small enough range,
+        otherwise n_bins equal-width bins.
+        """
+        if np.issubdtype(dtype, np.integer) and vmax - vmin < HISTOGRAM_EXACT_MAX_BINS:
+            return cls(n_channels, int(vmin), 1, int(vmax) - int(vmin) + 1, exact=True)
+        width = (float(vmax) - float(vmin)) / n_bins or 1.0
+        return cls(n_channels, float(vmin), width, n_bins)
+
+    @property
+    def n_channels(self):
+        return self.counts.shape[0]
+
+    @property
+    def n_bins(self):
+        return self.counts.shape[1]
+
+    @property
+    def edges(self):
+        return self.lo + self.width * np.arange(self.n_bins + 1)
+
+    def empty_like(self):
+        return ChannelHistogram(self.n_channels, self.lo, self.width, self.n_bins, self.exact)
+
+    def bin_indices(self, values):
+        """Bin index of every value; out-of-range values go to the edge bins."""
+        if self.exact:
+            index = values.astype(np.int64) - self.lo
+        else:
+            index = np.floor((values - self.lo) / self.width)
+        return np.clip(index, 0, self.n_bins - 1).astype(np.intp)
+
+    def add_block(self, block, chunk_pixels=STATS_CHUNK_PIXELS):
+        """
+        Counts a (C, ...) block, where the first axis is the channel, with
+        np.bincount over chunks of chunk_pixels pixels. NaNs are skipped.
+        Returns self.
+        """
+        block = np.asarray(block)
+        flat = block.reshape(block.shape[0], -1)
+        for c in range(flat.shape[0]):
+            for start in range(0, flat.shape[1], chunk_pixels):
+                values = flat[c, start:start + chunk_pixels]
+                if not self.exact:
+                    values = values[~np.isnan(values)]
+                self.counts[c] += np.bincount(self.bin_indices(values), minlength=self.n_bins)
+        return self
+
+    def merge(self, other):
+        """Merges another histogram over the same bins into this one (in place)."""
+        self.counts += other.counts
+        return self
+
+    def percentiles(self, q):
+        """
+        Per-channel percentiles (0-100) derived from the counts, interpolating
+        linearly between ranks like numpy's default method. Exact for exact
+        histograms; otherwise values are interpolated within their bin.
+
+        Returns:
+            numpy.ndarray: (C, len(q)) percentiles (NaN for empty channels)
+        """
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        result = np.full((self.n_channels, len(q)), np.nan)
+        for c in range(self.n_channels):
+            counts = self.counts[c]
+            cumulative = np.cumsum(counts)
+            total = cumulative[-1]
+            if total == 0:
+                continue
+            position = q / 100.0 * (total - 1)
+            below, above = np.floor(position), np.ceil(position)
+            low = self._value_at_rank(counts, cumulative, below)
+            high = self._value_at_rank(counts, cumulative, above)
+            result[c] = low + (high - low) * (position - below)
+        return result
+
+    def _value_at_rank(self, counts, cumulative, rank):
+        """Value of the rank-th smallest (0-based) sample of one channel."""
+        index = np.searchsorted(cumulative, rank, side='right')
+        if self.exact:
+            return self.lo + index.astype(np.float64)
+        # Spread the samples of a bin evenly across its width
+        before = cumulative[index] - counts[index]
+        fraction = (rank - before + 0.5) / counts[index]
+        return self.lo + (index + fraction) * self.width
+
+    def rebin(self, n_bins):
+        """
+        Returns (edges, counts) with at most n_bins bins, merging adjacent
+        bins, e.g. to send a 65536-bin uint16 histogram as 256 bins.
+        """
+        if self.n_bins <= n_bins:
+            return self.edges, self.counts
+        starts = np.linspace(0, self.n_bins, n_bins + 1).astype(np.intp)
+        return self.edges[starts], np.add.reduceat(self.counts, starts[:-1], axis=1)
+
+    @property
+    def nbytes(self):
+        return self.counts.nbytes
+
+
+def map_blocks(blocks, workers=STATS_WORKERS, reduce=None):
+    """
+    Yields reduce(block) for each of an iterable of (C, ...) blocks, in
+    order, reducing the blocks on a thread pool (numpy releases the GIL
+    while reducing). At most 2 * workers blocks are in flight, so memory
+    stays bounded. By default blocks are reduced to ChannelStats.
+    """
+    reduce = reduce or ChannelStats.from_block
+    if workers <= 1:
+        for block in blocks:
+            yield reduce(block)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for block in blocks:
+            pending.append(pool.submit(reduce, block))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def reduce_blocks(blocks, n_channels, workers=STATS_WORKERS):
+    """Reduces an iterable of (C, ...) blocks to one ChannelStats (see map_blocks)."""
+    total = ChannelStats(n_channels)
+    for stats in map_blocks(blocks, workers):
+        total.merge(stats)
+    return total
+
+
+def merge_plane_records(records):
+    """
+    Merges per-plane statistics records, dicts with a channel 'c' and that
+    plane's count, mean, m2, min and max, into per-channel statistics.
+
+    Returns:
+        (list, ChannelStats): the sorted channels present and their statistics
+    """
+    by_channel = {}
+    for record in records:
+        part = ChannelStats.from_dict({key: [record[key]]
+                                       for key in ('count', 'mean', 'm2', 'min', 'max')})
+        if record['c'] in by_channel:
+            by_channel[record['c']].merge(part)
+        else:
+            by_channel[record['c']] = part
+
+    channels = sorted(by_channel)
+    stats = ChannelStats(len(channels))
+    for i, c in enumerate(channels):
+        for key in ('count', 'mean', 'm2', 'min', 'max'):
+            getattr(stats, key)[i] = getattr(by_channel[c], key)[0]
+    return channels, stats
+
+
+def format_statistics(stats, channels=None):
+    """
+    Builds the statistics response of a ChannelStats: top-level per-channel
+    lists, one entry per channel, and the global numbers over all channels.
+    `channels` gives the channel number of each entry (default 0..C-1).
+    """
+    if channels is None:
+        channels = list(range(stats.n_channels))
+    overall = stats.combined()
+    mean, std = stats.mean.tolist(), stats.std.tolist()
+    minimum, maximum = stats.min.tolist(), stats.max.tolist()
+    return {
+        "mean": mean,
+        "std": std,
+        "min": minimum,
+        "max": maximum,
+        "per_channel": [
+            {"channel": c, "min": minimum[i], "max": maximum[i],
+             "mean": mean[i], "std": std[i]}
+            for i, c in enumerate(channels)
+        ],
+        "global": {
+            "min": float(overall.min[0]),
+            "max": float(overall.max[0]),
+            "mean": float(overall.mean[0]),
+            "std": float(overall.std[0]),
+        },
+    }
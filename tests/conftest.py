@@ -0,0 +1,104 @@
+"""
+conftest.py
+Points the API at a fresh spool directory and a fresh SQLite database for
+the test session, since registered images and their statistics persist in
+them (see src/core/image_store.py and src/db/database.py), and provides the
+Flask test client and real TIFF uploads shared by the API tests (once
+their ingest job has finished).
+"""
+
+import os
+import shutil
+import tempfile
+import pytest
+import numpy as np
+from io import BytesIO
+
+os.environ['IMAGE_SPOOL_DIR'] = tempfile.mkdtemp(prefix='hdimage_test_spool_')
+# Never the configured database: the tests delete and rewrite image_<n> rows
+os.environ.pop('VERCEL_POSTGRES_URL', None)
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(os.environ['IMAGE_SPOOL_DIR'], 'test.db')
+
+
+@pytest.fixture(scope='session', autouse=True)
+def spool_dir():
+    """Drops every image still registered (and its shared memory) after the session."""
+    yield os.environ['IMAGE_SPOOL_DIR']
+    from src.api.routes import IMAGE_STORE
+    for image_id in list(IMAGE_STORE):
+        IMAGE_STORE.pop(image_id, None)
+    shutil.rmtree(os.environ['IMAGE_SPOOL_DIR'], ignore_errors=True)
+
+
+def wait_for_job(job_id, timeout=60):
+    """Polls JOB_STORE until the job has ended (e.g. an upload's ingest job) and returns it."""
+    import time
+    from src.api.routes import JOB_STORE
+    from src.core.jobs import JOB_FINAL_STATES
+
+    deadline = time.monotonic() + timeout
+    while True:
+        job = JOB_STORE.get(job_id)
+        if job["status"] in JOB_FINAL_STATES or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+
+@pytest.fixture(name='wait_for_job')
+def wait_for_job_fixture():
+    """wait_for_job, for the tests."""
+    return wait_for_job
+
+
+@pytest.fixture
+def client(request, monkeypatch):
+    """
+    Flask test client. Parametrise it indirectly with a task backend to run
+    the jobs it submits there: 'celery' (executed eagerly, without a broker),
+    'thread' or 'process', e.g.
+        @pytest.mark.parametrize('client', ['celery'], indirect=True)
+    """
+    from src.api.app import create_app
+
+    backend = getattr(request, 'param', None)
+    if backend is not None:
+        from src.tasks import backends
+        from src.tasks.celery_app import celery
+        monkeypatch.setattr(backends, 'TASK_BACKEND', backend)
+        monkeypatch.setitem(celery.conf, 'task_always_eager', True)
+
+    app = create_app()
+    app.testing = True
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def tiff_data():
+    """
+    Pixels (Z, T, C, H, W) uploaded by uploaded_tiff; a test module
+    overrides this fixture to upload other data.
+    """
+    return np.random.default_rng(0).integers(0, 4096, size=(3, 2, 2, 16, 16), dtype=np.uint16)
+
+
+@pytest.fixture
+def uploaded_tiff(client, tiff_data):
+    """
+    Uploads tiff_data as a real 5D TIFF and returns its image_id and data,
+    removing it again afterwards so other tests still see an empty store.
+    """
+    import tifffile
+    from src.api.routes import IMAGE_STORE, IMAGE_PROCESSOR_STORE
+
+    buf = BytesIO()
+    tifffile.imwrite(buf, tiff_data, photometric='minisblack')
+    buf.seek(0)
+    resp = client.post('/upload', data={'file': (buf, 'real_image.tif')},
+                       content_type='multipart/form-data')
+    assert resp.status_code == 202
+    assert wait_for_job(resp.json['job']['job_id'])['status'] == 'succeeded'
+    image_id = resp.json['image_id']
+    yield image_id, tiff_data
+    IMAGE_STORE.pop(image_id, None)
+    IMAGE_PROCESSOR_STORE.pop(image_id)
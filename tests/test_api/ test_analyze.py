@@ -5,15 +5,6 @@ Tests for the POST /analyze endpoint (PCA).
 
 import pytest
 from io import BytesIO
-from src.api.app import create_app
-
-@pytest.fixture
-def client():
-    app = create_app()
-    app.testing = True
-    with app.test_client() as client:
-        yield client
-
 
 @pytest.fixture
 def uploaded_image(client):
@@ -38,9 +29,10 @@ def test_analyze_no_image(client):
 def test_analyze_pca(client, uploaded_image):
     """
     POST /analyze with a valid image_id and components.
-    Expects a JSON response containing pca_result as a list.
+    Expects a JSON response containing pca_result as a list
+    (JSON output is opt-in via "format").
     """
-    payload = {"image_id": uploaded_image, "components": 2}
+    payload = {"image_id": uploaded_image, "components": 2, "format": "json"}
     resp = client.post('/analyze', json=payload)
     assert resp.status_code == 200
     assert resp.json['image_id'] == uploaded_image
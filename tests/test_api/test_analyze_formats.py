@@ -0,0 +1,83 @@
+"""
+test_analyze_formats.py
+Tests content negotiation of POST /analyze results (raw, .npy, .npz, JSON).
+"""
+
+import pytest
+import numpy as np
+from io import BytesIO
+
+@pytest.fixture
+def tiff_data():
+    """A small uint8 5D image (see uploaded_tiff in conftest.py)."""
+    return np.random.randint(0, 255, size=(2, 1, 3, 8, 8), dtype=np.uint8)
+
+
+def test_analyze_default_npy(client, uploaded_tiff):
+    """
+    Without a format or Accept header, the result is an .npy file.
+    """
+    image_id, _ = uploaded_tiff
+    resp = client.post('/analyze', json={"image_id": image_id, "components": 2})
+    assert resp.status_code == 200
+    assert resp.content_type == 'application/x-npy'
+    result = np.load(BytesIO(resp.data))
+    assert result.shape == (2, 1, 8, 8, 2)
+    assert resp.headers['X-Array-Shape'] == '2,1,8,8,2'
+
+
+def test_analyze_raw_matches_npy(client, uploaded_tiff):
+    """
+    Raw bytes plus shape/dtype headers should reconstruct the same array.
+    """
+    image_id, _ = uploaded_tiff
+    payload = {"image_id": image_id, "components": 2}
+    npy = np.load(BytesIO(client.post('/analyze', json=payload).data))
+
+    resp = client.post('/analyze', json=payload,
+                       headers={'Accept': 'application/octet-stream'})
+    assert resp.content_type == 'application/octet-stream'
+    shape = tuple(int(n) for n in resp.headers['X-Array-Shape'].split(','))
+    raw = np.frombuffer(resp.data, dtype=resp.headers['X-Array-Dtype']).reshape(shape)
+    np.testing.assert_allclose(raw, npy, rtol=1e-5, atol=1e-4)
+
+
+def test_analyze_npz_and_json(client, uploaded_tiff):
+    """
+    npz is selected by the format field; JSON only when asked for.
+    """
+    image_id, _ = uploaded_tiff
+    payload = {"image_id": image_id, "components": 2, "format": "npz"}
+    resp = client.post('/analyze', json=payload)
+    assert np.load(BytesIO(resp.data))['pca_result'].shape == (2, 1, 8, 8, 2)
+
+    resp = client.post('/analyze', json={"image_id": image_id, "components": 2},
+                       headers={'Accept': 'application/json'})
+    assert isinstance(resp.json['pca_result'], list)
+
+    resp = client.post('/analyze?format=xml', json={"image_id": image_id})
+    assert resp.status_code == 400
+
+
+def test_analyze_streamed(client, uploaded_tiff):
+    """
+    Streamed npy and ndjson responses should carry the same result.
+    """
+    image_id, _ = uploaded_tiff
+    payload = {"image_id": image_id, "components": 2}
+    expected = np.load(BytesIO(client.post('/analyze', json=payload).data))
+
+    resp = client.post('/analyze?stream=1', json=payload)
+    assert resp.is_streamed
+    assert int(resp.headers['Content-Length']) == len(resp.data)
+    np.testing.assert_allclose(np.load(BytesIO(resp.data)), expected, rtol=1e-5, atol=1e-4)
+
+    import json
+    resp = client.post('/analyze', json=dict(payload, format='ndjson'))
+    lines = [json.loads(line) for line in resp.data.decode().splitlines()]
+    assert lines[0]['shape'] == [2, 1, 8, 8, 2]
+    assert len(lines) == 1 + 2 * 1  # header + one line per (z, t)
+    np.testing.assert_allclose(lines[1]['data'], expected[0, 0], rtol=1e-5, atol=1e-4)
+
+    resp = client.post('/analyze', json=dict(payload, format='npz', stream=True))
+    assert resp.status_code == 400
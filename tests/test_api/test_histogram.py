@@ -0,0 +1,108 @@
+"""
+test_histogram.py
+Tests for the GET /histogram endpoint.
+"""
+
+import pytest
+import numpy as np
+
+@pytest.fixture
+def tiff_data():
+    """A uint16 5D image with three channels."""
+    return np.random.default_rng(0).integers(0, 4096, size=(2, 2, 3, 16, 16), dtype=np.uint16)
+
+
+def test_histogram_no_image(client):
+    """
+    GET /histogram with invalid image_id should return 404.
+    """
+    resp = client.get('/histogram?image_id=non_existent')
+    assert resp.status_code == 404
+
+
+def test_histogram_percentiles_exact_and_cached(client, uploaded_tiff, monkeypatch):
+    """
+    Integer percentiles should match numpy exactly, and repeat queries
+    should be answered from the cached histogram.
+    """
+    from src.core.image_processor import ImageProcessor
+
+    image_id, data = uploaded_tiff
+    resp = client.get(f'/histogram?image_id={image_id}&bins=64&percentiles=1,50,99.5')
+    assert resp.status_code == 200
+    assert resp.json['exact'] is True
+    assert len(resp.json['edges']) == 65
+    assert len(resp.json['channels']) == 3
+
+    per_channel = np.moveaxis(data, 2, 0).reshape(3, -1)
+    expected = np.percentile(per_channel, [1, 50, 99.5], axis=1).T
+    for c, channel in enumerate(resp.json['channels']):
+        assert channel['count'] == per_channel.shape[1]
+        assert sum(channel['counts']) == per_channel.shape[1]
+        assert [channel['percentiles'][k] for k in ('1', '50', '99.5')] == \
+            pytest.approx(expected[c].tolist())
+
+    def fail(*args, **kwargs):
+        raise AssertionError("histogram was rebuilt")
+    monkeypatch.setattr(ImageProcessor, "get_histogram", fail)
+
+    resp = client.get(f'/histogram?image_id={image_id}&channel=2&percentiles=50')
+    assert resp.status_code == 200
+    assert resp.json['channels'][0]['channel'] == 2
+    assert resp.json['channels'][0]['percentiles']['50'] == pytest.approx(expected[2][1])
+
+    resp = client.get(f'/histogram?image_id={image_id}&channel=5')
+    assert resp.status_code == 400
+
+
+def test_concurrent_histogram_requests_build_once(client, uploaded_tiff, monkeypatch):
+    """
+    Concurrent requests for an image's histogram wait for a single build.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from src.core.image_processor import ImageProcessor
+
+    image_id, _ = uploaded_tiff
+    builds = []
+    release = threading.Event()
+    original = ImageProcessor.get_histogram
+
+    def build(self, *args, **kwargs):
+        builds.append(1)
+        release.wait(10)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(ImageProcessor, "get_histogram", build)
+    app = client.application
+
+    def fetch():
+        with app.test_client() as other:
+            return other.get(f'/histogram?image_id={image_id}&percentiles=50')
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = [pool.submit(fetch) for _ in range(4)]
+        while not builds:
+            threading.Event().wait(0.01)
+        threading.Event().wait(0.1)
+        release.set()
+        responses = [response.result() for response in responses]
+
+    assert len(builds) == 1
+    assert all(response.status_code == 200 for response in responses)
+    assert len({str(response.json) for response in responses}) == 1
+
+
+def test_histogram_without_database(client, uploaded_tiff, monkeypatch):
+    """
+    Without a database, /histogram finds the value range from the pixels.
+    """
+    from src.db import database
+
+    image_id, data = uploaded_tiff
+    monkeypatch.setattr(database, 'engine', None)
+
+    resp = client.get(f'/histogram?image_id={image_id}&channel=1&percentiles=50')
+    assert resp.status_code == 200
+    assert resp.json['channels'][0]['percentiles']['50'] == \
+        pytest.approx(np.percentile(data[:, :, 1], 50))
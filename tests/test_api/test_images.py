@@ -0,0 +1,42 @@
+"""
+test_images.py
+Tests for the DELETE /images/<image_id> endpoint.
+"""
+
+import os
+import pytest
+
+
+def test_delete_image_no_image(client):
+    """
+    DELETE /images/<id> with an invalid image_id should return 404.
+    """
+    resp = client.delete('/images/non_existent')
+    assert resp.status_code == 404
+
+
+def test_delete_image(client, uploaded_tiff):
+    """
+    Deleting an image removes its upload, registration, shared memory and
+    derived data, and later requests for it return 404.
+    """
+    from multiprocessing import shared_memory
+    from src.api.routes import IMAGE_STORE, IMAGE_PROCESSOR_STORE, get_pyramid_dir
+
+    image_id, _ = uploaded_tiff
+    path = IMAGE_STORE[image_id]
+    shared = IMAGE_STORE._read_manifest(image_id)['shared']
+    assert client.get(f'/slice?image_id={image_id}').status_code == 200
+    assert os.path.isdir(get_pyramid_dir(image_id))
+
+    resp = client.delete(f'/images/{image_id}')
+    assert resp.status_code == 200
+    assert resp.json == {"image_id": image_id, "deleted": True, "derived_cleared": True}
+
+    assert image_id not in IMAGE_STORE and image_id not in IMAGE_PROCESSOR_STORE
+    assert not os.path.exists(path)
+    assert not os.path.exists(get_pyramid_dir(image_id))
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=shared['name'])
+    assert client.get(f'/slice?image_id={image_id}').status_code == 404
+    assert client.delete(f'/images/{image_id}').status_code == 404
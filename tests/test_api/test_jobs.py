@@ -0,0 +1,94 @@
+"""
+test_jobs.py
+Tests for the /jobs endpoints.
+"""
+
+import pytest
+import numpy as np
+from io import BytesIO
+
+@pytest.mark.parametrize('client', ['celery'], indirect=True)
+def test_job_lifecycle(client, uploaded_tiff):
+    """
+    A submitted job is polled to completion with chunk-level progress,
+    and its result is fetched from disk by name.
+    """
+    image_id, data = uploaded_tiff
+    resp = client.post('/jobs', json={"kind": "projection", "image_id": image_id,
+                                      "projection": "sum", "channel": 1, "time": 1})
+    assert resp.status_code == 202
+    job_id = resp.json['job_id']
+    assert resp.headers['Location'] == f'/jobs/{job_id}'
+
+    resp = client.get(f'/jobs/{job_id}')
+    assert resp.status_code == 200
+    assert resp.json['status'] == 'succeeded'
+    assert resp.json['progress'] == {"done": 3, "total": 3, "fraction": 1.0}
+    result = resp.json['results']['projection']
+    assert result['shape'] == [16, 16]
+
+    resp = client.get(result['url'])
+    assert resp.status_code == 200
+    expected = data[:, 1, 1].sum(axis=0, dtype=np.int64)
+    np.testing.assert_array_equal(np.load(BytesIO(resp.data)), expected)
+
+    resp = client.get(f'/jobs/{job_id}/results/projection?format=json')
+    assert resp.json['data'] == expected.tolist()
+
+
+@pytest.mark.parametrize('client', ['celery'], indirect=True)
+def test_job_kinds(client, uploaded_tiff):
+    """Statistics, segmentation and PCA jobs store their results as arrays."""
+    image_id, data = uploaded_tiff
+    stats = client.post('/jobs', json={"kind": "statistics", "image_id": image_id}).json
+    resp = client.get(f"/jobs/{stats['job_id']}/results/mean?format=json")
+    per_channel = np.moveaxis(data, 2, 0).reshape(2, -1)
+    assert resp.json['data'] == pytest.approx(per_channel.mean(axis=1).tolist())
+
+    seg = client.post('/jobs', json={"kind": "segmentation", "image_id": image_id,
+                                     "method": "kmeans", "n_clusters": 3}).json
+    assert seg['status'] == 'succeeded'
+    assert seg['results']['labels']['shape'] == [3, 16, 16]
+
+    pca = client.post('/jobs', json={"kind": "pca", "image_id": image_id,
+                                     "n_components": 2}).json
+    assert pca['status'] == 'succeeded'
+    assert pca['results']['pca_result']['shape'] == [3, 2, 16, 16, 2]
+
+
+@pytest.mark.parametrize('client', ['celery'], indirect=True)
+def test_job_errors_and_cancel(client, uploaded_tiff):
+    image_id, _ = uploaded_tiff
+    assert client.post('/jobs', json={"kind": "pca", "image_id": "nope"}).status_code == 404
+    assert client.post('/jobs', json={"kind": "fft", "image_id": image_id}).status_code == 400
+    assert client.post('/jobs', json={"kind": "statistics", "image_id": image_id,
+                                      "bins": 3}).status_code == 400
+    assert client.post('/jobs', json=[["kind", "statistics"]]).status_code == 400
+    assert client.post('/jobs', json="statistics").status_code == 400
+    assert client.post('/jobs', json={"kind": "objects", "image_id": image_id,
+                                      "across_time": "maybe"}).status_code == 400
+    assert client.get('/jobs/0123456789abcdef0123456789abcdef').status_code == 404
+
+    failed = client.post('/jobs', json={"kind": "projection", "image_id": image_id,
+                                        "channel": 9}).json
+    assert failed['status'] == 'failed' and 'out of range' in failed['error']
+    resp = client.get(f"/jobs/{failed['job_id']}/results/projection")
+    assert resp.status_code == 409
+
+    # A finished job cannot be cancelled any more
+    resp = client.post(f"/jobs/{failed['job_id']}/cancel")
+    assert resp.status_code == 200 and resp.json['status'] == 'failed'
+
+    # ...but it can be deleted, with its results
+    resp = client.delete(f"/jobs/{failed['job_id']}")
+    assert resp.status_code == 200 and resp.json['deleted'] is True
+    assert client.get(f"/jobs/{failed['job_id']}").status_code == 404
+    assert client.delete(f"/jobs/{failed['job_id']}").status_code == 404
+
+    # Unfinished jobs must be cancelled before they are deleted
+    from src.api.routes import JOB_STORE
+    pending = JOB_STORE.create('statistics', image_id)
+    resp = client.delete(f"/jobs/{pending['job_id']}")
+    assert resp.status_code == 409 and resp.json['status'] == 'pending'
+    client.post(f"/jobs/{pending['job_id']}/cancel")
+    assert client.delete(f"/jobs/{pending['job_id']}").status_code == 200
@@ -5,15 +5,6 @@ Tests for the GET /metadata endpoint.
 
 import pytest
 from io import BytesIO
-from src.api.app import create_app
-
-@pytest.fixture
-def client():
-    app = create_app()
-    app.testing = True
-    with app.test_client() as client:
-        yield client
-
 
 @pytest.fixture
 def uploaded_image(client):
@@ -48,3 +39,33 @@ def test_metadata_success(client, uploaded_image):
     assert 'shape' in resp.json
     assert 'dtype' in resp.json
     assert 'Z' in resp.json
+
+
+def test_metadata_from_headers_only(client, monkeypatch, wait_for_job):
+    """
+    GET /metadata on a real compressed TIFF should report shape, axes and
+    compression from the headers without decoding any pixel data.
+    """
+    import numpy as np
+    import tifffile
+
+    data = np.zeros((3, 2, 2, 8, 8), dtype=np.uint16)
+    buf = BytesIO()
+    tifffile.imwrite(buf, data, compression='zlib', metadata={'axes': 'ZTCYX'})
+    buf.seek(0)
+    resp = client.post('/upload', data={'file': (buf, 'real_image.tif')},
+                       content_type='multipart/form-data')
+    image_id = resp.json['image_id']
+    wait_for_job(resp.json['job']['job_id'])  # its publish decodes the pixels
+
+    def no_decode(*args, **kwargs):
+        raise AssertionError("pixel data was decoded")
+    monkeypatch.setattr(tifffile.TiffPage, 'asarray', no_decode)
+
+    resp = client.get(f'/metadata?image_id={image_id}')
+    assert resp.status_code == 200
+    assert resp.json['shape'] == [3, 2, 2, 8, 8]
+    assert resp.json['dtype'] == 'uint16'
+    assert resp.json['axes'] == 'ZTCYX'
+    assert resp.json['compression'] == 'ADOBE_DEFLATE'
+    assert resp.json['nbytes'] == data.nbytes
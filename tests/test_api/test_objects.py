@@ -0,0 +1,53 @@
+"""
+test_objects.py
+Tests for the GET /objects endpoint.
+"""
+
+import pytest
+import numpy as np
+
+@pytest.fixture
+def tiff_data():
+    """Two bright cubes in channel 0 of a uint16 5D image, on a uniform background."""
+    data = np.full((4, 2, 2, 16, 16), 100, dtype=np.uint16)
+    data[0:2, :, 0, 2:5, 2:5] = 1000   # 2 x 3 x 3 cube
+    data[1:4, :, 0, 9:13, 8:10] = 1000  # 3 x 4 x 2 cube
+    data[:, :, 1] = 7
+    return data
+
+
+def test_objects_no_image(client):
+    """
+    GET /objects with invalid image_id should return 404.
+    """
+    resp = client.get('/objects?image_id=non_existent')
+    assert resp.status_code == 404
+
+
+def test_objects_measurements(client, uploaded_tiff):
+    """
+    Two cubes spanning several Z planes are two 3D objects, with their
+    voxel counts, centroids, bounding boxes and per-channel mean intensities.
+    (With only two intensities, Otsu's threshold is the background value.)
+    """
+    image_id, _ = uploaded_tiff
+    resp = client.get(f'/objects?image_id={image_id}&channel=0&time=1&method=kmeans')
+    assert resp.status_code == 200
+    body = resp.json
+    assert body['axes'] == ['Z', 'Y', 'X']
+    assert body['n_objects'] == 2
+    assert body['volume'] == [18, 24]
+    assert body['centroid'][0] == pytest.approx([0.5, 3, 3])
+    assert body['bbox'][1] == [1, 9, 8, 4, 13, 10]
+    assert body['mean_intensity'] == [[1000, 7], [1000, 7]]
+
+    resp = client.get(f'/objects?image_id={image_id}&across_time=1&method=kmeans')
+    assert resp.status_code == 200
+    assert resp.json['axes'] == ['Z', 'T', 'Y', 'X']
+    assert resp.json['volume'] == [36, 48]
+
+    resp = client.get(f'/objects?image_id={image_id}&method=otsu')
+    assert resp.status_code == 200
+
+    resp = client.get(f'/objects?image_id={image_id}&method=watershed')
+    assert resp.status_code == 400
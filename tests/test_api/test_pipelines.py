@@ -0,0 +1,159 @@
+"""
+test_pipelines.py
+Tests the fan-out/fan-in Celery pipelines in src/tasks/pipelines.py,
+run eagerly (without a broker) against a real upload.
+"""
+
+import pytest
+import numpy as np
+
+@pytest.fixture
+def tiff_data():
+    """A float32 5D image with correlated channels 0 and 1."""
+    data = np.random.default_rng(0).normal(size=(5, 3, 3, 12, 12)).astype(np.float32)
+    data[:, :, 1] += 2 * data[:, :, 0]
+    return data
+
+
+def test_chunk_ranges():
+    from src.tasks.pipelines import chunk_ranges
+
+    assert chunk_ranges(10, 4) == [(0, 4), (4, 8), (8, 10)]
+    assert chunk_ranges(0, 4) == []
+
+
+@pytest.mark.parametrize('client', ['celery'], indirect=True)
+def test_statistics_and_pca_pipelines(uploaded_tiff):
+    """Merged partials match the single-pass statistics and the direct PCA fit."""
+    from src.api.routes import PCA_MODEL_STORE, get_image_processor
+    from src.tasks.pipelines import pca_pipeline, statistics_pipeline
+
+    image_id, data = uploaded_tiff
+    ip = get_image_processor(image_id)
+    stats = statistics_pipeline(image_id, chunk_blocks=4).get()
+    expected = ip.get_statistics()
+    for key in ('mean', 'std', 'min', 'max'):
+        assert stats[key] == pytest.approx(expected[key], rel=1e-9, abs=1e-12)
+
+    result = pca_pipeline(image_id, n_components=2, chunk_blocks=2).get()
+    fitted = ip.fit_pca(3)
+    assert result['explained_variance_ratio'] == \
+        pytest.approx(fitted.explained_variance_ratio_[:2].tolist())
+    cached = PCA_MODEL_STORE.get_model(image_id, 'covariance', 3)
+    np.testing.assert_allclose(np.abs(cached.components_), np.abs(fitted.components_), atol=1e-6)
+
+
+@pytest.mark.parametrize("kind", ['max', 'mean', 'sum'])
+@pytest.mark.parametrize('client', ['celery'], indirect=True)
+def test_projection_pipeline(uploaded_tiff, kind):
+    from src.api.routes import get_image_processor
+    from src.tasks.pipelines import clear_pipeline_run, projection_pipeline
+
+    image_id, _ = uploaded_tiff
+    result = projection_pipeline(image_id, kind, 'z', t=2, c=1, chunk_planes=2).get()
+    expected = get_image_processor(image_id).get_projection(kind, 'z', t=2, c=1)
+    np.testing.assert_allclose(np.load(result['path']), expected, rtol=1e-12)
+    clear_pipeline_run(result['path'])
+
+
+@pytest.mark.parametrize('client', ['celery'], indirect=True)
+def test_segmentation_pipeline(uploaded_tiff):
+    from src.api.routes import get_image_processor
+    from src.tasks.pipelines import clear_pipeline_run, segmentation_pipeline
+
+    image_id, _ = uploaded_tiff
+    result = segmentation_pipeline(image_id, 't', z=3, c=0, chunk_planes=2).get()
+    labels = np.load(result['path'])
+    expected = get_image_processor(image_id).segment_stack('t', z=3, c=0, workers=1)
+    np.testing.assert_array_equal(labels, expected)
+    assert result['label_counts'] == np.bincount(labels.ravel()).tolist()
+    clear_pipeline_run(result['path'])
+
+    with pytest.raises(ValueError):
+        segmentation_pipeline(image_id, method='watershed')
+
+
+@pytest.mark.parametrize('client', ['celery'], indirect=True)
+def test_pipeline_runs_are_cleaned_up(uploaded_tiff, monkeypatch):
+    """Failed runs remove their directory, and old runs expire."""
+    import os
+    import time
+    from src.core.image_processor import ImageProcessor
+    from src.tasks import pipelines
+
+    image_id, _ = uploaded_tiff
+    runs = set(os.listdir(pipelines.PIPELINE_DIR)) if os.path.isdir(pipelines.PIPELINE_DIR) \
+        else set()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("failed")
+
+    # A failing chunk, then a failing merge
+    with monkeypatch.context() as patch:
+        patch.setattr(ImageProcessor, 'get_projection', fail)
+        with pytest.raises(RuntimeError, match="failed"):
+            pipelines.projection_pipeline(image_id, 'max', 'z', t=0, c=0, chunk_planes=2).get()
+    assert set(os.listdir(pipelines.PIPELINE_DIR)) == runs
+    with monkeypatch.context() as patch:
+        patch.setattr(pipelines.os, 'remove', fail)
+        with pytest.raises(RuntimeError, match="failed"):
+            pipelines.projection_pipeline(image_id, 'max', 'z', t=0, c=0, chunk_planes=2).get()
+    assert set(os.listdir(pipelines.PIPELINE_DIR)) == runs
+
+    result = pipelines.projection_pipeline(image_id, 'sum', 'z', t=0, c=0).get()
+    run_dir = os.path.dirname(result['path'])
+    assert pipelines.expire_pipeline_runs() == []
+    os.utime(run_dir, (time.time() - 2 * pipelines.PIPELINE_RUN_TTL,) * 2)
+    assert pipelines.expire_pipeline_runs() == [run_dir]
+    assert not os.path.exists(run_dir)
+
+
+@pytest.mark.parametrize('client', ['celery'], indirect=True)
+def test_jobs_run_through_the_pipelines(client, uploaded_tiff, monkeypatch):
+    """
+    With Celery, jobs fan out over chunks that report their progress and
+    stop once cancelled; their runs leave nothing behind.
+    """
+    import os
+    from src.api.routes import JOB_STORE
+    from src.core.jobs import JobStore
+    from src.tasks import pipelines
+
+    image_id, _ = uploaded_tiff
+    runs = set(os.listdir(pipelines.PIPELINE_DIR)) if os.path.isdir(pipelines.PIPELINE_DIR) \
+        else set()
+    chunks = []
+    advance = JobStore.advance
+
+    def record(store, job_id, done):
+        chunks.append(done)
+        return advance(store, job_id, done)
+
+    monkeypatch.setattr(JobStore, 'advance', record)
+    stats = client.post('/jobs', json={"kind": "statistics", "image_id": image_id}).json
+    assert stats['status'] == 'succeeded'
+    assert chunks == [4, 4, 4, 3]  # 5 * 3 (z, t) blocks
+    progress = client.get(f"/jobs/{stats['job_id']}").json['progress']
+    assert progress == {"done": 15, "total": 15, "fraction": 1.0}
+
+    pca = client.post('/jobs', json={"kind": "pca", "image_id": image_id,
+                                     "n_components": 2}).json
+    assert pca['status'] == 'succeeded'
+    assert pca['results']['pca_result']['shape'] == [5, 3, 12, 12, 2]
+    progress = client.get(f"/jobs/{pca['job_id']}").json['progress']
+    assert progress == {"done": 30, "total": 30, "fraction": 1.0}  # covariance, then projection
+
+    seg = client.post('/jobs', json={"kind": "segmentation", "image_id": image_id,
+                                     "axis": "t"}).json
+    assert seg['status'] == 'succeeded' and seg['results']['labels']['shape'] == [3, 12, 12]
+    assert set(os.listdir(pipelines.PIPELINE_DIR)) == runs
+
+    # Cancelled after its first chunk of planes
+    def cancel(job_id, count):
+        JOB_STORE.cancel(job_id)
+
+    monkeypatch.setattr(pipelines, '_chunk_done', cancel)
+    cancelled = client.post('/jobs', json={"kind": "projection", "image_id": image_id,
+                                           "projection": "sum"}).json
+    assert cancelled['status'] == 'cancelled' and cancelled['results'] == {}
+    assert set(os.listdir(pipelines.PIPELINE_DIR)) == runs
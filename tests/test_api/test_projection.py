@@ -0,0 +1,105 @@
+"""
+test_projection.py
+Tests for the GET /projection endpoint.
+"""
+
+import pytest
+import numpy as np
+from io import BytesIO
+
+@pytest.fixture
+def tiff_data():
+    """A uint16 5D image with non-square planes."""
+    return np.random.default_rng(0).integers(0, 4096, size=(4, 3, 2, 8, 10), dtype=np.uint16)
+
+
+def test_projection_no_image(client):
+    """
+    GET /projection with invalid image_id should return 404.
+    """
+    resp = client.get('/projection?image_id=non_existent')
+    assert resp.status_code == 404
+
+
+@pytest.mark.parametrize("kind, axis", [("max", "z"), ("mean", "z"), ("sum", "t")])
+def test_projection_values(client, uploaded_tiff, kind, axis):
+    """
+    npy projections match numpy reductions over the projected axis.
+    """
+    image_id, data = uploaded_tiff
+    resp = client.get(f'/projection?image_id={image_id}&kind={kind}&axis={axis}'
+                      f'&z=1&time=2&channel=1&format=npy')
+    assert resp.status_code == 200
+    projection = np.load(BytesIO(resp.data))
+
+    stack = data[:, 2, 1] if axis == 'z' else data[1, :, 1]
+    expected = getattr(stack.astype(np.float64), kind)(axis=0)
+    np.testing.assert_allclose(projection, expected)
+
+
+def test_projection_cached(client, uploaded_tiff, monkeypatch):
+    """
+    Rendered projections carry an ETag, and repeat requests in another format
+    reuse the cached projection instead of reading planes again.
+    """
+    from src.core.image_processor import ImageProcessor
+
+    image_id, _ = uploaded_tiff
+    resp = client.get(f'/projection?image_id={image_id}&kind=max')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'image/png'
+    etag = resp.headers['ETag'].strip('"')
+
+    def fail(*args, **kwargs):
+        raise AssertionError("projection was recomputed")
+    monkeypatch.setattr(ImageProcessor, "get_projection", fail)
+
+    resp = client.get(f'/projection?image_id={image_id}&kind=max&format=raw')
+    assert resp.status_code == 200
+    assert resp.headers['X-Array-Shape'] == '8,10'
+
+    resp = client.get(f'/projection?image_id={image_id}&kind=max',
+                      headers={'If-None-Match': f'"{etag}"'})
+    assert resp.status_code == 304
+
+    resp = client.get(f'/projection?image_id={image_id}&kind=median')
+    assert resp.status_code == 400
+
+
+def test_projection_builds_are_per_key(client, uploaded_tiff, monkeypatch):
+    """
+    Concurrent requests for one projection compute it once, while a
+    different projection is computed without waiting for it.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from src.core.image_processor import ImageProcessor
+
+    image_id, _ = uploaded_tiff
+    builds = []
+    release = threading.Event()
+    original = ImageProcessor.get_projection
+
+    def build(self, kind, axis, z, t, c, *args, **kwargs):
+        builds.append(c)
+        if c == 0:
+            release.wait(10)
+        return original(self, kind, axis, z, t, c, *args, **kwargs)
+
+    monkeypatch.setattr(ImageProcessor, "get_projection", build)
+    app = client.application
+
+    def fetch(channel):
+        with app.test_client() as other:
+            return other.get(f'/projection?image_id={image_id}&time=2&channel={channel}'
+                             '&format=npy')
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        slow = [pool.submit(fetch, 0) for _ in range(3)]
+        while not builds:
+            threading.Event().wait(0.01)
+        assert pool.submit(fetch, 1).result(timeout=10).status_code == 200
+        release.set()
+        assert all(response.result().status_code == 200 for response in slow)
+
+    assert sorted(builds) == [0, 1]
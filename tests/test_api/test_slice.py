@@ -5,15 +5,6 @@ Tests for the GET /slice endpoint, which returns a PNG image slice.
 
 import pytest
 from io import BytesIO
-from src.api.app import create_app
-
-@pytest.fixture
-def client():
-    app = create_app()
-    app.testing = True
-    with app.test_client() as client:
-        yield client
-
 
 @pytest.fixture
 def uploaded_image(client):
@@ -44,3 +35,40 @@ def test_slice_defaults(client, uploaded_image):
     assert resp.status_code == 200
     # The response content type should be image/png
     assert resp.content_type == 'image/png'
+
+
+@pytest.fixture
+def tiff_data():
+    """A small uint8 5D image uploaded by uploaded_tiff (see conftest.py)."""
+    import numpy as np
+    return np.arange(2 * 1 * 2 * 8 * 8, dtype=np.uint8).reshape(2, 1, 2, 8, 8)
+
+
+def test_slice_etag_conditional_get(client, uploaded_tiff, monkeypatch):
+    """
+    A repeated request with If-None-Match should return 304
+    without extracting the slice again.
+    """
+    from src.api.routes import slice as slice_module
+
+    image_id, _ = uploaded_tiff
+    url = f'/slice?image_id={image_id}&z=1&channel=1'
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert resp.content_type == 'image/png'
+    etag = resp.headers['ETag']
+    assert not etag.startswith('W/')
+    assert 'Cache-Control' in resp.headers
+
+    def fail(*args, **kwargs):
+        raise AssertionError("pixel data was accessed")
+    monkeypatch.setattr(slice_module, 'get_image_processor', fail)
+
+    resp = client.get(url, headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.headers['ETag'] == etag
+
+    # Without If-None-Match the encoded slice comes from the cache
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] == etag
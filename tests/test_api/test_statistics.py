@@ -5,15 +5,6 @@ Tests for the GET /statistics endpoint.
 
 import pytest
 from io import BytesIO
-from src.api.app import create_app
-
-@pytest.fixture
-def client():
-    app = create_app()
-    app.testing = True
-    with app.test_client() as client:
-        yield client
-
 
 @pytest.fixture
 def uploaded_image(client):
@@ -47,3 +38,65 @@ def test_statistics_success(client, uploaded_image):
     # Usually these are lists of floats per channel, so let's check that they're lists
     assert isinstance(resp.json['mean'], list)
     assert isinstance(resp.json['std'], list)
+
+
+@pytest.fixture
+def tiff_data():
+    """A small uint16 5D image uploaded by uploaded_tiff (see conftest.py)."""
+    import numpy as np
+    return np.random.default_rng(0).integers(0, 1000, size=(2, 3, 2, 8, 8), dtype=np.uint16)
+
+
+def test_statistics_from_database(client, uploaded_tiff, monkeypatch):
+    """
+    /statistics should be answered from the statistics stored at ingest,
+    without touching pixels, including filtered queries.
+    """
+    from src.core.image_processor import ImageProcessor
+
+    image_id, data = uploaded_tiff
+
+    def fail(*args, **kwargs):
+        raise AssertionError("pixels were read")
+    monkeypatch.setattr(ImageProcessor, "iter_blocks", fail)
+    monkeypatch.setattr(ImageProcessor, "get_plane_statistics", fail)
+
+    resp = client.get(f'/statistics?image_id={image_id}')
+    assert resp.status_code == 200
+    assert resp.json['mean'] == pytest.approx(data.mean(axis=(0, 1, 3, 4)).tolist())
+    assert resp.json['std'] == pytest.approx(data.std(axis=(0, 1, 3, 4)).tolist())
+    assert resp.json['global']['max'] == data.max()
+
+    resp = client.get(f'/statistics?image_id={image_id}&time=1&channel=1')
+    assert resp.status_code == 200
+    assert resp.json['per_channel'][0]['channel'] == 1
+    assert resp.json['mean'] == pytest.approx([data[:, 1, 1].mean()])
+    assert resp.json['std'] == pytest.approx([data[:, 1, 1].std()])
+    assert resp.json['planes'] == 2
+
+    resp = client.get(f'/statistics?image_id={image_id}&time=7')
+    assert resp.status_code == 400
+
+
+def test_statistics_without_database(client, uploaded_tiff, monkeypatch):
+    """
+    With the database unreachable, /statistics is computed from the pixels
+    instead of failing.
+    """
+    from sqlalchemy.exc import OperationalError
+    from src.db import database
+
+    image_id, data = uploaded_tiff
+
+    def unreachable(*args, **kwargs):
+        raise OperationalError("connect", {}, Exception("connection refused"))
+    monkeypatch.setattr(database, 'SessionLocal', unreachable)
+
+    resp = client.get(f'/statistics?image_id={image_id}')
+    assert resp.status_code == 200
+    assert resp.json['mean'] == pytest.approx(data.mean(axis=(0, 1, 3, 4)).tolist())
+
+    resp = client.get(f'/statistics?image_id={image_id}&time=1&channel=1')
+    assert resp.status_code == 200
+    assert resp.json['mean'] == pytest.approx([data[:, 1, 1].mean()])
+    assert resp.json['planes'] == 2
@@ -0,0 +1,138 @@
+"""
+test_task_backends.py
+Tests for the local task backends and the async forms of /analyze and /objects.
+"""
+
+import pytest
+import numpy as np
+from io import BytesIO
+from src.tasks.backends import LocalBackend, get_task_backend
+
+@pytest.fixture
+def tiff_data():
+    """A bright cube in channel 0 of a uint16 5D image, and noise in channel 1."""
+    data = np.full((4, 2, 2, 16, 16), 100, dtype=np.uint16)
+    data[1:3, :, 0, 4:8, 5:9] = 1000
+    data[..., 1, :, :] = np.random.default_rng(0).integers(0, 50, size=(4, 2, 16, 16))
+    return data
+
+
+@pytest.mark.parametrize('kind', ['thread', 'process'])
+def test_local_backend(kind):
+    """Local pools run registered tasks by name and report them like Celery would."""
+    backend = LocalBackend(kind, max_workers=1)
+    try:
+        task_id = backend.submit('measure_objects', 'no_such_image')
+        assert backend.result(task_id, timeout=120) == {"error": "Image 'no_such_image' not found"}
+        assert backend.status(task_id) == 'succeeded'
+
+        # run_job raises KeyError for an unknown job
+        failed = backend.submit('run_job', '0' * 32, task_id='failing')
+        assert failed == 'failing'
+        with pytest.raises(KeyError):
+            backend.result(failed, timeout=120)
+        assert backend.status(failed) == 'failed'
+
+        assert backend.status('unknown') == 'pending'
+        with pytest.raises(KeyError):
+            backend.result('unknown')
+        with pytest.raises(ValueError):
+            backend.submit('no_such_task')
+    finally:
+        backend.shutdown()
+
+
+def test_local_backend_forgets_old_tasks():
+    backend = LocalBackend('thread', max_workers=1, history=2)
+    try:
+        task_ids = [backend.submit('measure_objects', 'no_such_image') for _ in range(4)]
+        backend.result(task_ids[-1], timeout=30)
+        backend.submit('measure_objects', 'no_such_image')
+        with pytest.raises(KeyError):
+            backend.result(task_ids[0])
+    finally:
+        backend.shutdown()
+
+
+def test_get_task_backend():
+    assert get_task_backend('thread') is get_task_backend('thread')
+    assert get_task_backend('celery').name == 'celery'
+    with pytest.raises(ValueError):
+        get_task_backend('redis')
+
+
+@pytest.mark.parametrize('client', ['thread'], indirect=True)
+def test_async_analyze(client, uploaded_tiff):
+    """With async, /analyze answers 202 at once and PCA runs as a job."""
+    image_id, _ = uploaded_tiff
+    resp = client.post('/analyze', json={"image_id": image_id, "components": 2, "async": True})
+    assert resp.status_code == 202
+    job_id = resp.json['job_id']
+    assert resp.json['kind'] == 'pca'
+    assert resp.headers['Location'] == f'/jobs/{job_id}'
+
+    assert get_task_backend().result(job_id, timeout=60)["status"] == 'succeeded'
+    job = client.get(f'/jobs/{job_id}').json
+    assert job['results']['pca_result']['shape'] == [4, 2, 16, 16, 2]
+
+    expected = client.post('/analyze', json={"image_id": image_id, "components": 2})
+    result = client.get(job['results']['pca_result']['url'])
+    np.testing.assert_allclose(np.load(BytesIO(result.data)),
+                               np.load(BytesIO(expected.data)), rtol=1e-5, atol=1e-5)
+
+
+@pytest.mark.parametrize('client', ['thread'], indirect=True)
+def test_async_objects(client, uploaded_tiff):
+    """With async=1, /objects measures the objects in a job, one result per column."""
+    image_id, _ = uploaded_tiff
+    query = f'/objects?image_id={image_id}&channel=0&time=1'
+    resp = client.get(query + '&async=1')
+    assert resp.status_code == 202
+    job_id = resp.json['job_id']
+    assert resp.json['params'] == {"time": 1, "channel": 0, "method": "otsu",
+                                   "across_time": False, "connectivity": 1}
+
+    assert get_task_backend().result(job_id, timeout=60)["status"] == 'succeeded'
+    expected = client.get(query).json
+    for name in ('label', 'volume', 'centroid', 'bbox', 'mean_intensity', 'axes'):
+        resp = client.get(f'/jobs/{job_id}/results/{name}?format=json')
+        assert resp.json['data'] == expected[name]
+
+    resp = client.get(f'/objects?image_id={image_id}&method=watershed&async=1')
+    assert resp.status_code == 400
+
+
+@pytest.mark.parametrize('client', ['thread'], indirect=True)
+def test_large_requests_run_as_jobs(client, uploaded_tiff, monkeypatch):
+    """Above JOB_AUTO_ASYNC_BYTES, /analyze and /objects queue a job unless told not to."""
+    from src.api.routes import jobs
+    image_id, _ = uploaded_tiff
+    # Channel 0 over Z at one time is 4 * 16 * 16 uint16 pixels, the image 4 times that
+    monkeypatch.setattr(jobs, 'JOB_AUTO_ASYNC_BYTES', 4 * 16 * 16 * 2)
+
+    resp = client.post('/analyze', json={"image_id": image_id, "components": 2})
+    assert resp.status_code == 202
+    assert get_task_backend().result(resp.json['job_id'], timeout=60)["status"] == 'succeeded'
+    assert client.post('/analyze', json={"image_id": image_id, "components": 2,
+                                         "async": False}).status_code == 200
+    assert client.post('/analyze?async=0', json={"image_id": image_id,
+                                                 "components": 2}).status_code == 200
+    # async is a strict boolean: "false" is false, anything unknown is an error
+    assert client.post('/analyze', json={"image_id": image_id, "components": 2,
+                                         "async": "false"}).status_code == 200
+    assert client.post('/analyze?async=false', json={"image_id": image_id,
+                                                     "components": 2}).status_code == 200
+    assert client.post('/analyze', json={"image_id": image_id, "components": 2,
+                                         "async": "no"}).status_code == 400
+
+    query = f'/objects?image_id={image_id}&channel=0&time=1'
+    assert client.get(query).status_code == 200
+    resp = client.get(query + '&across_time=1')
+    assert resp.status_code == 202
+    assert get_task_backend().result(resp.json['job_id'], timeout=60)["status"] == 'succeeded'
+    assert client.get(query + '&across_time=1&async=0').status_code == 200
+    assert client.get(query + '&across_time=1&async=false').status_code == 200
+    assert client.get(query + '&async=maybe').status_code == 400
+
+    monkeypatch.setattr(jobs, 'JOB_AUTO_ASYNC_BYTES', 0)
+    assert client.post('/analyze', json={"image_id": image_id, "components": 2}).status_code == 200
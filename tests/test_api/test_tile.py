@@ -0,0 +1,91 @@
+"""
+test_tile.py
+Tests for the GET /pyramid and GET /tile endpoints.
+"""
+
+import pytest
+import numpy as np
+from io import BytesIO
+from PIL import Image
+
+@pytest.fixture
+def tiff_data():
+    """One channel of 600 x 300 planes, large enough for a three-level pyramid."""
+    return np.random.randint(0, 255, size=(2, 1, 1, 600, 300), dtype=np.uint8)
+
+
+def test_tile_no_image(client):
+    """
+    GET /tile with invalid image_id should return 404.
+    """
+    resp = client.get('/tile?image_id=non_existent')
+    assert resp.status_code == 404
+
+
+def test_pyramid_levels(client, uploaded_tiff):
+    """
+    GET /pyramid returns the level shapes built at upload.
+    """
+    image_id, _ = uploaded_tiff
+    resp = client.get(f'/pyramid?image_id={image_id}')
+    assert resp.status_code == 200
+    assert resp.json['levels'] == [[600, 300], [300, 150], [150, 75]]
+
+
+def test_tile_sizes(client, uploaded_tiff):
+    """
+    Tiles are at most tile_size square; edge tiles are cropped.
+    """
+    image_id, _ = uploaded_tiff
+    resp = client.get(f'/tile?image_id={image_id}&z=1&level=0&x=1&y=2')
+    assert resp.status_code == 200
+    assert resp.content_type == 'image/png'
+    assert Image.open(BytesIO(resp.data)).size == (44, 88)  # (width, height)
+
+    resp = client.get(f'/tile?image_id={image_id}&level=2&x=0&y=0')
+    assert Image.open(BytesIO(resp.data)).size == (75, 150)
+
+    resp = client.get(f'/tile?image_id={image_id}&level=3')
+    assert resp.status_code == 400
+
+
+def test_concurrent_pyramid_requests_build_once(client, uploaded_tiff, monkeypatch):
+    """
+    Concurrent requests for an image without a pyramid wait for one build.
+    """
+    import shutil
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from src.api.routes import get_pyramid_dir
+    from src.api.routes import tile
+
+    image_id, _ = uploaded_tiff
+    shutil.rmtree(get_pyramid_dir(image_id))
+
+    builds = []
+    release = threading.Event()
+    original = tile.build_pyramid
+
+    def build(*args):
+        builds.append(1)
+        release.wait(10)
+        return original(*args)
+
+    monkeypatch.setattr(tile, 'build_pyramid', build)
+    app = client.application
+
+    def fetch():
+        with app.test_client() as other:
+            return other.get(f'/pyramid?image_id={image_id}')
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = [pool.submit(fetch) for _ in range(4)]
+        while not builds:
+            threading.Event().wait(0.01)
+        threading.Event().wait(0.1)
+        release.set()
+        responses = [response.result() for response in responses]
+
+    assert len(builds) == 1
+    assert all(response.status_code == 200 for response in responses)
+    assert responses[0].json['levels'] == [[600, 300], [300, 150], [150, 75]]
@@ -4,19 +4,8 @@ Tests for the POST /upload endpoint.
 """
 
 import pytest
+import numpy as np
 from io import BytesIO
-from src.api.app import create_app
-
-
-@pytest.fixture
-def client():
-    """
-    Fixture to create a Flask test client.
-    """
-    app = create_app()
-    app.testing = True
-    with app.test_client() as client:
-        yield client
 
 
 def test_upload_no_file(client):
@@ -42,7 +31,7 @@ def test_upload_empty_filename(client):
 
 def test_upload_success(client):
     """
-    Valid file upload should return 200 with an 'image_id'.
+    Valid file upload should return 202 with an 'image_id' and its ingest job.
     """
     # Create a dummy TIFF file in memory (just bytes - for example)
     tiff_bytes = b"II*\x00FakeTIFFData"  # Minimal placeholder, not a real 5D TIFF
@@ -51,6 +40,186 @@ def test_upload_success(client):
         'file': (BytesIO(tiff_bytes), 'test_image.tif')
     }
     response = client.post('/upload', data=data, content_type='multipart/form-data')
-    assert response.status_code == 200
+    assert response.status_code == 202
     assert 'image_id' in response.json
     assert response.json['message'] == "File uploaded successfully"
+    job = response.json['job']
+    assert job['kind'] == 'ingest' and job['image_id'] == response.json['image_id']
+    assert response.headers['Location'] == f"/jobs/{job['job_id']}"
+
+
+def test_upload_spools_to_disk(client):
+    """
+    The upload should be streamed to disk, with IMAGE_STORE holding
+    only the path of the spooled file rather than the raw bytes.
+    """
+    import os
+    from src.api.routes import IMAGE_STORE
+
+    tiff_bytes = b"II*\x00" + bytes(range(256)) * 64
+    data = {
+        'file': (BytesIO(tiff_bytes), 'test_image.tif')
+    }
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 202
+
+    stored = IMAGE_STORE[response.json['image_id']]
+    assert isinstance(stored, str)
+    assert os.path.exists(stored)
+    with open(stored, 'rb') as f:
+        assert f.read() == tiff_bytes
+
+
+def test_upload_is_visible_to_other_processes(client, wait_for_job):
+    """
+    A real upload should be registered in the spool directory and its
+    pixels published by its ingest job, so a store opened elsewhere (e.g. in a Celery
+    worker) maps the same decoded data.
+    """
+    import os
+    import numpy as np
+    import tifffile
+    from src.api.routes import IMAGE_STORE, IMAGE_SPOOL_DIR, IMAGE_PROCESSOR_STORE
+    from src.core.image_store import SharedImageStore
+
+    image = np.arange(2 * 2 * 3 * 8 * 8, dtype=np.uint16).reshape(2, 2, 3, 8, 8)
+    buf = BytesIO()
+    tifffile.imwrite(buf, image, photometric='minisblack', compression='zlib')
+    buf.seek(0)
+    response = client.post('/upload', data={'file': (buf, 'real_image.tif')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 202
+    image_id = response.json['image_id']
+    assert wait_for_job(response.json['job']['job_id'])['status'] == 'succeeded'
+    assert os.path.exists(IMAGE_STORE.decoded_path(image_id))
+
+    worker_store = SharedImageStore(IMAGE_SPOOL_DIR)
+    assert worker_store[image_id] == IMAGE_STORE[image_id]
+    np.testing.assert_array_equal(worker_store.open_array(image_id), image)
+
+    IMAGE_STORE.pop(image_id)
+    IMAGE_PROCESSOR_STORE.pop(image_id)
+    assert image_id not in worker_store
+
+
+def test_concurrent_first_accesses_share_one_open(client, uploaded_tiff, monkeypatch):
+    """
+    Concurrent requests for an image that is not cached yet should wait for
+    a single open, which /cache-stats reports as coalesced loads.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from src.api.routes import IMAGE_STORE, IMAGE_PROCESSOR_STORE, get_image_processor
+
+    image_id, _ = uploaded_tiff
+    IMAGE_PROCESSOR_STORE.pop(image_id)
+
+    opens = []
+    opened = threading.Event()
+    open_processor = IMAGE_STORE.open_processor
+
+    def slow_open(image_id):
+        opens.append(image_id)
+        opened.wait(10)
+        return open_processor(image_id)
+
+    monkeypatch.setattr(IMAGE_STORE, 'open_processor', slow_open)
+    before = client.get('/cache-stats').json["image_processors"]["coalesced_loads"]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(get_image_processor, image_id) for _ in range(4)]
+        while IMAGE_PROCESSOR_STORE.stats()["coalesced_loads"] < before + 3:
+            threading.Event().wait(0.01)
+        opened.set()
+        processors = [future.result() for future in futures]
+
+    assert opens == [image_id]
+    assert all(processor is processors[0] for processor in processors)
+    stats = client.get('/cache-stats').json
+    assert stats["image_processors"]["coalesced_loads"] == before + 3
+    assert set(stats) == {"image_processors", "slices", "histograms", "projections", "pyramids"}
+
+
+def test_upload_and_startup_without_database(client, monkeypatch, wait_for_job):
+    """
+    With the database unreachable the API still starts, and uploads succeed
+    (only their ingest job fails) instead of failing with a 500.
+    """
+    import numpy as np
+    import tifffile
+    from sqlalchemy.exc import OperationalError
+    from src.api import app as app_module
+    from src.api.routes import IMAGE_STORE, IMAGE_PROCESSOR_STORE
+    from src.db import database
+
+    def unreachable(*args, **kwargs):
+        raise OperationalError("connect", {}, Exception("connection refused"))
+
+    monkeypatch.setattr(app_module, 'init_db', unreachable)
+    assert app_module.create_app() is not None
+
+    monkeypatch.setattr(database, 'SessionLocal', unreachable)
+    buf = BytesIO()
+    tifffile.imwrite(buf, np.zeros((2, 1, 1, 8, 8), dtype=np.uint16), photometric='minisblack')
+    buf.seek(0)
+    response = client.post('/upload', data={'file': (buf, 'real_image.tif')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 202
+    job = wait_for_job(response.json['job']['job_id'])
+    assert job['status'] == 'failed' and 'connection refused' in job['error']
+    image_id = response.json['image_id']
+    assert client.get(f'/slice?image_id={image_id}&z=1').status_code == 200
+
+    IMAGE_STORE.pop(image_id)
+    IMAGE_PROCESSOR_STORE.pop(image_id)
+
+
+def test_ingest_job_reopens_the_published_pixels(client, uploaded_tiff):
+    """
+    An ingest job drops the image's cached processor before publishing, so
+    the next open maps the published pixels instead of the replaced ones.
+    """
+    from src.api.routes import IMAGE_PROCESSOR_STORE, get_image_processor
+    from src.api.routes.upload import publish_and_ingest
+
+    image_id, data = uploaded_tiff
+    before = get_image_processor(image_id)
+    steps = []
+    publish_and_ingest(image_id, progress=lambda done, total: steps.append((done, total)))
+    assert steps == [(1, 2), (2, 2)]
+    after = get_image_processor(image_id)
+    assert after is not before
+    np.testing.assert_array_equal(after.image_data, data)
+
+
+@pytest.mark.parametrize('client', ['thread'], indirect=True)
+def test_upload_does_not_wait_for_its_ingest(client, monkeypatch, wait_for_job):
+    """The upload answers while its ingest job is still running on the task backend."""
+    import threading
+    import tifffile
+    from src.api.routes import IMAGE_STORE, IMAGE_PROCESSOR_STORE
+    from src.api.routes import upload
+
+    release = threading.Event()
+    publish_and_ingest = upload.publish_and_ingest
+
+    def slow(image_id, progress=None):
+        release.wait(10)
+        publish_and_ingest(image_id, progress)
+
+    monkeypatch.setattr('src.tasks.async_tasks.publish_and_ingest', slow)
+    buf = BytesIO()
+    tifffile.imwrite(buf, np.ones((2, 1, 1, 8, 8), dtype=np.uint16), photometric='minisblack')
+    buf.seek(0)
+    response = client.post('/upload', data={'file': (buf, 'real_image.tif')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 202
+    job_id = response.json['job']['job_id']
+    assert client.get(f'/jobs/{job_id}').json['status'] in ('pending', 'running')
+
+    release.set()
+    assert wait_for_job(job_id)['status'] == 'succeeded'
+    assert client.get(f'/jobs/{job_id}').json['progress'] == {"done": 2, "total": 2,
+                                                              "fraction": 1.0}
+    image_id = response.json['image_id']
+    IMAGE_STORE.pop(image_id)
+    IMAGE_PROCESSOR_STORE.pop(image_id)
@@ -0,0 +1,139 @@
+"""
+test_cache.py
+Tests the byte-budgeted LRUCache in src/utils/cache.py
+"""
+
+import pytest
+import numpy as np
+from src.utils.cache import LRUCache
+
+
+def test_lru_eviction_by_bytes():
+    """
+    Inserting past the byte budget should evict least recently used entries.
+    """
+    cache = LRUCache(max_bytes=300)
+    cache.put("a", np.zeros(100, dtype=np.uint8))
+    cache.put("b", np.zeros(100, dtype=np.uint8))
+    cache.put("c", np.zeros(100, dtype=np.uint8))
+
+    # Touch "a" so that "b" becomes the least recently used entry
+    assert cache.get("a") is not None
+    cache.put("d", np.zeros(100, dtype=np.uint8))
+
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache and "d" in cache
+    assert cache.current_bytes == 300
+    assert cache.stats()["evictions"] == 1
+
+
+def test_hit_miss_counters():
+    """
+    get() should count hits and misses; oversized values are not cached.
+    """
+    cache = LRUCache(max_bytes=10, sizeof=len)
+    cache.put("small", b"12345")
+    cache.put("large", b"x" * 11)
+
+    assert cache.get("small") == b"12345"
+    assert cache.get("large") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_get_or_load_coalesces_concurrent_misses():
+    """
+    Concurrent misses on one key should run a single load and share its
+    value; the waiting callers are counted as coalesced loads.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    cache = LRUCache(max_bytes=1000)
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def load():
+        calls.append(1)
+        started.set()
+        release.wait(10)
+        return np.zeros(10, dtype=np.uint8)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        first = pool.submit(cache.get_or_load, "a", load)
+        started.wait(10)
+        waiters = [pool.submit(cache.get_or_load, "a", load) for _ in range(7)]
+        while cache.stats()["coalesced_loads"] < 7:
+            threading.Event().wait(0.01)
+        release.set()
+        values = [first.result()] + [waiter.result() for waiter in waiters]
+
+    assert len(calls) == 1
+    assert all(value is values[0] for value in values)
+    assert cache.get_or_load("a", load) is values[0]
+    stats = cache.stats()
+    assert stats["loads"] == 1 and stats["coalesced_loads"] == 7 and stats["hits"] == 1
+
+
+def test_get_or_load_errors_and_pop():
+    """
+    A failed load raises in its caller and is not cached; popping a key
+    while it loads still returns the value but does not cache it.
+    """
+    cache = LRUCache(max_bytes=1000)
+
+    def fail():
+        raise ValueError("cannot decode")
+
+    with pytest.raises(ValueError, match="cannot decode"):
+        cache.get_or_load("a", fail)
+    assert "a" not in cache
+
+    def load_then_pop():
+        cache.pop("b")
+        return np.zeros(10, dtype=np.uint8)
+
+    assert cache.get_or_load("b", load_then_pop).nbytes == 10
+    assert "b" not in cache
+    assert cache.get_or_load("b", lambda: np.ones(10, dtype=np.uint8))[0] == 1
+    assert "b" in cache
+
+
+def test_on_evict_releases_dropped_values():
+    """
+    on_evict should see every value the cache drops on its own (evicted,
+    replaced or cleared, or loaded after its key was invalidated), but
+    not values the caller pops.
+    """
+    released = []
+    cache = LRUCache(max_bytes=20, sizeof=len, on_evict=released.append)
+    cache.put("a", b"a" * 10)
+    cache.put("b", b"b" * 10)
+    cache.put("c", b"c" * 10)  # evicts "a"
+    assert released == [b"a" * 10]
+
+    cache.put("b", b"B" * 10)  # replaces "b"
+    assert released[-1] == b"b" * 10
+
+    assert cache.pop("c") == b"c" * 10
+    assert len(released) == 2
+
+    cache.get_or_load("d", lambda: b"d" * 5)
+    cache.clear()
+    assert sorted(released[2:]) == [b"B" * 10, b"d" * 5]
+
+    # Loads invalidated while in flight are returned, but released as never cached
+    def load_then_pop():
+        cache.pop("e")
+        return b"e" * 5
+
+    def load_then_clear():
+        cache.clear()
+        return b"f" * 5
+
+    assert cache.get_or_load("e", load_then_pop) == b"e" * 5
+    assert cache.get_or_load("f", load_then_clear) == b"f" * 5
+    assert released[-2:] == [b"e" * 5, b"f" * 5] and len(cache) == 0
@@ -116,3 +116,156 @@ def test_get_statistics(fake_tiff_bytes):
     num_channels = processor.image_data.shape[2]
     for key in ["mean", "std", "min", "max"]:
         assert len(stats[key]) == num_channels
+
+
+@pytest.fixture(params=[None, 'zlib'], ids=['uncompressed', 'zlib'])
+def fake_tiff_path(request, tmp_path, fake_5d_data):
+    """
+    Writes fake_5d_data to a TIFF file on disk, both uncompressed
+    (memory-mappable) and compressed (page-by-page access).
+    """
+    from tifffile import imwrite
+
+    path = tmp_path / "fake_5d.tif"
+    imwrite(path, fake_5d_data, compression=request.param)
+    return str(path)
+
+
+def test_lazy_mode_matches_eager(fake_tiff_path, fake_5d_data):
+    """
+    A lazily opened processor should expose the same data as an eager one
+    without decoding it up front.
+    """
+    processor = ImageProcessor(fake_tiff_path, lazy=True)
+    assert processor.is_lazy
+    assert processor.image_data.shape == fake_5d_data.shape
+    assert processor.get_metadata()["dtype"] == str(fake_5d_data.dtype)
+    np.testing.assert_array_equal(processor.get_slice(1, 0, 1), fake_5d_data[1, 0, 1])
+    np.testing.assert_array_equal(np.asarray(processor.image_data), fake_5d_data)
+    processor.close()
+
+
+def test_private_nbytes(fake_tiff_bytes, fake_tiff_path, fake_5d_data, tmp_path):
+    """
+    Only pixels a processor decoded itself count as private memory, not
+    lazily read, memory-mapped or borrowed pixels.
+    """
+    assert ImageProcessor(fake_tiff_bytes).private_nbytes == fake_5d_data.nbytes
+    assert ImageProcessor(fake_5d_data).private_nbytes == fake_5d_data.nbytes
+
+    lazy = ImageProcessor(fake_tiff_path, lazy=True)
+    assert lazy.private_nbytes == 0
+    lazy.close()
+
+    np.save(tmp_path / "decoded.npy", fake_5d_data)
+    mapped = np.load(tmp_path / "decoded.npy", mmap_mode='r')
+    assert ImageProcessor(mapped).private_nbytes == 0
+    assert ImageProcessor(np.asarray(mapped)).private_nbytes == 0
+
+
+def test_lazy_get_slice_decodes_single_page(tmp_path, fake_5d_data, monkeypatch):
+    """
+    On compressed data, get_slice should decode only the page holding
+    the requested (z, t, c) plane.
+    """
+    from tifffile import imwrite
+    from src.core.tiff_reader import TiffPageArray
+
+    path = tmp_path / "fake_5d_zlib.tif"
+    imwrite(path, fake_5d_data, compression='zlib')
+    processor = ImageProcessor(str(path), lazy=True)
+
+    pages_read = []
+    original = TiffPageArray.read_page
+    monkeypatch.setattr(
+        TiffPageArray, "read_page",
+        lambda self, i: pages_read.append(i) or original(self, i)
+    )
+
+    slice_2d = processor.get_slice(z=1, t=0, c=1)
+    np.testing.assert_array_equal(slice_2d, fake_5d_data[1, 0, 1])
+    assert len(pages_read) == 1
+    processor.close()
+
+
+def test_run_pca_chunked_matches_full():
+    """
+    The out-of-core (chunked) PCA should agree with the in-memory fit,
+    up to the sign of each component, and can write to a memmap.
+    """
+    import io
+    import tempfile
+    import os
+    from tifffile import imwrite
+
+    rng = np.random.default_rng(0)
+    base = rng.normal(size=(3, 2, 1, 16, 16))
+    data = np.concatenate([base, 2 * base, rng.normal(size=(3, 2, 1, 16, 16))], axis=2)
+    buf = io.BytesIO()
+    imwrite(buf, data.astype(np.float32), photometric='minisblack')
+    processor = ImageProcessor(buf.getvalue())
+
+    full = processor.run_pca(n_components=2)
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, "pca.npy")
+        chunked = processor.run_pca(n_components=2, chunked=True, out_path=out_path)
+        assert isinstance(chunked, np.memmap)
+        assert chunked.shape == (3, 2, 16, 16, 2)
+        for k in range(2):
+            corr = np.corrcoef(full[..., k].ravel(), chunked[..., k].ravel())[0, 1]
+            assert abs(corr) > 0.999
+        del chunked
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_segment_stack_parallel(fake_tiff_bytes, executor):
+    """
+    segment_stack on a pool gives the same masks as serial segment_3d.
+    """
+    from src.core.segmentation import segment_3d
+
+    processor = ImageProcessor(fake_tiff_bytes)
+    stack = processor.get_stack('z', t=0, c=1)
+    assert stack.shape == processor.image_data[:, 0, 1].shape
+
+    masks = processor.segment_stack('z', t=0, c=1, workers=2, executor=executor, chunk_size=1)
+    np.testing.assert_array_equal(masks, segment_3d(stack))
+
+    with pytest.raises(ValueError):
+        processor.get_stack('x')
+
+
+def test_measure_objects_lazily_by_chunk(tmp_path, monkeypatch):
+    """
+    On a compressed image, objects are labelled and measured a chunk of
+    planes at a time, with the same result as an in-memory image.
+    """
+    from tifffile import imwrite
+    from src.core import objects
+    from src.core.tiff_reader import TiffPageArray
+
+    # More Z planes than fit in one chunk, with an object across the boundary
+    depth = objects.OBJECTS_CHUNK_PLANES + 4
+    data = np.full((depth, 2, 2, 12, 12), 10, dtype=np.uint16)
+    data[depth // 2 - 6:depth - 1, :, 0, 2:6, 3:9] = 500
+    data[..., 1, :, :] = np.random.default_rng(0).integers(0, 50, size=(depth, 2, 12, 12))
+    path = tmp_path / "objects_zlib.tif"
+    imwrite(path, data, compression='zlib')
+
+    reads = []
+    original = TiffPageArray.__getitem__
+    monkeypatch.setattr(TiffPageArray, "__getitem__",
+                        lambda self, key: reads.append(key) or original(self, key))
+
+    lazy = ImageProcessor(str(path), lazy=True)
+    measured, axes = lazy.measure_objects(t=1, c=0, across_time=True)
+    lazy.close()
+    expected, _ = ImageProcessor(data).measure_objects(t=1, c=0, across_time=True)
+
+    assert axes == 'ZTYX'
+    assert len(reads) > 2
+    assert all(key[0].stop - key[0].start <= objects.OBJECTS_CHUNK_PLANES for key in reads)
+    assert measured["label"].tolist() == [1]
+    assert measured.keys() == expected.keys()
+    for name in expected:
+        np.testing.assert_allclose(measured[name], expected[name])
@@ -0,0 +1,160 @@
+"""
+test_image_store.py
+Tests the process-shared image store in src/core/image_store.py
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import pytest
+import numpy as np
+from multiprocessing import shared_memory
+from src.core.image_processor import ImageProcessor
+from src.core.image_store import SharedImageStore
+
+
+def _open_in_other_process(root_dir, image_id):
+    """Opens image_id from a fresh store, as a worker process would."""
+    data = SharedImageStore(root_dir).open_array(image_id)
+    return data.sum(dtype=np.int64), isinstance(data, np.memmap)
+
+
+@pytest.fixture
+def compressed_upload(tmp_path):
+    from tifffile import imwrite
+
+    data = np.random.default_rng(0).integers(0, 4096, size=(2, 3, 2, 8, 8), dtype=np.uint16)
+    path = tmp_path / "image_1.tif"
+    imwrite(path, data, photometric='minisblack', compression='zlib')
+    return str(path), data
+
+
+def test_registry_is_shared_between_store_instances(tmp_path):
+    """
+    Registrations live on disk, so a second store over the same directory
+    (e.g. in a Celery worker) sees them, and allocated ids never collide.
+    """
+    store, other = SharedImageStore(str(tmp_path)), SharedImageStore(str(tmp_path))
+    first = store.allocate_id()
+    second = other.allocate_id()
+    assert (first, second) == ('image_1', 'image_2')
+    assert first not in other
+
+    store[first] = str(tmp_path / "a.tif")
+    assert first in other and other[first] == str(tmp_path / "a.tif")
+    assert list(other) == [first]
+    assert other.pop(first) == str(tmp_path / "a.tif")
+    assert first not in store
+    assert store.pop(first, None) is None
+    with pytest.raises(KeyError):
+        store[first]
+    # A dropped id is never allocated again
+    assert store.allocate_id() == 'image_3'
+
+
+def test_publish_decodes_once_and_shares(compressed_upload, tmp_path):
+    """
+    A compressed upload is decoded into an .npy copy and a shared segment;
+    another process maps the shared pixels, and pop() unlinks them.
+    """
+    path, data = compressed_upload
+    store = SharedImageStore(str(tmp_path), shared_max_bytes=data.nbytes)
+    store['image_1'] = path
+    processor = ImageProcessor(path, lazy=True)
+    assert not isinstance(processor.image_data, np.memmap)
+
+    assert store.publish('image_1', processor) == {"decoded": True, "shared": True}
+    processor.close()
+    np.testing.assert_array_equal(np.load(store.decoded_path('image_1')), data)
+
+    shared = store.open_processor('image_1')
+    np.testing.assert_array_equal(shared.image_data, data)
+    assert not shared.image_data.flags.writeable
+    assert shared.private_nbytes == 0
+    assert tuple(shared.get_metadata()['shape']) == data.shape
+
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        total, from_disk = pool.submit(_open_in_other_process, str(tmp_path), 'image_1').result()
+    assert total == data.sum(dtype=np.int64) and not from_disk
+
+    name = store._read_manifest('image_1')['shared']['name']
+    store.pop('image_1')
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+    # Views opened before pop() stay valid
+    np.testing.assert_array_equal(shared.image_data, data)
+
+
+def test_publish_over_budget_falls_back_to_disk(compressed_upload, tmp_path):
+    """Pixels over the shared memory budget are only published as the .npy copy."""
+    path, data = compressed_upload
+    store = SharedImageStore(str(tmp_path), shared_max_bytes=data.nbytes - 1)
+    store['image_1'] = path
+    assert store.publish('image_1', ImageProcessor(path, lazy=True)) == \
+        {"decoded": True, "shared": False}
+
+    opened = store.open_array('image_1')
+    assert isinstance(opened, np.memmap)
+    np.testing.assert_array_equal(opened, data)
+
+    store['image_1'] = path  # re-registering drops the stale copy
+    assert store.open_array('image_1') is None
+
+
+def test_publisher_keeps_tracking_its_segments(compressed_upload, tmp_path):
+    """
+    Opening an image in the process that published it must not drop the
+    resource tracker's registration: the segment is still unlinked when
+    that process exits, instead of leaking.
+    """
+    import os
+    import subprocess
+    import sys
+    import time
+
+    path, data = compressed_upload
+    script = (
+        "import sys\n"
+        "from src.core.image_processor import ImageProcessor\n"
+        "from src.core.image_store import SharedImageStore\n"
+        "store = SharedImageStore(sys.argv[1], shared_max_bytes=1 << 20)\n"
+        "store['image_1'] = sys.argv[2]\n"
+        "store.publish('image_1', ImageProcessor(sys.argv[2], lazy=True))\n"
+        "assert store.open_array('image_1').sum() >= 0\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    subprocess.run([sys.executable, '-c', script, str(tmp_path), path], cwd=root, check=True)
+
+    name = SharedImageStore(str(tmp_path))._read_manifest('image_1')['shared']['name']
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            shared_memory.SharedMemory(name=name).close()
+        except FileNotFoundError:
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail("shared segment outlived the process that published it")
+
+    # The dead segment is cleared from the registration on the next open
+    store = SharedImageStore(str(tmp_path))
+    opened = store.open_array('image_1')
+    assert isinstance(opened, np.memmap)
+    np.testing.assert_array_equal(opened, data)
+    assert 'shared' not in store._read_manifest('image_1')
+    assert store._shared_bytes() == 0
+
+
+def test_publish_evicts_oldest_segments(compressed_upload, tmp_path):
+    """A new image that does not fit in the budget evicts the oldest segments."""
+    path, data = compressed_upload
+    store = SharedImageStore(str(tmp_path), shared_max_bytes=data.nbytes)
+    for image_id in ('image_1', 'image_2'):
+        store[image_id] = path
+        assert store.publish(image_id, ImageProcessor(path, lazy=True))["shared"]
+
+    assert 'shared' not in store._read_manifest('image_1')
+    assert store._shared_bytes() == data.nbytes
+    assert isinstance(store.open_array('image_1'), np.memmap)
+    assert not isinstance(store.open_array('image_2'), np.memmap)
+    store.pop('image_1')
+    store.pop('image_2')
@@ -0,0 +1,176 @@
+"""
+test_job_store.py
+Tests the on-disk job store and job runner in src/core/jobs.py
+"""
+
+import io
+import pytest
+import numpy as np
+from src.core.image_processor import ImageProcessor
+from src.core.jobs import JobStore, run_job, validate_job_params
+from src.core.pca_cache import PCAModelStore
+
+
+@pytest.fixture
+def processor():
+    from tifffile import imwrite
+
+    data = np.random.default_rng(0).integers(0, 255, size=(4, 2, 3, 8, 8), dtype=np.uint8)
+    buf = io.BytesIO()
+    imwrite(buf, data, photometric='minisblack')
+    return ImageProcessor(buf.getvalue())
+
+
+def test_run_job_reports_progress_and_saves_results(processor, tmp_path):
+    """Every chunk is reported, and results are readable arrays on disk."""
+    store = JobStore(str(tmp_path / "jobs"))
+    job = store.create('projection', 'img', {"projection": "max", "axis": "z", "channel": 1})
+    seen = []
+    original = store.update
+    store.update = lambda job_id, **fields: seen.append(fields.get("progress")) or \
+        original(job_id, **fields)
+
+    done = run_job(store, job["job_id"], lambda image_id: processor)
+    assert done["status"] == 'succeeded'
+    assert [p for p in seen if p] == [{"done": i, "total": 4} for i in range(1, 5)]
+    assert done["results"]["projection"] == {"shape": [8, 8], "dtype": "|u1"}
+    np.testing.assert_array_equal(store.load_result(job["job_id"], "projection"),
+                                  processor.image_data[:, 0, 1].max(axis=0))
+
+    pca = store.create('pca', 'img', {"n_components": 2})
+    done = run_job(store, pca["job_id"], lambda image_id: processor,
+                   PCAModelStore(str(tmp_path)))
+    assert done["status"] == 'succeeded'
+    assert done["progress"] == {"done": 16, "total": 16}  # fit, then project 8 blocks
+    assert store.load_result(pca["job_id"], "pca_result").shape == (4, 2, 8, 8, 2)
+
+
+def test_cancel_stops_running_job_after_chunk(processor, tmp_path):
+    """A cancel request is honoured at the next chunk; pending jobs never run."""
+    store = JobStore(str(tmp_path))
+    job = store.create('statistics', 'img')
+
+    def cancel_midway(image_id):
+        store.cancel(job["job_id"])
+        return processor
+
+    done = run_job(store, job["job_id"], cancel_midway)
+    assert done["status"] == 'cancelled' and done["results"] == {}
+    assert done["progress"]["done"] == 0
+
+    pending = store.create('statistics', 'img')
+    assert store.cancel(pending["job_id"])["status"] == 'cancelled'
+    assert run_job(store, pending["job_id"], lambda image_id: processor)["status"] == 'cancelled'
+    assert store.get("../etc") is None
+
+
+def test_failed_job_and_param_validation(tmp_path):
+    store = JobStore(str(tmp_path))
+    job = store.create('segmentation', 'img')
+
+    def missing(image_id):
+        raise KeyError(image_id)
+
+    done = run_job(store, job["job_id"], missing)
+    assert done["status"] == 'failed' and 'img' in done["error"]
+
+    assert validate_job_params('segmentation', {"z": "2", "method": "kmeans"}) == \
+        {"z": 2, "method": "kmeans"}
+    for kind, params in [('nope', {}), ('pca', {"n_components": 0}),
+                         ('projection', {"projection": "median"}), ('statistics', {"z": 1})]:
+        with pytest.raises(ValueError):
+            validate_job_params(kind, params)
+
+    # Booleans are parsed strictly: "false" is not True
+    for value, expected in [("false", False), ("0", False), (0, False), ("TRUE", True), (1, True)]:
+        assert validate_job_params('objects', {"across_time": value}) == {"across_time": expected}
+    for value in ("no", 2, 1.0, None):
+        with pytest.raises(ValueError):
+            validate_job_params('pca', {"chunked": value})
+
+
+def test_cancel_never_races_with_start(tmp_path):
+    """A job cancelled while it starts either runs (and is told to stop) or never runs."""
+    import threading
+
+    store = JobStore(str(tmp_path))
+    for _ in range(20):
+        job_id = store.create('statistics', 'img')["job_id"]
+        barrier = threading.Barrier(2)
+        outcome = {}
+
+        def start():
+            barrier.wait()
+            outcome["started"] = store.start(job_id)[1]
+
+        def cancel():
+            barrier.wait()
+            outcome["cancelled"] = store.cancel(job_id)["status"] == 'cancelled'
+
+        threads = [threading.Thread(target=start), threading.Thread(target=cancel)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        job = store.get(job_id)
+        assert job["cancel_requested"]
+        assert outcome["started"] != outcome["cancelled"]
+        assert job["status"] == ('running' if outcome["started"] else 'cancelled')
+
+
+def test_objects_job_reports_chunks_and_cancels(tmp_path):
+    """Objects jobs report every chunk of planes, labelled then measured, and stop when cancelled."""
+    from tifffile import imwrite
+    from src.core.objects import OBJECTS_CHUNK_PLANES
+
+    depth = OBJECTS_CHUNK_PLANES + 4
+    data = np.full((depth, 1, 1, 8, 8), 10, dtype=np.uint8)
+    data[:, :, :, 2:6, 2:6] = 200
+    buf = io.BytesIO()
+    imwrite(buf, data, photometric='minisblack')
+    processor = ImageProcessor(buf.getvalue())
+
+    store = JobStore(str(tmp_path))
+    job = store.create('objects', 'img')
+    seen = []
+    original = store.update
+    store.update = lambda job_id, **fields: seen.append(fields.get("progress")) or \
+        original(job_id, **fields)
+    done = run_job(store, job["job_id"], lambda image_id: processor)
+    assert done["status"] == 'succeeded'
+    assert [p["done"] for p in seen if p] == [OBJECTS_CHUNK_PLANES, depth,
+                                              depth + OBJECTS_CHUNK_PLANES, 2 * depth]
+    np.testing.assert_array_equal(store.load_result(job["job_id"], "volume"),
+                                  processor.measure_objects()[0]["volume"])
+
+    job = store.create('objects', 'img')
+    store.update = lambda job_id, **fields: (fields.get("progress") and store.cancel(job_id)) \
+        or original(job_id, **fields)
+    assert run_job(store, job["job_id"], lambda image_id: processor)["status"] == 'cancelled'
+
+
+def test_purge_expired_jobs(tmp_path, monkeypatch):
+    """Finished jobs older than the ttl are deleted when jobs are created; others stay."""
+    import time
+    from src.core import jobs
+
+    store = JobStore(str(tmp_path), ttl=3600)
+    old = store.create('statistics', 'img')
+    store.update(old["job_id"], status='succeeded', finished=time.time() - 7200)
+    running = store.create('statistics', 'img')
+    store.update(running["job_id"], status='running', started=time.time() - 7200)
+    recent = store.create('statistics', 'img')
+    store.cancel(recent["job_id"])
+
+    assert store.purge_expired() == [old["job_id"]]
+    assert store.get(old["job_id"]) is None
+    assert store.get(running["job_id"]) is not None and store.get(recent["job_id"]) is not None
+    assert store.purge_expired(max_age=0) == [recent["job_id"]]
+
+    # create() sweeps again once JOB_PURGE_INTERVAL has passed
+    store.update(running["job_id"], status='failed', finished=time.time() - 7200)
+    store.create('statistics', 'img')
+    assert store.get(running["job_id"]) is not None
+    monkeypatch.setattr(jobs, 'JOB_PURGE_INTERVAL', 0)
+    store.create('statistics', 'img')
+    assert store.get(running["job_id"]) is None
@@ -0,0 +1,87 @@
+"""
+test_pca_cache.py
+Tests the PCA model/result cache in src/core/pca_cache.py
+"""
+
+import io
+import pytest
+import numpy as np
+from src.core.image_processor import ImageProcessor
+from src.core.pca_cache import PCAModelStore, run_cached_pca
+
+
+@pytest.fixture
+def processor():
+    from tifffile import imwrite
+
+    data = np.random.default_rng(0).normal(size=(2, 3, 4, 8, 8)).astype(np.float32)
+    buf = io.BytesIO()
+    imwrite(buf, data, photometric='minisblack')
+    return ImageProcessor(buf.getvalue())
+
+
+def test_repeat_request_skips_fit(processor, tmp_path, monkeypatch):
+    """
+    A second request for the same image and k should not refit,
+    and a smaller k should be served from the cached model.
+    """
+    store = PCAModelStore(str(tmp_path))
+    fits = []
+    original = ImageProcessor.fit_pca
+    monkeypatch.setattr(
+        ImageProcessor, "fit_pca",
+        lambda self, *args, **kwargs: fits.append(args) or original(self, *args, **kwargs)
+    )
+
+    result_3, model_3 = run_cached_pca(processor, "img", store, n_components=3)
+    again, _ = run_cached_pca(processor, "img", store, n_components=3)
+    result_2, model_2 = run_cached_pca(processor, "img", store, n_components=2)
+
+    assert len(fits) == 1
+    np.testing.assert_array_equal(again, result_3)
+    np.testing.assert_allclose(result_2, result_3[..., :2], rtol=1e-6)
+    np.testing.assert_array_equal(model_2.components_, model_3.components_[:2])
+    np.testing.assert_allclose(result_3, processor.run_pca(3), rtol=1e-5, atol=1e-5)
+
+
+def test_models_persist_on_disk(processor, tmp_path):
+    """
+    A new store over the same directory should load the persisted model.
+    """
+    _, model = run_cached_pca(processor, "img", PCAModelStore(str(tmp_path)), n_components=2)
+
+    fresh = PCAModelStore(str(tmp_path))
+    cached = fresh.get_model("img", "covariance", 1)
+    assert cached is not None
+    np.testing.assert_array_equal(cached.components_, model.components_[:1])
+
+    fresh.clear("img")
+    assert fresh.get_model("img", "covariance", 1) is None
+
+
+def test_cache_budgets(processor, tmp_path):
+    """
+    Models beyond max_models leave memory (but reload from disk), and the
+    least recently used projections are evicted beyond max_projection_bytes.
+    """
+    import time
+
+    # Each (2, 3, 8, 8, 3) float32 projection takes about 4.7 kB: two fit
+    store = PCAModelStore(str(tmp_path), max_projection_bytes=10000, max_models=1)
+    first, _ = run_cached_pca(processor, "a", store, n_components=3)
+    time.sleep(0.05)  # file times order the projections by use
+    run_cached_pca(processor, "b", store, n_components=3)
+    assert len(store._models) == 1
+    assert store.get_model("a", "covariance", 3) is not None
+
+    time.sleep(0.05)
+    run_cached_pca(processor, "a", store, n_components=3)  # "a" is now the most recent
+    time.sleep(0.05)
+    run_cached_pca(processor, "c", store, n_components=3)
+    assert store.load_projection("b", "covariance", 3) is None
+    np.testing.assert_array_equal(store.load_projection("a", "covariance", 3), first)
+    assert store.load_projection("c", "covariance", 3) is not None
+
+    # An evicted projection is simply computed again
+    result, _ = run_cached_pca(processor, "b", store, n_components=3)
+    np.testing.assert_array_equal(result, first)
@@ -36,3 +36,72 @@ def test_flatten_5d_for_pca():
     # but let's see exactly what the function returns
     Z, T, H, W, C = orig_shape
     assert (Z, T, H, W, C) == (2, 1, 4, 4, 3)
+
+
+def test_covariance_pca_matches_sklearn():
+    """
+    The covariance engine should reproduce sklearn's components (including
+    signs), explained variance ratio and projection, also when fed in chunks.
+    """
+    from sklearn.decomposition import PCA
+    from src.utils.pca_utils import CovariancePCA
+
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(5000, 4)) @ rng.normal(size=(4, 4)) + 500.0
+
+    expected = PCA(n_components=3, svd_solver='full').fit(data)
+    engine = CovariancePCA(n_components=3)
+    for chunk in np.array_split(data, 7):
+        engine.partial_fit(chunk)
+
+    np.testing.assert_allclose(engine.components_, expected.components_, atol=1e-10)
+    np.testing.assert_allclose(engine.explained_variance_ratio_,
+                               expected.explained_variance_ratio_, atol=1e-12)
+    np.testing.assert_allclose(engine.mean_, expected.mean_)
+    np.testing.assert_allclose(engine.transform(data), expected.transform(data), atol=1e-8)
+
+
+def test_covariance_pca_merges_partials():
+    """
+    Partials accumulated separately (each with its own shift) and sent as
+    dicts should merge into the same model as a single pass.
+    """
+    from src.utils.pca_utils import CovariancePCA
+
+    rng = np.random.default_rng(1)
+    data = rng.normal(size=(3000, 3)) * [1.0, 5.0, 0.2] + [1e4, -20.0, 3.0]
+    single = CovariancePCA(n_components=2).fit(data)
+
+    partials = [CovariancePCA().partial_fit(chunk).to_dict()
+                for chunk in np.array_split(data, 5)]
+    merged = CovariancePCA.from_dict(partials[0], n_components=2)
+    for partial in partials[1:]:
+        merged.merge(CovariancePCA.from_dict(partial))
+
+    assert merged.n_samples_seen_ == len(data)
+    np.testing.assert_allclose(merged.components_, single.components_, atol=1e-10)
+    np.testing.assert_allclose(merged.explained_variance_, single.explained_variance_)
+    np.testing.assert_allclose(merged.mean_, single.mean_)
+
+
+def test_covariance_pca_chunks_smaller_than_n_components():
+    """
+    Chunks (or partials) with fewer rows than n_components are accumulated;
+    the model is only checked and computed once its attributes are read.
+    """
+    from src.utils.pca_utils import CovariancePCA
+
+    rng = np.random.default_rng(2)
+    data = rng.normal(size=(40, 4))
+    single = CovariancePCA(n_components=3).fit(data)
+
+    engine = CovariancePCA(n_components=3).partial_fit(data[:2])
+    with pytest.raises(ValueError, match="n_components=3"):
+        engine.components_
+    engine.partial_fit(data[2:])
+    np.testing.assert_allclose(engine.components_, single.components_, atol=1e-12)
+
+    merged = CovariancePCA.from_dict(CovariancePCA().partial_fit(data[:1]).to_dict(),
+                                     n_components=3)
+    merged.merge(CovariancePCA().partial_fit(data[1:]))
+    np.testing.assert_allclose(merged.explained_variance_, single.explained_variance_)
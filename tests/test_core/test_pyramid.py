@@ -0,0 +1,82 @@
+"""
+test_pyramid.py
+Tests the tile pyramid helpers in src/core/pyramid.py
+"""
+
+import pytest
+import numpy as np
+from src.core.image_processor import ImageProcessor
+from src.core.pyramid import (
+    downsample_block_mean, pyramid_level_shapes, build_pyramid, read_tile
+)
+
+
+def test_downsample_block_mean():
+    """
+    Each output pixel should be the mean of a 2x2 block; odd edges replicate.
+    """
+    plane = np.arange(20, dtype=np.float32).reshape(4, 5)
+    reduced = downsample_block_mean(plane)
+    assert reduced.shape == (2, 3)
+    assert reduced[0, 0] == np.mean([0, 1, 5, 6])
+    assert reduced[1, 2] == np.mean([14, 14, 19, 19])
+    assert reduced.dtype == plane.dtype
+
+
+def test_pyramid_level_shapes():
+    """
+    Levels halve (rounding up) until the plane fits in one tile.
+    """
+    assert pyramid_level_shapes(1000, 600, tile_size=256) == [
+        (1000, 600), (500, 300), (250, 150)
+    ]
+    assert pyramid_level_shapes(100, 100, tile_size=256) == [(100, 100)]
+
+
+def test_build_and_read_tiles(tmp_path):
+    """
+    Tiles from every level should match the downsampled planes.
+    """
+    import tifffile
+
+    data = np.random.randint(0, 255, size=(2, 1, 2, 40, 24), dtype=np.uint8)
+    path = tmp_path / "image.tif"
+    tifffile.imwrite(path, data, photometric='minisblack')
+    processor = ImageProcessor(str(path), lazy=True)
+
+    pyramid_dir = str(tmp_path / "pyramid")
+    manifest = build_pyramid(processor, pyramid_dir, tile_size=16)
+    assert manifest["levels"] == [[40, 24], [20, 12], [10, 6]]
+
+    np.testing.assert_array_equal(
+        read_tile(processor, pyramid_dir, 1, 0, 1, 0, 1, 2), data[1, 0, 1, 32:40, 16:24]
+    )
+    level_1 = downsample_block_mean(data[1, 0, 1])
+    np.testing.assert_array_equal(
+        read_tile(processor, pyramid_dir, 1, 0, 1, 1, 0, 1), level_1[16:20, 0:12]
+    )
+
+
+def test_level_0_tiles_of_compressed_images(tmp_path, monkeypatch):
+    """
+    For an image decoded page by page, level 0 is stored with the pyramid,
+    so full-resolution tiles are read without decoding their plane.
+    """
+    import tifffile
+    from src.core.tiff_reader import TiffPageArray
+
+    data = np.random.randint(0, 255, size=(2, 1, 2, 40, 24), dtype=np.uint8)
+    path = tmp_path / "image.tif"
+    tifffile.imwrite(path, data, photometric='minisblack', compression='zlib')
+    processor = ImageProcessor(str(path), lazy=True)
+    assert isinstance(processor.image_data, TiffPageArray)
+
+    pyramid_dir = str(tmp_path / "pyramid")
+    assert build_pyramid(processor, pyramid_dir, tile_size=16)["level0_stored"]
+
+    monkeypatch.setattr(TiffPageArray, "read_page",
+                        lambda self, i: pytest.fail("decoded a page for a tile"))
+    np.testing.assert_array_equal(
+        read_tile(processor, pyramid_dir, 1, 0, 1, 0, 1, 2), data[1, 0, 1, 32:40, 16:24]
+    )
+    processor.close()
@@ -116,3 +116,99 @@ def test_get_statistics(fake_tiff_bytes):
     num_channels = processor.image_data.shape[2]
     for key in ["mean", "std", "min", "max"]:
         assert len(stats[key]) == num_channels
+
+
+@pytest.mark.parametrize("dtype", ["uint8", "uint16", "int16", "float32", "float64"])
+def test_batch_otsu_matches_per_slice(dtype):
+    """
+    Batched Otsu thresholds and masks should be identical to threshold_otsu
+    applied slice by slice, including single-valued slices.
+    """
+    from skimage.filters import threshold_otsu
+    from src.core.segmentation import batch_otsu_masks, batch_otsu_threshold, otsu_threshold
+
+    rng = np.random.default_rng(0)
+    volume = rng.normal(300, 40, size=(7, 12, 10))
+    volume[:, ::3, ::3] += 1500
+    volume = np.clip(volume, 0, None).astype(dtype)
+    volume[2] = volume[2, 0, 0]
+
+    expected = np.array([threshold_otsu(s) for s in volume])
+    for batch_pixels in (1, 250, 1 << 17):
+        np.testing.assert_array_equal(batch_otsu_threshold(volume, batch_pixels=batch_pixels),
+                                      expected)
+
+    masks = batch_otsu_masks(volume)
+    assert masks.dtype == np.uint8
+    np.testing.assert_array_equal(masks, np.stack([otsu_threshold(s) for s in volume]))
+
+
+def test_segment_3d_otsu_uses_batch():
+    """
+    segment_3d with method='otsu' returns the batched masks.
+    """
+    from src.core.segmentation import batch_otsu_masks, segment_3d
+
+    volume = np.random.default_rng(1).integers(0, 4096, size=(4, 8, 8), dtype=np.uint16)
+    np.testing.assert_array_equal(segment_3d(volume), batch_otsu_masks(volume))
+
+
+def test_kmeans_histogram_is_lloyd_fixed_point():
+    """
+    Histogram-domain k-means on an integer image: labels are ordered by
+    centroid, each pixel is labelled with its nearest centroid, and each
+    centroid is the mean of its pixels.
+    """
+    from src.core.segmentation import kmeans_segmentation
+
+    rng = np.random.default_rng(0)
+    image = rng.normal(300, 40, size=(64, 64))
+    image[::4, ::4] += 1500
+    image[10:30, 10:30] += 700
+    image = np.clip(image, 0, None).astype(np.uint16)
+
+    labels, centers = kmeans_segmentation(image, n_clusters=3, return_centers=True)
+    assert labels.shape == image.shape
+    assert np.all(np.diff(centers) > 0)
+    nearest = np.argmin(np.abs(image[..., None] - centers), axis=-1)
+    np.testing.assert_array_equal(labels, nearest)
+    for k in range(3):
+        assert centers[k] == pytest.approx(image[labels == k].mean())
+
+
+def test_optimal_centers_match_brute_force():
+    """
+    The dynamic-programming seed is the globally optimal 1D partition.
+    """
+    from itertools import combinations
+    from src.core.segmentation import _optimal_centers
+
+    values = np.array([1, 2, 4, 9, 10, 11, 30, 31, 60])
+    counts = np.array([5, 1, 3, 8, 2, 2, 1, 9, 4])
+
+    def cost(edges):
+        total = 0.0
+        for a, b in zip(edges[:-1], edges[1:]):
+            mean = np.average(values[a:b], weights=counts[a:b])
+            total += np.sum(counts[a:b] * (values[a:b] - mean) ** 2)
+        return total
+
+    best = min(cost([0, *cuts, len(values)]) for cuts in combinations(range(1, len(values)), 2))
+    centers = _optimal_centers(values, counts, 3)
+    labels = np.argmin(np.abs(values[:, None] - centers), axis=1)
+    edges = [0, *np.flatnonzero(np.diff(labels)) + 1, len(values)]
+    assert cost(edges) == pytest.approx(best)
+
+
+def test_segment_3d_kmeans_warm_start():
+    """
+    segment_3d(method='kmeans') carries centroids between slices, so similar
+    slices get the same labelling.
+    """
+    from src.core.segmentation import kmeans_segmentation, segment_3d
+
+    image = np.random.default_rng(2).integers(0, 1000, size=(16, 16), dtype=np.uint16)
+    volume = np.stack([image, image + 1, image + 2])
+    labels = segment_3d(volume, method='kmeans', n_clusters=3)
+    for i in range(3):
+        np.testing.assert_array_equal(labels[i], kmeans_segmentation(volume[i], n_clusters=3))
@@ -0,0 +1,68 @@
+"""
+test_stats_utils.py
+Tests the mergeable per-channel statistics in src/utils/stats_utils.py
+"""
+
+import numpy as np
+import pytest
+from src.utils.stats_utils import ChannelHistogram, ChannelStats, format_statistics, reduce_blocks
+
+
+@pytest.fixture
+def blocks():
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 4096, size=(3, 16, 20), dtype=np.uint16) for _ in range(6)]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_reduce_blocks_matches_numpy(blocks, workers):
+    """
+    Statistics merged from chunked partials should match numpy over the whole stack.
+    """
+    stats = reduce_blocks(iter(blocks), n_channels=3, workers=workers)
+    data = np.stack(blocks).astype(np.float64)  # (N, C, H, W)
+    per_channel = np.moveaxis(data, 1, 0).reshape(3, -1)
+
+    np.testing.assert_allclose(stats.mean, per_channel.mean(axis=1))
+    np.testing.assert_allclose(stats.std, per_channel.std(axis=1))
+    np.testing.assert_array_equal(stats.min, per_channel.min(axis=1))
+    np.testing.assert_array_equal(stats.max, per_channel.max(axis=1))
+
+    result = format_statistics(stats)
+    assert len(result["mean"]) == 3
+    assert result["global"]["mean"] == pytest.approx(data.mean())
+    assert result["global"]["std"] == pytest.approx(data.std())
+    assert result["global"]["min"] == data.min()
+
+
+def test_small_chunks_and_round_trip(blocks):
+    """
+    Splitting a block into many chunks, and serializing partials, should not change the result.
+    """
+    whole = ChannelStats.from_block(blocks[0])
+    chunked = ChannelStats.from_block(blocks[0], chunk_pixels=7)
+    np.testing.assert_allclose(chunked.mean, whole.mean)
+    np.testing.assert_allclose(chunked.m2, whole.m2)
+
+    restored = ChannelStats.from_dict(whole.to_dict())
+    np.testing.assert_array_equal(restored.count, whole.count)
+    np.testing.assert_array_equal(restored.m2, whole.m2)
+
+
+def test_float_histogram_percentiles():
+    """
+    Percentiles of a binned float histogram should be close to numpy's,
+    and rebinning should preserve the counts.
+    """
+    values = np.random.default_rng(1).normal(size=(2, 10000)).astype(np.float32)
+    histogram = ChannelHistogram.for_range(2, values.dtype, values.min(), values.max())
+    assert not histogram.exact
+    histogram.add_block(values, chunk_pixels=3000)
+
+    expected = np.percentile(values, [1, 50, 99], axis=1).T
+    np.testing.assert_allclose(histogram.percentiles([1, 50, 99]), expected,
+                               atol=2 * histogram.width)
+
+    edges, counts = histogram.rebin(100)
+    assert edges.shape == (101,)
+    np.testing.assert_array_equal(counts.sum(axis=1), [10000, 10000])
@@ -3,26 +3,24 @@ test_database.py
 Tests for database connectivity and basic CRUD operations.
 """
 
-import os
 import pytest
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
-from src.db.database import Base, engine, SessionLocal
+from src.db.database import Base, DATABASE_URL, engine, SessionLocal
 from src.db.models import ImageMetadata
 
 @pytest.fixture(scope='module')
 def test_db_setup():
     """
     A fixture that:
-      1) Ensures the Vercel Postgres URL is set.
+      1) Ensures a database URL is set (conftest points it at a session SQLite file).
       2) Creates all tables in the test database.
       3) Yields a session factory for tests.
       4) Optionally tears down tables at the end (if desired).
     """
     # 1) Check env var
-    db_url = os.environ.get("VERCEL_POSTGRES_URL")
-    if not db_url:
-        raise RuntimeError("VERCEL_POSTGRES_URL is not set. Cannot run DB tests.")
+    if not DATABASE_URL:
+        raise RuntimeError("No database URL is set. Cannot run DB tests.")
 
     # 2) Create tables. If using migrations in production, 
     #    you might run them or create a temporary schema for testing.